@@ -0,0 +1,225 @@
+"""Home feed reads and post writes with fan-out on write and fan-out on read.
+
+Seeds a scratch SQLite file with a synthetic follower graph: ``--users``
+users each follow ``--follows`` others picked with a Zipf distribution, so a
+few authors have most of the followers, and ``--posts`` posts by random
+authors. The timeline table is filled the way ``trail.feed`` fills it.
+
+Reads compare the ``GET /feed`` query, a range scan of the timeline with
+the posts of authors above FEED_FANOUT_MAX_FOLLOWERS merged in, against
+fan-out on read, the newest posts of everyone the user follows. Writes
+compare inserting a post alone against inserting it and fanning it out.
+
+    python -m benchmarks.feed --users 10000 --follows 50 --posts 20000
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("ENV_STATE", "test")
+
+import sqlalchemy  # noqa: E402
+from databases import Database  # noqa: E402
+from sqlalchemy.dialects import sqlite  # noqa: E402
+from sqlalchemy.schema import CreateIndex, CreateTable  # noqa: E402
+
+from trail import feed  # noqa: E402
+from trail.config import config  # noqa: E402
+from trail.database import follow_table, metadata, post_table  # noqa: E402
+from trail.routers.post import select_like_query  # noqa: E402
+
+PAGE_SIZE = 20
+
+
+def seed(
+    connection: sqlite3.Connection, users: int, follows: int, posts: int
+) -> list[int]:
+    dialect = sqlite.dialect()
+    for table in metadata.sorted_tables:
+        connection.execute(str(CreateTable(table).compile(dialect=dialect)))
+        for index in table.indexes:
+            connection.execute(str(CreateIndex(index).compile(dialect=dialect)))
+
+    connection.executemany(
+        "INSERT INTO users (id, email, password, confirmed) VALUES (?, ?, '', 1)",
+        ((i, f"user{i}@example.com") for i in range(1, users + 1)),
+    )
+    cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, users + 1)))
+    ids = range(1, users + 1)
+    edges = {
+        (follower, followee)
+        for follower in ids
+        for followee in random.choices(ids, cum_weights=cum_weights, k=follows)
+        if followee != follower
+    }
+    connection.executemany(
+        "INSERT INTO follows (follower_id, followee_id, created_at) VALUES (?, ?, 0)",
+        edges,
+    )
+    connection.execute(
+        "UPDATE users SET follower_count = "
+        "(SELECT count(*) FROM follows WHERE followee_id = users.id)"
+    )
+    connection.executemany(
+        'INSERT INTO "POST" (id, body, user_id, created_at) VALUES (?, ?, ?, 0)',
+        ((i, f"post {i}", random.randint(1, users)) for i in range(1, posts + 1)),
+    )
+    # what fan_out_posts would have written for every post
+    connection.execute(
+        'INSERT INTO timeline (user_id, post_id) SELECT user_id, id FROM "POST"'
+    )
+    connection.execute(
+        "INSERT INTO timeline (user_id, post_id) "
+        'SELECT follows.follower_id, "POST".id FROM "POST" '
+        'JOIN users ON users.id = "POST".user_id '
+        'JOIN follows ON follows.followee_id = "POST".user_id '
+        "WHERE users.follower_count <= ?",
+        (config.FEED_FANOUT_MAX_FOLLOWERS,),
+    )
+    connection.execute("ANALYZE")
+    connection.commit()
+
+    counts = connection.execute(
+        "SELECT follower_count FROM users ORDER BY follower_count DESC"
+    ).fetchall()
+    return [count for (count,) in counts]
+
+
+def compile_sql(query) -> str:
+    return str(
+        query.compile(dialect=sqlite.dialect(), compile_kwargs={"literal_binds": True})
+    )
+
+
+def fanned_out_statements(connection: sqlite3.Connection, user_id: int) -> list:
+    unfanned_sql = compile_sql(feed.unfanned_followees_query(user_id))
+    unfanned = [row[0] for row in connection.execute(unfanned_sql)]
+    ids = feed.feed_post_ids(user_id, unfanned, PAGE_SIZE)
+    query = (
+        select_like_query.where(post_table.c.id.in_(ids))
+        .order_by(post_table.c.id.desc())
+        .limit(PAGE_SIZE)
+    )
+    return [unfanned_sql, compile_sql(query)]
+
+
+def on_read_statements(connection: sqlite3.Connection, user_id: int) -> list:
+    followees = sqlalchemy.select(follow_table.c.followee_id).where(
+        follow_table.c.follower_id == user_id
+    )
+    query = (
+        select_like_query.where(
+            sqlalchemy.or_(
+                post_table.c.user_id.in_(followees), post_table.c.user_id == user_id
+            )
+        )
+        .order_by(post_table.c.id.desc())
+        .limit(PAGE_SIZE)
+    )
+    return [compile_sql(query)]
+
+
+def read_feed(connection: sqlite3.Connection, statements: list) -> None:
+    for sql in statements:
+        connection.execute(sql).fetchall()
+
+
+async def write_post(database: Database, author_id: int, fan_out: bool) -> None:
+    async with database.transaction():
+        post_id = await database.execute(
+            post_table.insert().values(body="new post", user_id=author_id)
+        )
+        if fan_out:
+            await feed.fan_out_posts(database, author_id, [post_id])
+
+
+def summarize(label: str, timings: list[float]) -> None:
+    timings.sort()
+    p99 = timings[int(len(timings) * 0.99) - 1]
+    print(
+        f"  {label:<32} p50 {statistics.median(timings):8.3f} ms" f"  p99 {p99:8.3f} ms"
+    )
+
+
+def measure_reads(path: str, users: int, repeat: int) -> None:
+    # statements are compiled up front, the timings are SQLite's alone
+    connection = sqlite3.connect(path)
+    readers = [random.randint(1, users) for _ in range(repeat)]
+    print(f"feed read, {PAGE_SIZE} posts")
+    for label, build in (
+        ("fan-out on write (timeline)", fanned_out_statements),
+        ("fan-out on read (join)", on_read_statements),
+    ):
+        statements = [build(connection, user_id) for user_id in readers]
+        timings = []
+        for batch in statements:
+            start = time.perf_counter()
+            read_feed(connection, batch)
+            timings.append((time.perf_counter() - start) * 1000)
+        summarize(label, timings)
+    connection.close()
+
+
+async def measure_writes(path: str, users: int, repeat: int) -> None:
+    database = Database(f"sqlite:///{path}")
+    await database.connect()
+    # Zipf ranks follow the ids, so these are the most followed authors
+    authors = [random.randint(1, max(users // 100, 1)) for _ in range(repeat)]
+    print("post write through databases, authors in the top 1% by followers")
+    for label, fan_out in (
+        ("insert only (fan-out on read)", False),
+        ("insert and fan out", True),
+    ):
+        timings = []
+        for author_id in authors:
+            start = time.perf_counter()
+            await write_post(database, author_id, fan_out)
+            timings.append((time.perf_counter() - start) * 1000)
+        summarize(label, timings)
+    await database.disconnect()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--follows", type=int, default=50)
+    parser.add_argument("--posts", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument(
+        "--fanout-max-followers",
+        type=int,
+        default=config.FEED_FANOUT_MAX_FOLLOWERS,
+        help="authors with more followers are merged on read",
+    )
+    args = parser.parse_args()
+    config.FEED_FANOUT_MAX_FOLLOWERS = args.fanout_max_followers
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.db")
+        connection = sqlite3.connect(path)
+        start = time.perf_counter()
+        counts = seed(connection, args.users, args.follows, args.posts)
+        (timeline_rows,) = connection.execute(
+            "SELECT count(*) FROM timeline"
+        ).fetchone()
+        connection.close()
+
+        above = sum(count > args.fanout_max_followers for count in counts)
+        print(
+            f"seeded in {time.perf_counter() - start:.1f}s: {args.users} users, "
+            f"top follower counts {counts[:3]}, {above} merged on read, "
+            f"{timeline_rows} timeline rows"
+        )
+        measure_reads(path, args.users, args.repeat)
+        asyncio.run(measure_writes(path, args.users, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""Latency of ``GET /post`` with logging off, written inline and queued.
+
+Runs the app in-process over ``httpx.ASGITransport`` against a scratch SQLite
+database with the trail logger at DEBUG, where the compiled SQL of every request is
+logged too, and at INFO as in production. The console sink writes to /dev/null and the file sink to the
+scratch directory, ``--write-latency-ms`` makes every file write block as on
+a slow or contended disk.
+
+    python -m benchmarks.logging_load --requests 2000 --write-latency-ms 1
+"""
+
+import argparse
+import asyncio
+import contextlib
+import logging
+import os
+import statistics
+import tempfile
+import time
+from functools import partial
+
+directory = tempfile.mkdtemp()
+os.chdir(directory)
+os.environ.setdefault("ENV_STATE", "test")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{directory}/bench.db")
+os.environ.setdefault("DB_FORCE_ROLL_BACK", "false")
+
+import httpx  # noqa: E402
+
+from trail import logging_config  # noqa: E402
+from trail.database import database, post_table, user_table  # noqa: E402
+from trail.main import app  # noqa: E402
+from trail.migrations import migrate  # noqa: E402
+from trail.response_cache import response_cache  # noqa: E402
+
+LOGGERS = ["trail", "uvicorn"]
+
+
+class SlowStream:
+    """A log file on a slow disk, every write blocks for ``latency`` seconds."""
+
+    def __init__(self, stream, latency: float) -> None:
+        self.stream = stream
+        self.latency = latency
+
+    def write(self, data: str) -> None:
+        time.sleep(self.latency)
+        self.stream.write(data)
+
+    def flush(self) -> None:
+        self.stream.flush()
+
+    def close(self) -> None:
+        self.stream.close()
+
+
+def slow_down_file_sink(latency: float) -> None:
+    handler = logging._handlers.get("rotating_file")
+    if latency and handler is not None:
+        handler.stream = SlowStream(handler.stream, latency)
+
+
+def logging_off() -> None:
+    logging_config.stop_logging()
+    for name in LOGGERS:
+        logging.getLogger(name).handlers = []
+        logging.getLogger(name).setLevel(logging.CRITICAL)
+
+
+def logging_inline(level: int) -> None:
+    # the pipeline as it was, the sinks formatting and writing on the caller
+    logging_config.Config_logger()
+    handlers = logging._handlers
+    filters = handlers["queue"].filters
+    logging_config.stop_logging()
+    sinks = [handlers[name] for name in logging_config.SINK_HANDLERS]
+    for sink in sinks:
+        sink.filters = list(filters)
+    for name in LOGGERS:
+        logging.getLogger(name).handlers = sinks
+    logging.getLogger("trail").setLevel(level)
+
+
+def logging_queued(level: int) -> None:
+    logging_config.Config_logger()
+    logging.getLogger("trail").setLevel(level)
+
+
+async def measure(client: httpx.AsyncClient, requests: int) -> str:
+    timings = []
+    start = time.perf_counter()
+    for _ in range(requests):
+        # the cached response would skip the handler and its logging
+        response_cache.invalidate()
+        request_start = time.perf_counter()
+        await client.get("/post")
+        timings.append((time.perf_counter() - request_start) * 1000)
+    elapsed = time.perf_counter() - start
+
+    timings.sort()
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+    return (
+        f"  {requests / elapsed:8.1f} req/s"
+        f"  p50 {statistics.median(timings):7.3f} ms  p99 {p99:7.3f} ms"
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--write-latency-ms", type=float, default=0)
+    args = parser.parse_args()
+
+    await database.connect()
+    await migrate(database)
+    await database.execute(
+        user_table.insert().values(id=1, email="bench@example.com", password="")
+    )
+    await database.execute_many(
+        post_table.insert(), [{"body": f"post {i}", "user_id": 1} for i in range(50)]
+    )
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as ac:
+        for name, setup in (
+            ("logging off", logging_off),
+            ("inline handlers, DEBUG", partial(logging_inline, logging.DEBUG)),
+            ("queue handler, DEBUG", partial(logging_queued, logging.DEBUG)),
+            ("inline handlers, INFO", partial(logging_inline, logging.INFO)),
+            ("queue handler, INFO", partial(logging_queued, logging.INFO)),
+        ):
+            print(name)
+            with open(os.devnull, "w") as devnull:
+                with contextlib.redirect_stdout(devnull):
+                    setup()
+                    slow_down_file_sink(args.write_latency_ms / 1000)
+                    await measure(ac, args.requests // 10)
+                    result = await measure(ac, args.requests)
+                    # drains the queue while the console still goes nowhere
+                    logging_off()
+            print(result)
+
+    await database.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
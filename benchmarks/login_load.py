@@ -0,0 +1,111 @@
+"""Latency of an unrelated endpoint while /token is hammered.
+
+Runs the app in-process over ``httpx.ASGITransport`` against a scratch SQLite
+database. ``--concurrency`` clients log in back to back while a probe calls
+``GET /post`` and records its latency, once with bcrypt running inline on the
+event loop and once on the password hash pool.
+
+    python -m benchmarks.login_load --seconds 5 --concurrency 16
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+directory = tempfile.mkdtemp()
+os.environ.setdefault("ENV_STATE", "test")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{directory}/bench.db")
+os.environ.setdefault("DB_FORCE_ROLL_BACK", "false")
+os.environ.setdefault("BCRYPT_ROUNDS", "12")
+# the benchmark is the abusive client, the limiter would answer it 429
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+import httpx  # noqa: E402
+
+from trail import security  # noqa: E402
+from trail.database import database, user_table  # noqa: E402
+from trail.main import app  # noqa: E402
+from trail.migrations import migrate  # noqa: E402
+
+USER = {"email": "bench@example.com", "password": "1234"}
+
+
+async def run_inline(func, *args):
+    return func(*args)
+
+
+async def hammer_logins(client: httpx.AsyncClient, stop: asyncio.Event) -> int:
+    count = 0
+    while not stop.is_set():
+        await client.post("/token", json=USER)
+        count += 1
+    return count
+
+
+async def probe(client: httpx.AsyncClient, stop: asyncio.Event) -> list[float]:
+    timings = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        await client.get("/post")
+        timings.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(0.01)
+    return timings
+
+
+async def measure(client: httpx.AsyncClient, seconds: float, concurrency: int):
+    stop = asyncio.Event()
+    logins = [
+        asyncio.create_task(hammer_logins(client, stop)) for _ in range(concurrency)
+    ]
+    probe_task = asyncio.create_task(probe(client, stop))
+    await asyncio.sleep(seconds)
+    stop.set()
+    login_count = sum(await asyncio.gather(*logins))
+    timings = sorted(await probe_task)
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+    print(
+        f"  logins {login_count / seconds:8.1f}/s"
+        f"  GET /post p50 {statistics.median(timings):8.2f} ms"
+        f"  p99 {p99:8.2f} ms  ({len(timings)} probes)"
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    await database.connect()
+    await migrate(database)
+    password = security.get_password_hash(USER["password"])
+    await database.execute(
+        user_table.insert().values(
+            email=USER["email"], password=password, confirmed=True
+        )
+    )
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as ac:
+        pool_run = security.password_pool.run
+
+        print("bcrypt inline on the event loop")
+        security.password_pool.run = run_inline
+        await measure(ac, args.seconds, args.concurrency)
+
+        print(
+            f"bcrypt on a {security.password_pool.kind} pool "
+            f"of {security.password_pool.workers} workers"
+        )
+        security.password_pool.run = pool_run
+        await measure(ac, args.seconds, args.concurrency)
+
+    security.password_pool.shutdown()
+    await database.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
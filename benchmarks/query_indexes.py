@@ -0,0 +1,124 @@
+"""Query plans and latency of the hot lookups with and without the indexes.
+
+Seeds a scratch SQLite file with ``--rows`` likes and comments (1M by default),
+then runs the statements behind ``get_comments_on_posts``, the old likes join
+of ``select_like_query``, the ``post_like`` uniqueness check and the
+``most_likes`` page, first on bare tables and again after the indexes declared
+in ``trail.database`` are created.
+
+    python -m benchmarks.query_indexes --rows 1000000
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("ENV_STATE", "test")
+
+from sqlalchemy.dialects import sqlite  # noqa: E402
+from sqlalchemy.schema import CreateIndex, CreateTable  # noqa: E402
+
+from trail.database import metadata  # noqa: E402
+
+QUERIES = {
+    "comments of a post": 'SELECT * FROM "COMMENT" WHERE post_id = :post_id',
+    "likes join of a post": (
+        'SELECT "POST".id, count(likes.id) FROM "POST" '
+        'LEFT OUTER JOIN likes ON "POST".id = likes.post_id '
+        'WHERE "POST".id = :post_id GROUP BY "POST".id'
+    ),
+    "like of a user on a post": (
+        "SELECT id FROM likes WHERE post_id = :post_id AND user_id = :user_id"
+    ),
+    "likes of a user": "SELECT count(*) FROM likes WHERE user_id = :user_id",
+    "most_likes page": (
+        'SELECT id FROM "POST" WHERE like_count < :likes '
+        "OR (like_count = :likes AND id < :post_id) "
+        "ORDER BY like_count DESC, id DESC LIMIT 20"
+    ),
+}
+
+
+def seed(connection: sqlite3.Connection, rows: int, posts: int, users: int) -> None:
+    dialect = sqlite.dialect()
+    for table in metadata.sorted_tables:
+        connection.execute(str(CreateTable(table).compile(dialect=dialect)))
+
+    connection.executemany(
+        "INSERT INTO users (id, email, password, confirmed) VALUES (?, ?, '', 1)",
+        ((i, f"user{i}@example.com") for i in range(1, users + 1)),
+    )
+    connection.executemany(
+        'INSERT INTO "POST" (id, body, user_id, like_count) VALUES (?, ?, ?, ?)',
+        (
+            (i, f"post {i}", random.randint(1, users), random.randint(0, 500))
+            for i in range(1, posts + 1)
+        ),
+    )
+    # (post_id, user_id) pairs stay unique so the unique index can be built
+    connection.executemany(
+        "INSERT INTO likes (post_id, user_id) VALUES (?, ?)",
+        ((i % posts + 1, i // posts + 1) for i in range(rows)),
+    )
+    connection.executemany(
+        'INSERT INTO "COMMENT" (body, post_id, user_id) VALUES (?, ?, ?)',
+        (
+            ("comment", random.randint(1, posts), random.randint(1, users))
+            for _ in range(rows)
+        ),
+    )
+    connection.commit()
+
+
+def create_indexes(connection: sqlite3.Connection) -> None:
+    dialect = sqlite.dialect()
+    for table in metadata.sorted_tables:
+        for index in table.indexes:
+            connection.execute(str(CreateIndex(index).compile(dialect=dialect)))
+    connection.execute("ANALYZE")
+    connection.commit()
+
+
+def measure(connection: sqlite3.Connection, posts: int, repeat: int) -> None:
+    for name, sql in QUERIES.items():
+        params = {"post_id": posts // 2, "user_id": 1, "likes": 250}
+        plan = connection.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+        timings = []
+        for _ in range(repeat):
+            params["post_id"] = random.randint(1, posts)
+            start = time.perf_counter()
+            connection.execute(sql, params).fetchall()
+            timings.append((time.perf_counter() - start) * 1000)
+
+        print(f"  {name}: median {statistics.median(timings):.3f} ms")
+        for row in plan:
+            print(f"      {row[-1]}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--posts", type=int, default=100_000)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        connection = sqlite3.connect(os.path.join(directory, "bench.db"))
+        seed(connection, args.rows, args.posts, args.users)
+
+        print(f"without indexes ({args.rows} likes, {args.rows} comments)")
+        measure(connection, args.posts, args.repeat)
+
+        create_indexes(connection)
+        print("with indexes")
+        measure(connection, args.posts, args.repeat)
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
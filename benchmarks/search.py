@@ -0,0 +1,151 @@
+"""Latency of ``GET /search`` against the LIKE scan it replaces.
+
+Seeds a scratch SQLite file with ``--rows`` posts and as many comments (2M of
+each by default) drawn from a Zipf-like vocabulary, builds the FTS5 indexes
+with the statements of ``trail.migrations.v0006_search`` and times the first
+ranked page of ``trail.search.search_query`` for rare, common and prefix terms
+next to a ``body LIKE '%term%'`` scan of both tables.
+
+    python -m benchmarks.search --rows 2000000
+"""
+
+import argparse
+import bisect
+import itertools
+import os
+import random
+import sqlite3
+import statistics
+import string
+import tempfile
+import time
+
+os.environ.setdefault("ENV_STATE", "test")
+
+import sqlalchemy  # noqa: E402
+from sqlalchemy.dialects import sqlite  # noqa: E402
+from sqlalchemy.schema import CreateTable  # noqa: E402
+
+from trail.database import metadata  # noqa: E402
+from trail.migrations.v0006_search import SEARCH_DDL  # noqa: E402
+from trail.search import build_match_query, search_query  # noqa: E402
+
+random.seed(0)
+VOCABULARY = list(
+    dict.fromkeys(
+        "".join(random.choices(string.ascii_lowercase, k=random.randint(4, 10)))
+        for _ in range(50_000)
+    )
+)
+CUM_WEIGHTS = list(
+    itertools.accumulate(1 / (rank + 1) for rank in range(len(VOCABULARY)))
+)
+
+# the ranked page scores every match, so its cost grows with how common the
+# terms are while the LIKE scan reads every row whatever the term
+TERMS = {
+    "very common term": VOCABULARY[0],
+    "common term": VOCABULARY[100],
+    "rare term": VOCABULARY[40_000],
+    "prefix": VOCABULARY[5_000][:4],
+    "two terms": f"{VOCABULARY[10]} {VOCABULARY[500]}",
+}
+
+
+def text(words: int) -> str:
+    total = CUM_WEIGHTS[-1]
+    return " ".join(
+        VOCABULARY[bisect.bisect(CUM_WEIGHTS, random.random() * total)]
+        for _ in range(words)
+    )
+
+
+def seed(connection: sqlite3.Connection, rows: int) -> None:
+    dialect = sqlite.dialect()
+    for table in metadata.sorted_tables:
+        connection.execute(str(CreateTable(table).compile(dialect=dialect)))
+    connection.execute(
+        "INSERT INTO users (id, email, password, confirmed) "
+        "VALUES (1, 'user@example.com', '', 1)"
+    )
+    connection.executemany(
+        'INSERT INTO "POST" (id, body, user_id) VALUES (?, ?, 1)',
+        ((i, text(20)) for i in range(1, rows + 1)),
+    )
+    connection.executemany(
+        'INSERT INTO "COMMENT" (body, post_id, user_id) VALUES (?, ?, 1)',
+        ((text(10), random.randint(1, rows)) for _ in range(rows)),
+    )
+    connection.commit()
+
+
+def create_search_index(connection: sqlite3.Connection) -> float:
+    start = time.perf_counter()
+    for statement in SEARCH_DDL:
+        connection.execute(statement)
+    connection.execute("INSERT INTO post_fts (post_fts) VALUES ('rebuild')")
+    connection.execute("INSERT INTO comment_fts (comment_fts) VALUES ('rebuild')")
+    connection.commit()
+    return time.perf_counter() - start
+
+
+def search_sql(q: str) -> str:
+    hits = search_query(build_match_query(q))
+    query = (
+        sqlalchemy.select(hits)
+        .order_by(hits.c.rank, hits.c.kind_order, hits.c.id)
+        .limit(21)
+    )
+    return str(
+        query.compile(dialect=sqlite.dialect(), compile_kwargs={"literal_binds": True})
+    )
+
+
+POST, COMMENT = '"POST"', '"COMMENT"'
+
+
+def like_sql(q: str) -> str:
+    # ranked by occurrences of the term, the closest a LIKE query gets to
+    # relevance, which means reading and scoring every row
+    term = q.split()[0]
+    select = (
+        "SELECT id, body, length(body) - length(replace(body, '{term}', '')) "
+        "AS hits FROM {table} WHERE body LIKE '%{term}%'"
+    )
+    return (
+        f"{select.format(term=term, table=POST)} UNION ALL "
+        f"{select.format(term=term, table=COMMENT)} "
+        "ORDER BY hits DESC LIMIT 21"
+    )
+
+
+def time_query(connection: sqlite3.Connection, sql: str, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        connection.execute(sql).fetchall()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        connection = sqlite3.connect(os.path.join(directory, "bench.db"))
+        seed(connection, args.rows)
+        print(f"{args.rows} posts and {args.rows} comments")
+        print(f"index build: {create_search_index(connection):.1f} s")
+
+        for name, q in TERMS.items():
+            fts = time_query(connection, search_sql(q), args.repeat)
+            like = time_query(connection, like_sql(q), args.repeat)
+            print(f"  {name} ({q}): fts5 {fts:.3f} ms, LIKE scan {like:.3f} ms")
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Requests per second and CPU per request of the list endpoints, with the
+rows validated against their response_model and with trusted rows.
+
+Runs the app in-process over ``httpx.ASGITransport`` against a scratch SQLite
+database with the response cache disabled. Every endpoint is called back to
+back for ``--seconds`` with TRUSTED_ROW_SERIALIZATION off, then on. A first
+section times the serialization of one page alone, without the request.
+
+    python -m benchmarks.serialization --seconds 3 --limit 100
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+directory = tempfile.mkdtemp()
+os.environ.setdefault("ENV_STATE", "test")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{directory}/bench.db")
+os.environ.setdefault("DB_FORCE_ROLL_BACK", "false")
+os.environ.setdefault("RESPONSE_CACHE_MAX_SIZE", "0")
+
+import httpx  # noqa: E402
+import orjson  # noqa: E402
+from pydantic import TypeAdapter  # noqa: E402
+
+from trail.config import config  # noqa: E402
+from trail.database import (  # noqa: E402
+    comment_table,
+    database,
+    post_table,
+    user_table,
+)
+from trail.main import app  # noqa: E402
+from trail.migrations import migrate  # noqa: E402
+from trail.model.post import PostLikeWithPost, PostPage  # noqa: E402
+from trail.routers.post import select_like_query  # noqa: E402
+from trail.serialization import model_rows  # noqa: E402
+
+
+async def seed(posts: int, comments: int) -> None:
+    await database.execute(
+        user_table.insert().values(id=1, email="bench@example.com", confirmed=True)
+    )
+    await database.execute(
+        post_table.insert().values(
+            [
+                {"body": f"post {i} " + "x" * 100, "user_id": 1, "like_count": i}
+                for i in range(posts)
+            ]
+        )
+    )
+    await database.execute(
+        comment_table.insert().values(
+            [
+                {"body": f"comment {i}", "post_id": 1, "user_id": 1}
+                for i in range(comments)
+            ]
+        )
+    )
+
+
+async def measure_serialization(limit: int, number: int = 200) -> None:
+    query = select_like_query.limit(limit)
+    adapter = TypeAdapter(PostPage)
+
+    def validated(rows) -> bytes:
+        # what FastAPI does with a response_model: validate, dump, encode
+        page = adapter.validate_python({"posts": rows, "next_cursor": None})
+        return json.dumps(adapter.dump_python(page, mode="json")).encode()
+
+    def trusted(rows) -> bytes:
+        posts = model_rows(rows, PostLikeWithPost)
+        return orjson.dumps({"posts": posts, "next_cursor": None})
+
+    print(f"serializing a page of {limit} posts")
+    for label, func in (("response_model", validated), ("trusted rows", trusted)):
+        config.TRUSTED_ROW_SERIALIZATION = func is trusted
+        seconds = 0.0
+        for _ in range(number):
+            # fresh rows every time, a Record decodes its values on first use
+            rows = await database.fetch_all(query)
+            start = time.perf_counter()
+            func(rows)
+            seconds += time.perf_counter() - start
+        print(f"  {label:<15} {seconds / number * 1_000_000:9.1f} us per page")
+
+
+async def measure_endpoint(client: httpx.AsyncClient, url: str, seconds: float):
+    count = 0
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        response = await client.get(url)
+        response.raise_for_status()
+        count += 1
+    wall = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+    return count / wall, cpu / count * 1000
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=3)
+    parser.add_argument("--limit", type=int, default=100)
+    args = parser.parse_args()
+
+    await database.connect()
+    await migrate(database)
+    await seed(posts=1000, comments=args.limit)
+    await measure_serialization(args.limit)
+
+    urls = [
+        f"/post?limit={args.limit}",
+        f"/post/1?comments_limit={args.limit}",
+        f"/post/1/comments?limit={args.limit}",
+    ]
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as ac:
+        for url in urls:
+            print(f"GET {url}")
+            for label, trusted in (("response_model", False), ("trusted rows", True)):
+                config.TRUSTED_ROW_SERIALIZATION = trusted
+                rps, cpu_ms = await measure_endpoint(ac, url, args.seconds)
+                print(f"  {label:<15} {rps:8.1f} req/s  {cpu_ms:6.2f} ms CPU/req")
+
+    await database.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,111 @@
+"""Peak memory and time to first byte of a materialized and a streamed list.
+
+Seeds a scratch SQLite file with ``--rows`` posts, then serializes all of
+them the way ``GET /post`` builds a page, ``fetch_all`` validated against
+``list[PostLikeWithPost]`` and dumped in one piece, and the way
+``GET /post?stream=json`` does, ``iterate`` encoded in chunks by
+``trail.streaming.encode_rows``. Memory is the tracemalloc peak of a
+second, untimed run.
+
+    python -m benchmarks.streaming --rows 10000 100000
+"""
+
+import argparse
+import asyncio
+import os
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault("ENV_STATE", "test")
+
+from databases import Database  # noqa: E402
+from pydantic import TypeAdapter  # noqa: E402
+
+from trail.model.post import PostLikeWithPost  # noqa: E402
+from trail.routers.post import PostSorting, build_posts_query  # noqa: E402
+from trail.streaming import StreamFormat, encode_rows  # noqa: E402
+
+POSTS = TypeAdapter(list[PostLikeWithPost])
+
+
+def seed(path: str, rows: int) -> None:
+    connection = sqlite3.connect(path)
+    connection.execute(
+        'CREATE TABLE "POST" (id INTEGER PRIMARY KEY, body VARCHAR, user_id INTEGER, '
+        "url_link VARCHAR, like_count INTEGER, comment_count INTEGER, "
+        "created_at FLOAT, hot_score FLOAT)"
+    )
+    connection.executemany(
+        'INSERT INTO "POST" VALUES (?, ?, 1, NULL, 0, 0, 0, 0)',
+        ((i, f"post number {i} " + "x" * 100) for i in range(1, rows + 1)),
+    )
+    connection.commit()
+    connection.close()
+
+
+async def materialized(database: Database, sink) -> None:
+    query = build_posts_query(PostSorting.new, None, None)
+    rows = await database.fetch_all(query)
+    sink(POSTS.dump_json(POSTS.validate_python(rows, from_attributes=True)))
+
+
+async def streamed(database: Database, sink) -> None:
+    query = build_posts_query(PostSorting.new, None, None)
+    rows = database.iterate(query)
+    async for chunk in encode_rows(
+        rows, PostLikeWithPost.model_fields, StreamFormat.json
+    ):
+        sink(chunk)
+
+
+async def measure(label: str, func, database: Database) -> None:
+    first_byte = None
+    size = 0
+
+    def sink(chunk: bytes) -> None:
+        nonlocal first_byte, size
+        if first_byte is None:
+            first_byte = time.perf_counter() - start
+        size += len(chunk)
+
+    start = time.perf_counter()
+    await func(database, sink)
+    total = time.perf_counter() - start
+
+    # a second run for the memory, tracing slows everything down
+    tracemalloc.start()
+    await func(database, lambda chunk: None)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"  {label:<13} first byte {first_byte * 1000:8.1f} ms"
+        f"  total {total * 1000:8.1f} ms  peak {peak / 2**20:7.1f} MiB"
+        f"  body {size / 2**20:6.1f} MiB"
+    )
+
+
+async def run(path: str) -> None:
+    database = Database(f"sqlite:///{path}")
+    await database.connect()
+    await measure("materialized", materialized, database)
+    await measure("streamed", streamed, database)
+    await database.disconnect()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000])
+    args = parser.parse_args()
+
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "bench.db")
+            seed(path, rows)
+            print(f"{rows} posts")
+            asyncio.run(run(path))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import asyncio
+import itertools
+import logging
+from typing import Optional
+
+from trail.config import config
+
+logger = logging.getLogger(__name__)
+
+
+class Subscriber:
+    def __init__(self, channel: str, buffer_size: int) -> None:
+        self.channel = channel
+        self.queue: asyncio.Queue[Optional[tuple[int, str, dict]]] = asyncio.Queue(
+            buffer_size
+        )
+        self.evicted = False
+
+
+class Broadcaster:
+    """Fans events out to in-process subscribers.
+
+    Every subscriber has a bounded buffer. Publishing never waits, a
+    subscriber whose buffer is full is evicted so one slow client cannot hold
+    back the others or grow memory without bound.
+    """
+
+    def __init__(self, buffer_size: int, max_subscribers: int) -> None:
+        self.buffer_size = buffer_size
+        self.max_subscribers = max_subscribers
+        self.subscriber_count = 0
+        self._channels: dict[str, set[Subscriber]] = {}
+        self._ids = itertools.count(1)
+
+    def subscribe(self, channel: str) -> Optional[Subscriber]:
+        if self.subscriber_count >= self.max_subscribers:
+            return None
+        subscriber = Subscriber(channel, self.buffer_size)
+        self._channels.setdefault(channel, set()).add(subscriber)
+        self.subscriber_count += 1
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        subscribers = self._channels.get(subscriber.channel)
+        if subscribers is None or subscriber not in subscribers:
+            return
+        subscribers.discard(subscriber)
+        if not subscribers:
+            del self._channels[subscriber.channel]
+        self.subscriber_count -= 1
+
+    def _evict(self, subscriber: Subscriber) -> None:
+        logger.warning(f"Evicting slow subscriber of {subscriber.channel}")
+        self.unsubscribe(subscriber)
+        subscriber.evicted = True
+        # make room for the sentinel that tells the reader it was dropped
+        while not subscriber.queue.empty():
+            subscriber.queue.get_nowait()
+        subscriber.queue.put_nowait(None)
+
+    def publish(self, channel: str, event: str, data: dict) -> None:
+        message = (next(self._ids), event, data)
+        for subscriber in list(self._channels.get(channel, ())):
+            try:
+                subscriber.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                self._evict(subscriber)
+
+
+broadcaster = Broadcaster(
+    buffer_size=config.STREAM_BUFFER_SIZE, max_subscribers=config.STREAM_MAX_SUBSCRIBERS
+)
+
+
+def publish_post_event(event: str, post_id: int, data: dict) -> None:
+    broadcaster.publish("posts", event, data)
+    broadcaster.publish(f"post:{post_id}", event, data)
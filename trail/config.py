@@ -1,5 +1,5 @@
 from functools import lru_cache
-from typing import Optional
+from typing import Literal, Optional
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -12,10 +12,84 @@ class BaseConfig(BaseSettings):
 
 class GlobalConfig(BaseConfig):
     DATABASE_URL: Optional[str] = None
+    DATABASE_READ_URL: Optional[str] = None
     DB_FORCE_ROLL_BACK: bool = False
+    DB_POOL_MIN_SIZE: int = 1
+    DB_POOL_MAX_SIZE: int = 10
+    DB_STATEMENT_TIMEOUT_SECONDS: Optional[float] = 30
+    SLOW_QUERY_THRESHOLD_SECONDS: Optional[float] = 0.2
+    SLOW_QUERY_EXPLAIN: bool = False
     DEEP_AI_API_KEY: Optional[str] = None
     MAIL_GUN_DOMAIN: Optional[str] = None
     MAIL_GUN_API_KEY: Optional[str] = None
+    USER_CACHE_MAX_SIZE: int = 10_000
+    USER_CACHE_TTL_SECONDS: float = 60
+    TOKEN_CACHE_MAX_SIZE: int = 10_000
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_POOL: Literal["thread", "process"] = "thread"
+    PASSWORD_HASH_WORKERS: int = 4
+    PASSWORD_HASH_QUEUE_SIZE: int = 64
+    RESPONSE_CACHE_MAX_SIZE: int = 1024
+    RESPONSE_CACHE_TTL_SECONDS: float = 30
+    RESPONSE_STREAM_CHUNK_BYTES: int = 64 * 1024
+    # a streamed read holds a pool connection until the client has read it
+    RESPONSE_STREAM_MAX_ROWS: int = 10_000
+    TRUSTED_ROW_SERIALIZATION: bool = True
+    HTTP_CLIENT_HTTP2: bool = True
+    HTTP_CLIENT_MAX_CONNECTIONS: int = 100
+    HTTP_CLIENT_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_CLIENT_KEEPALIVE_EXPIRY_SECONDS: float = 30
+    HTTP_CLIENT_TIMEOUT_SECONDS: float = 30
+    HTTP_CLIENT_CONNECT_TIMEOUT_SECONDS: float = 5
+    JOB_WORKER_CONCURRENCY: int = 4
+    JOB_POLL_INTERVAL_SECONDS: float = 1
+    JOB_LEASE_SECONDS: float = 120
+    JOB_MAX_ATTEMPTS: int = 5
+    JOB_RETRY_BASE_SECONDS: float = 2
+    JOB_RETRY_MAX_SECONDS: float = 600
+    JOB_EVENTS_POLL_INTERVAL_SECONDS: float = 1
+    JOB_EVENTS_RETENTION_SECONDS: float = 3600
+    # the worker serves its job metrics here, 0 turns it off. A scraper on
+    # another host needs 0.0.0.0, every worker on a host needs its own port
+    JOB_WORKER_METRICS_HOST: str = "127.0.0.1"
+    JOB_WORKER_METRICS_PORT: int = 9101
+    MAIL_OUTBOX_BATCH_SIZE: int = 1000
+    MAIL_OUTBOX_FLUSH_INTERVAL_SECONDS: float = 1
+    MAIL_OUTBOX_MAX_QUEUE: int = 200_000
+    MAIL_SEND_RATE_PER_SECOND: float = 5
+    MAIL_SEND_BURST: float = 10
+    MAIL_SEND_MAX_CONCURRENCY: int = 4
+    MAIL_SEND_MAX_RETRIES: int = 5
+    MAIL_SEND_RETRY_BASE_SECONDS: float = 1
+    # longest Retry-After honoured, and how long shutdown waits for sends
+    MAIL_SEND_MAX_RETRY_AFTER_SECONDS: float = 60
+    MAIL_OUTBOX_STOP_TIMEOUT_SECONDS: float = 10
+    # authors with more followers are not fanned out, their posts are merged
+    # into their followers' feeds when read
+    FEED_FANOUT_MAX_FOLLOWERS: int = 10_000
+    FEED_BACKFILL_POSTS: int = 50
+    # likes and unlikes are written behind, coalesced per flush interval
+    LIKE_BUFFER_ENABLED: bool = False
+    LIKE_BUFFER_FLUSH_INTERVAL_SECONDS: float = 0.05
+    LIKE_BUFFER_MAX_PENDING: int = 10_000
+    LIKE_BUFFER_MAX_ATTEMPTS: int = 5
+    HOT_DECAY_SECONDS: float = 45_000
+    LOG_QUEUE_SIZE: int = 10_000
+    LOG_QUEUE_POLICY: Literal["drop", "block"] = "drop"
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_STORE: Literal["memory", "database"] = "memory"
+    RATE_LIMIT_MAX_KEYS: int = 100_000
+    # requests per minute, also the burst a client may send at once
+    RATE_LIMIT_TOKEN_PER_MINUTE: int = 10
+    RATE_LIMIT_REGISTER_PER_MINUTE: int = 5
+    RATE_LIMIT_POST_PER_MINUTE: int = 30
+    RATE_LIMIT_COMMENT_PER_MINUTE: int = 60
+    RATE_LIMIT_LIKE_PER_MINUTE: int = 120
+    RATE_LIMIT_STREAM_PER_MINUTE: int = 10
+    SEARCH_MAX_CANDIDATES: int = 10_000
+    STREAM_BUFFER_SIZE: int = 64
+    STREAM_MAX_SUBSCRIBERS: int = 10_000
+    STREAM_HEARTBEAT_SECONDS: float = 15
 
 
 class ProdConfig(GlobalConfig):
@@ -29,6 +103,10 @@ class DevConfig(GlobalConfig):
 class TestConfig(GlobalConfig):
     DATABASE_URL: str = "sqlite:///test.db"
     DB_FORCE_ROLL_BACK: bool = True
+    BCRYPT_ROUNDS: int = 4
+    DEEP_AI_API_KEY: str = "test"
+    MAIL_GUN_DOMAIN: str = "example.com"
+    MAIL_GUN_API_KEY: str = "test"
 
     SettingsConfigDict(env_prefix="TEST_")
 
@@ -39,4 +117,34 @@ def get_config(env_state: str):
     return config[env_state]()
 
 
-config = get_config(BaseConfig().ENV_STATE)
+_config: Optional[GlobalConfig] = None
+# set once a module has read the config, from then on it cannot change
+_config_read = False
+
+
+def set_config(new_config: GlobalConfig) -> None:
+    """Use ``new_config`` instead of the one named by ENV_STATE.
+
+    Modules read the config when they are imported, so this has to happen
+    before the rest of trail is imported, create_app does it. Replacing a
+    config that was already read raises RuntimeError, the modules holding
+    the old one would silently keep it.
+    """
+    global _config
+    if _config_read and new_config != _config:
+        raise RuntimeError(
+            "The config was already read by imported trail modules, "
+            "set_config has to be called before they are imported"
+        )
+    _config = new_config
+
+
+def __getattr__(name: str):
+    # resolved on first use so importing this module does not read .env
+    global _config, _config_read
+    if name == "config":
+        if _config is None:
+            _config = get_config(BaseConfig().ENV_STATE)
+        _config_read = True
+        return _config
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,54 @@
+import asyncio
+import logging
+
+import sqlalchemy
+from databases import Database
+
+from trail.database import comment_table, like_table, post_table
+from trail.ranking import rebuild_hot_scores
+
+logger = logging.getLogger(__name__)
+
+
+async def increment_post_counter(
+    database: Database, column: sqlalchemy.Column, added: dict[int, int]
+) -> None:
+    # one UPDATE for every touched post: counter + CASE id WHEN ... THEN n END
+    query = (
+        post_table.update()
+        .where(post_table.c.id.in_(added))
+        .values({column.name: column + sqlalchemy.case(added, value=post_table.c.id)})
+    )
+    await database.execute(query)
+
+
+async def reconcile_post_counters(database: Database) -> None:
+    """Rebuild POST.like_count and POST.comment_count from the source tables."""
+    likes = (
+        sqlalchemy.select(sqlalchemy.func.count(like_table.c.id))
+        .where(like_table.c.post_id == post_table.c.id)
+        .scalar_subquery()
+    )
+    comments = (
+        sqlalchemy.select(sqlalchemy.func.count(comment_table.c.id))
+        .where(comment_table.c.post_id == post_table.c.id)
+        .scalar_subquery()
+    )
+    query = post_table.update().values(like_count=likes, comment_count=comments)
+    logger.info("Reconciling post like and comment counters")
+    await database.execute(query)
+
+
+async def main() -> None:
+    from trail.database import database
+
+    await database.connect()
+    try:
+        await reconcile_post_counters(database)
+        await rebuild_hot_scores(database)
+    finally:
+        await database.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,7 +1,17 @@
+import logging
+import time
+from typing import Optional
+
 import databases
 import sqlalchemy
+from asgi_correlation_id import correlation_id
+from sqlalchemy.dialects import postgresql, sqlite
 
 from trail.config import config
+from trail.logging_config import ofescated_length, ofscated_email
+from trail.metrics import db_query_duration
+
+logger = logging.getLogger(__name__)
 
 metadata = sqlalchemy.MetaData()
 
@@ -12,6 +22,22 @@ post_table = sqlalchemy.Table(
     sqlalchemy.Column("body", sqlalchemy.String),
     sqlalchemy.Column("user_id", sqlalchemy.ForeignKey("users.id"), nullable=False),
     sqlalchemy.Column("url_link", sqlalchemy.String),
+    sqlalchemy.Column(
+        "like_count", sqlalchemy.Integer, nullable=False, server_default="0"
+    ),
+    sqlalchemy.Column(
+        "comment_count", sqlalchemy.Integer, nullable=False, server_default="0"
+    ),
+    sqlalchemy.Column("created_at", sqlalchemy.Float),
+    sqlalchemy.Column(
+        "hot_score", sqlalchemy.Float, nullable=False, server_default="0"
+    ),
+    # keyset pagination of the most_likes and hot orderings walks these
+    # indexes, so a page is a range read whatever its depth
+    sqlalchemy.Index("ix_POST_like_count_id", "like_count", "id"),
+    sqlalchemy.Index("ix_POST_hot_score_id", "hot_score", "id"),
+    # an author's newest posts, for feed backfill and fan-out on read
+    sqlalchemy.Index("ix_POST_user_id_id", "user_id", "id"),
 )
 
 user_table = sqlalchemy.Table(
@@ -21,6 +47,16 @@ user_table = sqlalchemy.Table(
     sqlalchemy.Column("email", sqlalchemy.String, unique=True),
     sqlalchemy.Column("password", sqlalchemy.String),
     sqlalchemy.Column("confirmed", sqlalchemy.Boolean, default=False),
+    sqlalchemy.Column(
+        "follower_count", sqlalchemy.Integer, nullable=False, server_default="0"
+    ),
+    # set once a post of the user was not fanned out, see trail.feed
+    sqlalchemy.Column(
+        "fanout_skipped",
+        sqlalchemy.Boolean,
+        nullable=False,
+        server_default=sqlalchemy.false(),
+    ),
 )
 
 comment_table = sqlalchemy.Table(
@@ -28,7 +64,9 @@ comment_table = sqlalchemy.Table(
     metadata,
     sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
     sqlalchemy.Column("body", sqlalchemy.String),
-    sqlalchemy.Column("post_id", sqlalchemy.ForeignKey("POST.id"), nullable=False),
+    sqlalchemy.Column(
+        "post_id", sqlalchemy.ForeignKey("POST.id"), nullable=False, index=True
+    ),
     sqlalchemy.Column("user_id", sqlalchemy.ForeignKey("users.id"), nullable=False),
 )
 
@@ -37,15 +75,271 @@ like_table = sqlalchemy.Table(
     metadata,
     sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
     sqlalchemy.Column("post_id", sqlalchemy.ForeignKey("POST.id"), nullable=False),
-    sqlalchemy.Column("user_id", sqlalchemy.ForeignKey("users.id"), nullable=False),
+    sqlalchemy.Column(
+        "user_id", sqlalchemy.ForeignKey("users.id"), nullable=False, index=True
+    ),
+    # a user can like a post only once, and post_id leads so lookups by post
+    # are served by the same index
+    sqlalchemy.Index("ix_likes_post_id_user_id", "post_id", "user_id", unique=True),
 )
 
-engine = sqlalchemy.create_engine(
-    config.DATABASE_URL, connect_args={"check_same_thread": False}
+follow_table = sqlalchemy.Table(
+    "follows",
+    metadata,
+    sqlalchemy.Column(
+        "follower_id", sqlalchemy.ForeignKey("users.id"), primary_key=True
+    ),
+    sqlalchemy.Column(
+        "followee_id", sqlalchemy.ForeignKey("users.id"), primary_key=True
+    ),
+    sqlalchemy.Column("created_at", sqlalchemy.Float, nullable=False),
+    # covers fan-out, the followers of an author without touching the table
+    sqlalchemy.Index(
+        "ix_follows_followee_id_follower_id", "followee_id", "follower_id"
+    ),
 )
 
-metadata.create_all(engine)
+# the precomputed home feed, one row per post a user should see. Reading a
+# page is a range scan of the (user_id, post_id) primary key
+timeline_table = sqlalchemy.Table(
+    "timeline",
+    metadata,
+    sqlalchemy.Column("user_id", sqlalchemy.ForeignKey("users.id"), primary_key=True),
+    sqlalchemy.Column("post_id", sqlalchemy.ForeignKey("POST.id"), primary_key=True),
+)
+
+job_table = sqlalchemy.Table(
+    "jobs",
+    metadata,
+    sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("kind", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("payload", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("post_id", sqlalchemy.ForeignKey("POST.id"), index=True),
+    sqlalchemy.Column(
+        "status", sqlalchemy.String, nullable=False, server_default="queued"
+    ),
+    sqlalchemy.Column(
+        "attempts", sqlalchemy.Integer, nullable=False, server_default="0"
+    ),
+    sqlalchemy.Column("max_attempts", sqlalchemy.Integer, nullable=False),
+    # times are unix timestamps so leasing is a plain numeric comparison
+    sqlalchemy.Column("run_at", sqlalchemy.Float, nullable=False),
+    sqlalchemy.Column("leased_until", sqlalchemy.Float),
+    sqlalchemy.Column("lease_token", sqlalchemy.String),
+    sqlalchemy.Column("last_error", sqlalchemy.String),
+    sqlalchemy.Column("created_at", sqlalchemy.Float, nullable=False),
+    sqlalchemy.Column("updated_at", sqlalchemy.Float, nullable=False),
+    sqlalchemy.Index("ix_jobs_status_run_at", "status", "run_at"),
+)
+
+# one row per job the worker finished, written with its status. Web
+# processes read it by id, AUTOINCREMENT keeps SQLite from handing out an
+# id again once the newest rows were pruned
+job_completion_table = sqlalchemy.Table(
+    "job_completions",
+    metadata,
+    sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("job_id", sqlalchemy.Integer, nullable=False),
+    sqlalchemy.Column("kind", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("post_id", sqlalchemy.Integer),
+    sqlalchemy.Column("created_at", sqlalchemy.Float, nullable=False),
+    sqlite_autoincrement=True,
+)
+
+# token bucket state of the shared rate limit store. ``tat`` is the
+# theoretical arrival time of GCRA, a key is idle again once it has passed
+rate_limit_table = sqlalchemy.Table(
+    "rate_limits",
+    metadata,
+    sqlalchemy.Column("key", sqlalchemy.String, primary_key=True),
+    sqlalchemy.Column("tat", sqlalchemy.Float, nullable=False),
+    sqlalchemy.Index("ix_rate_limits_tat", "tat"),
+)
+
+# full text indexes over POST.body and COMMENT.body, created with their
+# triggers by the search migration. SQLite only
+post_search_table = sqlalchemy.table(
+    "post_fts", sqlalchemy.column("rowid"), sqlalchemy.column("body")
+)
+comment_search_table = sqlalchemy.table(
+    "comment_fts",
+    sqlalchemy.column("rowid"),
+    sqlalchemy.column("body"),
+    sqlalchemy.column("post_id"),
+)
+
+
+def database_options(url: str) -> dict:
+    """Driver options for ``url``, pool sizes and timeouts come from config."""
+    dialect = databases.DatabaseURL(url).dialect
+    timeout = config.DB_STATEMENT_TIMEOUT_SECONDS
+    if dialect == "postgresql":
+        options = {
+            "min_size": config.DB_POOL_MIN_SIZE,
+            "max_size": config.DB_POOL_MAX_SIZE,
+        }
+        if timeout:
+            # enforced by the server, command_timeout also frees the client
+            options["command_timeout"] = timeout
+            options["server_settings"] = {"statement_timeout": str(int(timeout * 1000))}
+        return options
+    if dialect == "sqlite" and timeout:
+        # sqlite has one writer, this is how long a write waits for the lock
+        return {"timeout": timeout}
+    return {}
+
+
+def statement_and_params(query, values) -> tuple[str, dict]:
+    if isinstance(query, str):
+        return query, values or {}
+    compiled = query.compile(compile_kwargs={"render_postcompile": True})
+    return str(compiled), {**compiled.params, **(values or {})}
 
-database = databases.Database(
+
+def obfuscate_params(params: dict) -> dict:
+    """Params as they may be logged, emails shortened and passwords hidden."""
+    safe = {}
+    for key, value in params.items():
+        if "password" in key:
+            value = "***"
+        elif isinstance(value, str) and value.count("@") == 1:
+            # redacted like the email of log records
+            value = ofscated_email(value, ofescated_length())
+        safe[key] = value
+    return safe
+
+
+class InstrumentedDatabase(databases.Database):
+    """A Database that times every statement it runs.
+
+    Statements slower than ``slow_query_threshold`` seconds are logged with
+    the request's correlation id and their obfuscated params, and with
+    ``explain_slow_queries`` the plan of the statement is logged too.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        *,
+        slow_query_threshold: Optional[float] = None,
+        explain_slow_queries: bool = False,
+        **options,
+    ) -> None:
+        super().__init__(url, **options)
+        self.slow_query_threshold = slow_query_threshold
+        self.explain_slow_queries = explain_slow_queries
+
+    async def _timed(self, operation: str, query, values, *args):
+        start = time.perf_counter()
+        try:
+            return await getattr(super(), operation)(query, values, *args)
+        finally:
+            seconds = time.perf_counter() - start
+            self.observe(operation, query, values, seconds)
+            if (
+                self.slow_query_threshold is not None
+                and seconds >= self.slow_query_threshold
+            ):
+                await self.log_slow_query(operation, query, values, seconds)
+
+    def observe(self, operation: str, query, values, seconds: float) -> None:
+        db_query_duration.observe(seconds, operation)
+
+    async def log_slow_query(self, operation: str, query, values, seconds: float):
+        if operation == "execute_many":
+            statement, params = statement_and_params(query, None)
+            params = {"rows": len(values)}
+        else:
+            statement, params = statement_and_params(query, values)
+            params = obfuscate_params(params)
+        logger.warning(
+            f"Slow query ({seconds * 1000:.1f}ms, {operation}, "
+            f"correlation_id={correlation_id.get()}): {statement} params={params}"
+        )
+        # an iterate is closed when the response is, not the time to explain
+        if self.explain_slow_queries and operation not in ("execute_many", "iterate"):
+            plan = await self.explain(query, values)
+            if plan is not None:
+                logger.warning(f"Plan of slow query:\n{plan}")
+
+    async def explain(self, query, values) -> Optional[str]:
+        statement, params = statement_and_params(query, values)
+        if self.url.dialect == "sqlite":
+            explain = "EXPLAIN QUERY PLAN "
+        else:
+            explain = "EXPLAIN "
+        try:
+            # super() so the EXPLAIN itself is neither timed nor explained
+            rows = await super().fetch_all(
+                sqlalchemy.text(explain + statement).bindparams(**params)
+            )
+        except Exception as e:
+            logger.debug(f"Could not explain slow query: {e}")
+            return None
+        return "\n".join(str(row[-1]) for row in rows)
+
+    async def fetch_all(self, query, values=None):
+        return await self._timed("fetch_all", query, values)
+
+    async def fetch_one(self, query, values=None):
+        return await self._timed("fetch_one", query, values)
+
+    async def fetch_val(self, query, values=None, column=0):
+        return await self._timed("fetch_val", query, values, column)
+
+    async def execute(self, query, values=None):
+        return await self._timed("execute", query, values)
+
+    async def execute_many(self, query, values):
+        return await self._timed("execute_many", query, values)
+
+    async def iterate(self, query, values=None):
+        # timed until the last row is read, a slow reader keeps the
+        # connection just as long as a slow statement
+        start = time.perf_counter()
+        try:
+            async for row in super().iterate(query, values):
+                yield row
+        finally:
+            seconds = time.perf_counter() - start
+            self.observe("iterate", query, values, seconds)
+            if (
+                self.slow_query_threshold is not None
+                and seconds >= self.slow_query_threshold
+            ):
+                await self.log_slow_query("iterate", query, values, seconds)
+
+
+def create_database(url: str, force_rollback: bool = False) -> databases.Database:
+    return InstrumentedDatabase(
+        url,
+        force_rollback=force_rollback,
+        slow_query_threshold=config.SLOW_QUERY_THRESHOLD_SECONDS,
+        explain_slow_queries=config.SLOW_QUERY_EXPLAIN,
+        **database_options(url),
+    )
+
+
+def dialect_insert(table: sqlalchemy.Table):
+    """INSERT of the primary's dialect, for ON CONFLICT clauses."""
+    if database.url.dialect == "postgresql":
+        return postgresql.insert(table)
+    return sqlite.insert(table)
+
+
+def insert_ignoring_conflicts(table: sqlalchemy.Table, index_elements: list[str]):
+    """INSERT ... ON CONFLICT DO NOTHING in the dialect of the primary."""
+    return dialect_insert(table).on_conflict_do_nothing(index_elements=index_elements)
+
+
+# the schema is created by ``python -m trail.migrate``, importing this module
+# does no I/O
+database = create_database(
     config.DATABASE_URL, force_rollback=config.DB_FORCE_ROLL_BACK
 )
+
+# read only handlers use the replica when there is one, it can lag behind
+# the primary so anything that must see its own writes uses ``database``
+read_database = (
+    create_database(config.DATABASE_READ_URL) if config.DATABASE_READ_URL else database
+)
@@ -0,0 +1,241 @@
+import asyncio
+import datetime
+import email.utils
+import json
+import logging
+import time
+from typing import Optional
+
+import httpx
+
+from trail.config import config
+from trail.http_client import get_http_client
+from trail.metrics import (
+    email_messages_failed,
+    email_messages_sent,
+    email_queue_duration,
+)
+from trail.ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# address, recipient variables and when it was queued
+Recipient = tuple[str, dict, float]
+
+
+class OutboxFullError(Exception):
+    pass
+
+
+class OutboxMetrics:
+    def __init__(self) -> None:
+        self.batches_sent = 0
+        self.messages_sent = 0
+        self.messages_failed = 0
+        self.retries = 0
+        self.send_count = 0
+        self.send_seconds_total = 0.0
+        self.send_seconds_max = 0.0
+
+    def observe_send(self, seconds: float) -> None:
+        self.send_count += 1
+        self.send_seconds_total += seconds
+        self.send_seconds_max = max(self.send_seconds_max, seconds)
+
+
+def retry_after_seconds(response: httpx.Response) -> Optional[float]:
+    value = response.headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max((retry_at - datetime.datetime.now(datetime.UTC)).total_seconds(), 0)
+
+
+class EmailOutbox:
+    """Coalesces outgoing emails into Mailgun batch sends.
+
+    Messages with the same subject and body are sent together, up to
+    ``batch_size`` recipients per request, with ``recipient-variables`` so each
+    recipient still gets their own values for ``%recipient.<name>%``
+    placeholders. Sends are limited by a token bucket and a concurrency cap,
+    and 429/5xx answers are retried honouring Retry-After, up to
+    ``max_retry_after`` seconds.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = config.MAIL_OUTBOX_BATCH_SIZE,
+        flush_interval: float = config.MAIL_OUTBOX_FLUSH_INTERVAL_SECONDS,
+        max_queue: int = config.MAIL_OUTBOX_MAX_QUEUE,
+        rate: float = config.MAIL_SEND_RATE_PER_SECOND,
+        burst: float = config.MAIL_SEND_BURST,
+        max_concurrency: int = config.MAIL_SEND_MAX_CONCURRENCY,
+        max_retries: int = config.MAIL_SEND_MAX_RETRIES,
+        retry_base: float = config.MAIL_SEND_RETRY_BASE_SECONDS,
+        max_retry_after: float = config.MAIL_SEND_MAX_RETRY_AFTER_SECONDS,
+        stop_timeout: float = config.MAIL_OUTBOX_STOP_TIMEOUT_SECONDS,
+        client: Optional[httpx.AsyncClient] = None,
+    ) -> None:
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        self.max_retry_after = max_retry_after
+        self.stop_timeout = stop_timeout
+        self.client = client
+        self.metrics = OutboxMetrics()
+        self.queue_depth = 0
+        self._groups: dict[tuple[str, str], list[Recipient]] = {}
+        self._bucket = TokenBucket(rate, burst)
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    def enqueue(
+        self, to: str, subject: str, body: str, variables: Optional[dict] = None
+    ) -> None:
+        if self.queue_depth >= self.max_queue:
+            raise OutboxFullError("Email outbox is full")
+
+        group = self._groups.setdefault((subject, body), [])
+        group.append((to, variables or {}, time.monotonic()))
+        self.queue_depth += 1
+        if len(group) >= self.batch_size:
+            self._wakeup.set()
+
+    def _take_batches(self) -> list[tuple[str, str, list[Recipient]]]:
+        groups, self._groups = self._groups, {}
+        return [
+            (subject, body, recipients[i : i + self.batch_size])
+            for (subject, body), recipients in groups.items()
+            for i in range(0, len(recipients), self.batch_size)
+        ]
+
+    async def flush(self) -> None:
+        batches = self._take_batches()
+        if batches:
+            await asyncio.gather(*(self._send_batch(*batch) for batch in batches))
+
+    async def _send_batch(
+        self, subject: str, body: str, recipients: list[Recipient]
+    ) -> None:
+        now = time.monotonic()
+        for _, _, queued_at in recipients:
+            email_queue_duration.observe(now - queued_at)
+        try:
+            data = {
+                "from": f"Venjan <mailgun@{config.MAIL_GUN_DOMAIN}>",
+                "to": [to for to, _, _ in recipients],
+                "subject": subject,
+                "text": body,
+                "recipient-variables": json.dumps(
+                    {to: variables for to, variables, _ in recipients}
+                ),
+            }
+            async with self._slots:
+                sent = await self._post_with_retries(data)
+        except Exception:
+            # one bad batch must not end run() and stop every later send
+            logger.exception(f"Sending a batch of {len(recipients)} emails failed")
+            sent = False
+
+        # a batch cancelled by stop() is still counted in queue_depth, stop
+        # counts it as failed
+        self.queue_depth -= len(recipients)
+        if sent:
+            self.metrics.batches_sent += 1
+            self.metrics.messages_sent += len(recipients)
+            email_messages_sent.inc(amount=len(recipients))
+        else:
+            self.metrics.messages_failed += len(recipients)
+            email_messages_failed.inc(amount=len(recipients))
+
+    async def _post_with_retries(self, data: dict) -> bool:
+        client = self.client or get_http_client()
+        for attempt in range(self.max_retries + 1):
+            await self._bucket.acquire()
+            delay = self.retry_base * 2**attempt
+            start = time.perf_counter()
+            try:
+                response = await client.post(
+                    f"https://api.mailgun.net/v3/{config.MAIL_GUN_DOMAIN}/messages",
+                    auth=("api", config.MAIL_GUN_API_KEY),
+                    data=data,
+                )
+            except httpx.TransportError as e:
+                logger.warning(f"Mailgun batch send failed: {e}")
+            else:
+                self.metrics.observe_send(time.perf_counter() - start)
+                if response.status_code == 429 or response.status_code >= 500:
+                    logger.warning(f"Mailgun answered {response.status_code}")
+                    retry_after = retry_after_seconds(response)
+                    if retry_after is not None:
+                        delay = min(retry_after, self.max_retry_after)
+                elif response.is_error:
+                    logger.error(
+                        f"Mailgun rejected batch with status {response.status_code}"
+                    )
+                    return False
+                else:
+                    return True
+
+            if attempt < self.max_retries:
+                self.metrics.retries += 1
+                await asyncio.sleep(delay)
+
+        logger.error(f"Giving up on Mailgun batch after {self.max_retries} retries")
+        return False
+
+    async def run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def _drain(self) -> None:
+        if self._task is not None:
+            await self._task
+            self._task = None
+        await self.flush()
+
+    async def stop(self) -> None:
+        """Send what is queued, for at most ``stop_timeout`` seconds.
+
+        The running flush is allowed to finish, then whatever is still
+        queued is sent. Emails not sent by the deadline are given up on and
+        counted as failed.
+        """
+        self._stopping = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._drain(), self.stop_timeout)
+        except asyncio.TimeoutError:
+            self._task = None
+            self._groups = {}
+            unsent, self.queue_depth = self.queue_depth, 0
+            logger.error(
+                f"Email outbox not drained in {self.stop_timeout}s, "
+                f"{unsent} emails not sent"
+            )
+            self.metrics.messages_failed += unsent
+            email_messages_failed.inc(amount=unsent)
+        self._stopping = False
+
+
+email_outbox = EmailOutbox()
@@ -0,0 +1,184 @@
+import time
+from typing import Iterable, Optional
+
+import sqlalchemy
+from databases import Database
+
+from trail.config import config
+from trail.database import (
+    follow_table,
+    insert_ignoring_conflicts,
+    post_table,
+    timeline_table,
+    user_table,
+)
+
+# Home feeds are fanned out on write: a new post is copied into the
+# timeline of every follower of its author, so reading a feed is a range
+# scan of one user's timeline rows. Authors with more than
+# FEED_FANOUT_MAX_FOLLOWERS followers are skipped, one post would write
+# that many rows, and their posts are merged into the feed when it is read.
+# A batch of posts is skipped the same way when posts times followers is
+# over the limit, it is inserted inside the request's transaction.
+# Skipping sets users.fanout_skipped for good, those posts are never
+# copied later, so they are still merged once the author is back under
+# the limit.
+
+
+def is_fanned_out(follower_count: int) -> bool:
+    return follower_count <= config.FEED_FANOUT_MAX_FOLLOWERS
+
+
+async def fan_out_posts(
+    database: Database, author_id: int, post_ids: Iterable[int]
+) -> None:
+    """Add new posts of ``author_id`` to their own and their followers' timelines."""
+    post_ids = list(post_ids)
+    await database.execute(
+        timeline_table.insert().values(
+            [{"user_id": author_id, "post_id": post_id} for post_id in post_ids]
+        )
+    )
+
+    follower_count = await database.fetch_val(
+        sqlalchemy.select(user_table.c.follower_count).where(
+            user_table.c.id == author_id
+        )
+    )
+    if not follower_count:
+        return
+    if not is_fanned_out(follower_count * len(post_ids)):
+        await database.execute(
+            user_table.update()
+            .where(user_table.c.id == author_id, user_table.c.fanout_skipped.is_(False))
+            .values(fanout_skipped=True)
+        )
+        return
+
+    followers = sqlalchemy.select(follow_table.c.follower_id, post_table.c.id).where(
+        follow_table.c.followee_id == author_id, post_table.c.id.in_(post_ids)
+    )
+    await database.execute(
+        timeline_table.insert().from_select(["user_id", "post_id"], followers)
+    )
+
+
+async def follow(database: Database, follower_id: int, followee_id: int) -> bool:
+    """Follow ``followee_id``, False when already following.
+
+    The newest FEED_BACKFILL_POSTS posts of the followee are copied into the
+    follower's timeline so the feed is not empty until they post again.
+    """
+    query = (
+        insert_ignoring_conflicts(follow_table, ["follower_id", "followee_id"])
+        .values(
+            follower_id=follower_id, followee_id=followee_id, created_at=time.time()
+        )
+        .returning(follow_table.c.follower_id)
+    )
+    async with database.transaction():
+        if await database.fetch_val(query) is None:
+            return False
+
+        follower_count = await database.fetch_val(
+            user_table.update()
+            .where(user_table.c.id == followee_id)
+            .values(follower_count=user_table.c.follower_count + 1)
+            .returning(user_table.c.follower_count)
+        )
+        if is_fanned_out(follower_count):
+            recent = (
+                sqlalchemy.select(sqlalchemy.literal(follower_id), post_table.c.id)
+                .where(post_table.c.user_id == followee_id)
+                .order_by(post_table.c.id.desc())
+                .limit(config.FEED_BACKFILL_POSTS)
+            )
+            await database.execute(
+                insert_ignoring_conflicts(
+                    timeline_table, ["user_id", "post_id"]
+                ).from_select(["user_id", "post_id"], recent)
+            )
+    return True
+
+
+async def unfollow(database: Database, follower_id: int, followee_id: int) -> bool:
+    """Stop following ``followee_id``, False when not following."""
+    query = (
+        follow_table.delete()
+        .where(
+            follow_table.c.follower_id == follower_id,
+            follow_table.c.followee_id == followee_id,
+        )
+        .returning(follow_table.c.follower_id)
+    )
+    async with database.transaction():
+        if await database.fetch_val(query) is None:
+            return False
+
+        await database.execute(
+            user_table.update()
+            .where(user_table.c.id == followee_id)
+            .values(follower_count=user_table.c.follower_count - 1)
+        )
+        await database.execute(
+            timeline_table.delete().where(
+                timeline_table.c.user_id == follower_id,
+                timeline_table.c.post_id.in_(
+                    sqlalchemy.select(post_table.c.id).where(
+                        post_table.c.user_id == followee_id
+                    )
+                ),
+            )
+        )
+    return True
+
+
+def unfanned_followees_query(user_id: int):
+    return (
+        sqlalchemy.select(follow_table.c.followee_id)
+        .join(user_table, user_table.c.id == follow_table.c.followee_id)
+        .where(
+            follow_table.c.follower_id == user_id,
+            sqlalchemy.or_(
+                user_table.c.follower_count > config.FEED_FANOUT_MAX_FOLLOWERS,
+                user_table.c.fanout_skipped,
+            ),
+        )
+    )
+
+
+async def get_unfanned_followees(database: Database, user_id: int) -> list[int]:
+    """Followees of ``user_id`` with posts that are not in its timeline."""
+    query = unfanned_followees_query(user_id)
+    return [row.followee_id for row in await database.fetch_all(query)]
+
+
+def feed_post_ids(
+    user_id: int, unfanned_followees: list[int], limit: int, after: Optional[int] = None
+):
+    """Ids of the next ``limit`` posts of a feed, newest first.
+
+    The timeline is read by its primary key. Posts of followees that are not
+    fanned out are read by ``ix_POST_user_id_id`` and merged in, the union
+    also drops posts that were fanned out before the author got that big.
+    """
+    timeline = sqlalchemy.select(timeline_table.c.post_id.label("id")).where(
+        timeline_table.c.user_id == user_id
+    )
+    if after is not None:
+        timeline = timeline.where(timeline_table.c.post_id < after)
+    timeline = timeline.order_by(timeline_table.c.post_id.desc()).limit(limit)
+    if not unfanned_followees:
+        return timeline
+
+    merged = sqlalchemy.select(post_table.c.id).where(
+        post_table.c.user_id.in_(unfanned_followees)
+    )
+    if after is not None:
+        merged = merged.where(post_table.c.id < after)
+    merged = merged.order_by(post_table.c.id.desc()).limit(limit)
+    # SQLite only takes ORDER BY and LIMIT on a compound's members as subqueries
+    return sqlalchemy.union(
+        sqlalchemy.select(timeline.subquery().c.id),
+        sqlalchemy.select(merged.subquery().c.id),
+    )
@@ -0,0 +1,60 @@
+import logging
+import time
+from typing import Optional
+
+import httpx
+
+from trail.config import config
+from trail.metrics import http_client_request_duration
+
+logger = logging.getLogger(__name__)
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+async def start_timer(request: httpx.Request) -> None:
+    request.extensions["start_time"] = time.perf_counter()
+
+
+async def observe_response(response: httpx.Response) -> None:
+    start = response.request.extensions.get("start_time")
+    if start is not None:
+        # time to the response headers, the body is read by the caller
+        http_client_request_duration.observe(
+            time.perf_counter() - start,
+            response.request.url.host,
+            str(response.status_code),
+        )
+
+
+def create_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        event_hooks={"request": [start_timer], "response": [observe_response]},
+        http2=config.HTTP_CLIENT_HTTP2,
+        limits=httpx.Limits(
+            max_connections=config.HTTP_CLIENT_MAX_CONNECTIONS,
+            max_keepalive_connections=config.HTTP_CLIENT_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=config.HTTP_CLIENT_KEEPALIVE_EXPIRY_SECONDS,
+        ),
+        timeout=httpx.Timeout(
+            config.HTTP_CLIENT_TIMEOUT_SECONDS,
+            connect=config.HTTP_CLIENT_CONNECT_TIMEOUT_SECONDS,
+        ),
+    )
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """The shared client for outbound calls, its connections are reused."""
+    global _client
+    if _client is None or _client.is_closed:
+        logger.info("Opening shared http client")
+        _client = create_http_client()
+    return _client
+
+
+async def close_http_client() -> None:
+    global _client
+    if _client is not None:
+        logger.info("Closing shared http client")
+        await _client.aclose()
+        _client = None
@@ -0,0 +1,339 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from typing import Awaitable, Callable, Optional
+
+import sqlalchemy
+from databases import Database
+
+from trail.broadcast import publish_post_event
+from trail.config import config
+from trail.database import database, job_completion_table, job_table, post_table
+from trail.metrics import job_duration, job_queue_duration
+from trail.response_cache import response_cache
+from trail.tasks import generate_and_add_to_post
+
+logger = logging.getLogger(__name__)
+
+JobHandler = Callable[[Database, dict], Awaitable[None]]
+
+
+async def generate_image_job(database: Database, payload: dict) -> None:
+    await generate_and_add_to_post(
+        payload["post_id"], payload["post_url"], database, payload["prompt"]
+    )
+
+
+JOB_HANDLERS: dict[str, JobHandler] = {"generate_image": generate_image_job}
+
+
+async def enqueue_job(
+    database: Database,
+    kind: str,
+    payload: dict,
+    post_id: Optional[int] = None,
+    max_attempts: Optional[int] = None,
+) -> int:
+    now = time.time()
+    query = job_table.insert().values(
+        kind=kind,
+        payload=json.dumps(payload),
+        post_id=post_id,
+        max_attempts=max_attempts or config.JOB_MAX_ATTEMPTS,
+        run_at=now,
+        created_at=now,
+        updated_at=now,
+    )
+    logger.info(f"Enqueueing {kind} job")
+    return await database.execute(query)
+
+
+def _expired(now: float):
+    # running jobs whose worker went away
+    return sqlalchemy.and_(
+        job_table.c.status == "running", job_table.c.leased_until < now
+    )
+
+
+def _leasable(now: float):
+    # queued jobs that are due, and expired jobs with attempts left
+    return sqlalchemy.or_(
+        sqlalchemy.and_(job_table.c.status == "queued", job_table.c.run_at <= now),
+        sqlalchemy.and_(_expired(now), job_table.c.attempts < job_table.c.max_attempts),
+    )
+
+
+async def fail_expired_jobs(database: Database, now: float) -> None:
+    # a job that keeps crashing its worker is never failed by run_job
+    query = (
+        job_table.update()
+        .where(_expired(now), job_table.c.attempts >= job_table.c.max_attempts)
+        .values(
+            status="failed",
+            lease_token=None,
+            leased_until=None,
+            last_error="Lease expired, the worker running it went away",
+            updated_at=now,
+        )
+        .returning(job_table.c.id, job_table.c.attempts)
+    )
+    for job in await database.fetch_all(query):
+        logger.error(f"Job {job.id} failed, its lease expired {job.attempts} times")
+
+
+async def lease_job(database: Database, lease_seconds: float):
+    now = time.time()
+    await fail_expired_jobs(database, now)
+    token = uuid.uuid4().hex
+    candidate = (
+        sqlalchemy.select(job_table.c.id)
+        .where(_leasable(now))
+        .order_by(job_table.c.run_at)
+        .limit(1)
+        .scalar_subquery()
+    )
+    # the condition is checked again on the row itself, so two workers racing
+    # for the same candidate cannot both take it
+    query = (
+        job_table.update()
+        .where(job_table.c.id == candidate, _leasable(now))
+        .values(
+            status="running",
+            attempts=job_table.c.attempts + 1,
+            lease_token=token,
+            leased_until=now + lease_seconds,
+            updated_at=now,
+        )
+    )
+    await database.execute(query)
+    query = job_table.select().where(job_table.c.lease_token == token)
+    return await database.fetch_one(query)
+
+
+async def complete_job(database: Database, job) -> None:
+    now = time.time()
+    # recorded first and only while this worker holds the lease. Dying in
+    # between runs the job again, which records it twice, never not at all
+    recorded = sqlalchemy.select(
+        job_table.c.id, job_table.c.kind, job_table.c.post_id, sqlalchemy.literal(now)
+    ).where(job_table.c.id == job.id, job_table.c.lease_token == job.lease_token)
+    await database.execute(
+        job_completion_table.insert().from_select(
+            ["job_id", "kind", "post_id", "created_at"], recorded
+        )
+    )
+    query = (
+        job_table.update()
+        .where(job_table.c.id == job.id, job_table.c.lease_token == job.lease_token)
+        .values(
+            status="succeeded",
+            lease_token=None,
+            leased_until=None,
+            last_error=None,
+            updated_at=now,
+        )
+    )
+    await database.execute(query)
+
+
+def retry_delay(attempts: int) -> float:
+    return min(
+        config.JOB_RETRY_BASE_SECONDS * 2 ** (attempts - 1),
+        config.JOB_RETRY_MAX_SECONDS,
+    )
+
+
+async def fail_job(database: Database, job, error: str) -> None:
+    now = time.time()
+    if job.attempts >= job.max_attempts:
+        logger.error(f"Job {job.id} failed after {job.attempts} attempts: {error}")
+        values = {"status": "failed"}
+    else:
+        delay = retry_delay(job.attempts)
+        logger.warning(f"Job {job.id} failed, retrying in {delay}s: {error}")
+        values = {"status": "queued", "run_at": now + delay}
+
+    query = (
+        job_table.update()
+        .where(job_table.c.id == job.id, job_table.c.lease_token == job.lease_token)
+        .values(
+            **values,
+            lease_token=None,
+            leased_until=None,
+            last_error=error,
+            updated_at=now,
+        )
+    )
+    await database.execute(query)
+
+
+async def run_job(database: Database, job) -> None:
+    job_queue_duration.observe(max(time.time() - job.run_at, 0), job.kind)
+    handler = JOB_HANDLERS.get(job.kind)
+    if handler is None:
+        await fail_job(database, job, f"No handler for job kind {job.kind}")
+        return
+
+    start = time.perf_counter()
+    try:
+        await handler(database, json.loads(job.payload))
+    except Exception as e:
+        job_duration.observe(time.perf_counter() - start, job.kind, "failed")
+        await fail_job(database, job, f"{type(e).__name__}: {e}")
+    else:
+        job_duration.observe(time.perf_counter() - start, job.kind, "succeeded")
+        await complete_job(database, job)
+
+
+async def get_latest_post_job(database: Database, post_id: int, kind: str):
+    query = (
+        job_table.select()
+        .where(job_table.c.post_id == post_id, job_table.c.kind == kind)
+        .order_by(job_table.c.id.desc())
+        .limit(1)
+    )
+    return await database.fetch_one(query)
+
+
+async def image_generated(database: Database, completion) -> None:
+    query = sqlalchemy.select(post_table.c.url_link).where(
+        post_table.c.id == completion.post_id
+    )
+    url_link = await database.fetch_val(query)
+    publish_post_event(
+        "post_image",
+        completion.post_id,
+        {"post_id": completion.post_id, "url_link": url_link},
+    )
+
+
+# run by the web processes with the job_completions row of a finished job
+JOB_COMPLETION_HANDLERS: dict[str, Callable[[Database, object], Awaitable[None]]] = {
+    "generate_image": image_generated
+}
+
+
+class JobCompletionWatcher:
+    """Tells the web process about jobs ``trail.worker`` finished.
+
+    The worker runs in its own process and cannot reach the response cache
+    or the stream subscribers of the web processes. It adds a row to
+    job_completions for every job it finishes, and every web process reads
+    the rows after the last id it saw, drops its cached responses and
+    publishes their events.
+
+    Postgres hands out ids before commit, so a lower id can become visible
+    after a higher one was read. Ids skipped over are looked for again for
+    ``gap_seconds``, longer than any transaction writing them can stay open.
+    """
+
+    def __init__(
+        self,
+        database: Database,
+        poll_interval: float = config.JOB_EVENTS_POLL_INTERVAL_SECONDS,
+        retention: float = config.JOB_EVENTS_RETENTION_SECONDS,
+        batch_size: int = 100,
+        gap_seconds: float = 60,
+        prune_every: int = 1000,
+    ) -> None:
+        self.database = database
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.batch_size = batch_size
+        self.gap_seconds = gap_seconds
+        self.prune_every = prune_every
+        # highest id seen, and the ids below it not seen yet with when
+        # they were skipped
+        self._cursor: Optional[int] = None
+        self._gaps: dict[int, float] = {}
+        self._checks = 0
+        self._task: Optional[asyncio.Task] = None
+        self._stop = asyncio.Event()
+
+    async def _start_cursor(self) -> int:
+        # jobs finished before this process started are not its business
+        query = sqlalchemy.select(sqlalchemy.func.max(job_completion_table.c.id))
+        return await self.database.fetch_val(query) or 0
+
+    async def check(self) -> int:
+        """Handle the jobs finished since the last check, return how many."""
+        if self._cursor is None:
+            self._cursor = await self._start_cursor()
+        now = time.monotonic()
+        self._gaps = {
+            gap: skipped
+            for gap, skipped in self._gaps.items()
+            if now - skipped < self.gap_seconds
+        }
+
+        self._checks += 1
+        if self._checks % self.prune_every == 0:
+            await self.prune()
+
+        query = (
+            job_completion_table.select()
+            .where(
+                sqlalchemy.or_(
+                    job_completion_table.c.id > self._cursor,
+                    job_completion_table.c.id.in_(self._gaps),
+                )
+            )
+            .order_by(job_completion_table.c.id)
+            .limit(self.batch_size)
+        )
+        finished = await self.database.fetch_all(query)
+        if not finished:
+            return 0
+
+        for row in finished:
+            self._gaps.pop(row.id, None)
+            if row.id > self._cursor:
+                self._gaps.update(dict.fromkeys(range(self._cursor + 1, row.id), now))
+                self._cursor = row.id
+
+        response_cache.invalidate()
+        for row in finished:
+            handler = JOB_COMPLETION_HANDLERS.get(row.kind)
+            if handler is None:
+                continue
+            try:
+                await handler(self.database, row)
+            except Exception:
+                logger.exception(f"Handling finished job {row.job_id} failed")
+        return len(finished)
+
+    async def prune(self) -> None:
+        await self.database.execute(
+            job_completion_table.delete().where(
+                job_completion_table.c.created_at < time.time() - self.retention
+            )
+        )
+
+    async def run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                # a full batch means there may be more waiting
+                if await self.check() == self.batch_size:
+                    continue
+            except Exception:
+                logger.exception("Polling for finished jobs failed")
+            try:
+                await asyncio.wait_for(self._stop.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        self._stop.clear()
+
+
+job_watcher = JobCompletionWatcher(database)
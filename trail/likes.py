@@ -0,0 +1,203 @@
+import asyncio
+import logging
+from collections import Counter
+from typing import Optional
+
+import sqlalchemy
+from databases import Database
+
+from trail.broadcast import publish_post_event
+from trail.config import config
+from trail.counters import increment_post_counter
+from trail.database import database, insert_ignoring_conflicts, like_table, post_table
+from trail.ranking import refresh_hot_scores
+from trail.response_cache import response_cache
+
+logger = logging.getLogger(__name__)
+
+# (post_id, user_id) to whether the user likes the post
+LikeChanges = dict[tuple[int, int], bool]
+
+# two bound parameters a pair, well under SQLite's limit of 32766
+CHUNK_SIZE = 1000
+
+
+class LikeBufferFullError(Exception):
+    pass
+
+
+def chunks(items: list, size: int = CHUNK_SIZE) -> list[list]:
+    return [items[i : i + size] for i in range(0, len(items), size)]
+
+
+async def apply_like_changes(database: Database, changes: LikeChanges) -> None:
+    """Like and unlike in one transaction, keeping like_count and hot_score.
+
+    Both are idempotent: liking twice is a no-op through the unique
+    (post_id, user_id) index and unliking deletes nothing. Counters only
+    move by the rows actually inserted or deleted, whatever was asked.
+    """
+    liked = [pair for pair, like in changes.items() if like]
+    unliked = [pair for pair, like in changes.items() if not like]
+    created, removed = [], []
+
+    async with database.transaction():
+        for chunk in chunks(liked):
+            query = (
+                insert_ignoring_conflicts(like_table, ["post_id", "user_id"])
+                .values([{"post_id": post, "user_id": user} for post, user in chunk])
+                .returning(like_table.c.id, like_table.c.post_id, like_table.c.user_id)
+            )
+            created += await database.fetch_all(query)
+        for chunk in chunks(unliked):
+            query = (
+                like_table.delete()
+                .where(
+                    sqlalchemy.tuple_(like_table.c.post_id, like_table.c.user_id).in_(
+                        chunk
+                    )
+                )
+                .returning(like_table.c.post_id, like_table.c.user_id)
+            )
+            removed += await database.fetch_all(query)
+
+        deltas = Counter(row.post_id for row in created)
+        deltas.subtract(row.post_id for row in removed)
+        deltas = {post_id: delta for post_id, delta in deltas.items() if delta}
+        if deltas:
+            await increment_post_counter(database, post_table.c.like_count, deltas)
+            await refresh_hot_scores(database, deltas)
+
+    if created or removed:
+        response_cache.invalidate()
+    for row in created:
+        publish_post_event(
+            "post_liked",
+            row.post_id,
+            {"post_id": row.post_id, "user_id": row.user_id, "id": row.id},
+        )
+    for row in removed:
+        publish_post_event(
+            "post_unliked",
+            row.post_id,
+            {"post_id": row.post_id, "user_id": row.user_id},
+        )
+
+
+class LikeBuffer:
+    """Write-behind buffer that coalesces likes and unlikes.
+
+    During a spike every like would take the database write lock on its
+    own. Buffered, only the last like or unlike of a user on a post is kept
+    and everything pending is written by one ``apply_like_changes`` every
+    ``flush_interval`` seconds, so a post's counter is updated once per
+    flush however many likes it got.
+
+    When a flush fails its changes are written one at a time, so one bad
+    pair cannot hold back the others. A change that still fails is retried
+    with the next flushes and dropped after ``max_attempts``.
+
+    Pending changes are lost if the process dies, ``stop`` flushes them on
+    a graceful shutdown. Until a flush the likes are not visible to reads.
+    """
+
+    def __init__(
+        self,
+        database: Database = database,
+        flush_interval: float = config.LIKE_BUFFER_FLUSH_INTERVAL_SECONDS,
+        max_pending: int = config.LIKE_BUFFER_MAX_PENDING,
+        max_attempts: int = config.LIKE_BUFFER_MAX_ATTEMPTS,
+    ) -> None:
+        self.database = database
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self._pending: LikeChanges = {}
+        self._attempts: dict[tuple[int, int], int] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    def add(self, post_id: int, user_id: int, like: bool) -> None:
+        key = (post_id, user_id)
+        if key not in self._pending and len(self._pending) >= self.max_pending:
+            self._wakeup.set()
+            raise LikeBufferFullError("Like buffer is full")
+        self._pending[key] = like
+
+    async def _apply_each(self, changes: LikeChanges) -> LikeChanges:
+        failed = {}
+        for (post_id, user_id), like in changes.items():
+            try:
+                await apply_like_changes(self.database, {(post_id, user_id): like})
+            except Exception as e:
+                logger.warning(f"Like of post {post_id} by user {user_id}: {e!r}")
+                failed[post_id, user_id] = like
+        return failed
+
+    async def flush(self) -> LikeChanges:
+        """Write what is pending, return the changes given up on."""
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return {}
+        try:
+            await apply_like_changes(self.database, pending)
+            failed = {}
+        except Exception:
+            logger.exception(
+                f"Writing {len(pending)} buffered likes failed, "
+                "writing them one at a time"
+            )
+            failed = await self._apply_each(pending)
+
+        dropped = {}
+        for pair, like in pending.items():
+            attempts = self._attempts.pop(pair, 0) + 1
+            if pair not in failed:
+                continue
+            if attempts >= self.max_attempts:
+                dropped[pair] = like
+            else:
+                self._attempts[pair] = attempts
+                # a change made since the flush started is newer, it wins
+                self._pending.setdefault(pair, like)
+        if dropped:
+            logger.error(
+                f"Dropped {len(dropped)} buffered likes after "
+                f"{self.max_attempts} attempts: {sorted(dropped.items())}"
+            )
+        return dropped
+
+    async def run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> LikeChanges:
+        """Stop flushing in the background, return the changes that were lost.
+
+        Same as the email outbox, the running flush finishes and whatever
+        is still pending is written before returning, failed changes are
+        retried until written or dropped.
+        """
+        self._stopping = True
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        lost = {}
+        while self._pending:
+            lost.update(await self.flush())
+        self._stopping = False
+        return lost
+
+
+like_buffer = LikeBuffer(database)
@@ -1,5 +1,9 @@
+import importlib
 import logging
+import queue
 from logging.config import dictConfig
+from logging.handlers import QueueHandler, QueueListener
+from typing import Literal, Optional
 
 from trail.config import DevConfig, config
 
@@ -10,18 +14,100 @@ def ofscated_email(email, ofescated_length):
     return charec + ("*" * (len(first) - ofescated_length)) + "@" + last
 
 
+def ofescated_length() -> int:
+    # characters of an address left readable in logs, only in development
+    return 2 if isinstance(config, DevConfig) else 0
+
+
 class ofescated_email_filter(logging.Filter):
     def __init__(self, name: str = " ", ofescated_length: int = 2) -> None:
         super().__init__()
         self.ofescated_length = ofescated_length
 
     def filter(self, record: logging.LogRecord) -> bool:
-        if "email" in record.__dict__():
+        email = record.__dict__.get("email")
+        # login logs whatever was typed, which need not be an address
+        if isinstance(email, str) and email.count("@") == 1:
             record.email = ofscated_email(record.email, self.ofescated_length)
         return True
 
 
+class NonBlockingQueueHandler(QueueHandler):
+    """Hands records to a QueueListener thread that formats and writes them.
+
+    Filters still run in the caller, so context such as the correlation id
+    is captured, but formatting and I/O happen off the event loop. The queue
+    is bounded, when it is full a record is dropped and counted, or with the
+    ``block`` policy the caller waits for room.
+    """
+
+    def __init__(
+        self, queue_size: int, policy: Literal["drop", "block"] = "drop"
+    ) -> None:
+        super().__init__(queue.Queue(queue_size))
+        self.policy = policy
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # QueueHandler.prepare formats the message here, on the caller, the
+        # listener's handlers format it instead
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if self.policy == "block":
+                self.queue.put(record)
+            else:
+                self.dropped += 1
+
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional[NonBlockingQueueHandler] = None
+# dictConfig only hands its handlers out from 3.12 on, the factories below
+# keep the ones the listener needs
+_sink_handlers: list[logging.Handler] = []
+
+
+def queue_handler(**kwargs) -> NonBlockingQueueHandler:
+    global _queue_handler
+    _queue_handler = NonBlockingQueueHandler(**kwargs)
+    return _queue_handler
+
+
+def sink_handler(handler_class: str, **kwargs) -> logging.Handler:
+    module, _, name = handler_class.rpartition(".")
+    handler = getattr(importlib.import_module(module), name)(**kwargs)
+    _sink_handlers.append(handler)
+    return handler
+
+
+def dropped_log_records() -> int:
+    return _queue_handler.dropped if _queue_handler is not None else 0
+
+
+def stop_logging() -> None:
+    """Write out whatever is still queued and stop the listener thread.
+
+    The queue handler is detached as well, nothing would read what is put
+    on the queue any more.
+    """
+    global _listener, _queue_handler
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    if _queue_handler is not None:
+        for name in list(logging.root.manager.loggerDict):
+            logging.getLogger(name).removeHandler(_queue_handler)
+        logging.getLogger().removeHandler(_queue_handler)
+        _queue_handler = None
+    _sink_handlers.clear()
+
+
 def Config_logger() -> None:
+    global _listener
+    stop_logging()
     dictConfig(
         {
             "version": 1,
@@ -33,8 +119,8 @@ def Config_logger() -> None:
                     "default_value": "-",
                 },
                 "email": {
-                    (): ofescated_email_filter,
-                    "ofescated_length": 2 if isinstance(config, DevConfig) else 0,
+                    "()": ofescated_email_filter,
+                    "ofescated_length": ofescated_length(),
                 },
             },
             "formatters": {
@@ -55,30 +141,43 @@ def Config_logger() -> None:
                 },
             },
             "handlers": {
+                # loggers write to the queue, the listener thread feeds the
+                # sink handlers below
+                "queue": {
+                    "()": queue_handler,
+                    "queue_size": config.LOG_QUEUE_SIZE,
+                    "policy": config.LOG_QUEUE_POLICY,
+                    "filters": ["correlation_id", "email"],
+                },
                 "default": {
-                    "class": "rich.logging.RichHandler",
+                    "()": sink_handler,
+                    "handler_class": "rich.logging.RichHandler",
                     "level": "DEBUG",
                     "formatter": "console",
-                    "filters": ["correlation_id", "email"],
                 },
                 "rotating_file": {
-                    "class": "logging.handlers.RotatingFileHandler",
+                    "()": sink_handler,
+                    "handler_class": "logging.handlers.RotatingFileHandler",
                     "level": "DEBUG",
                     "formatter": "file",
                     "filename": "trail.log",
                     "encoding": "utf8",
-                    "filters": ["correlation_id", "email"],
                 },
             },
             "loggers": {
-                "uvicorn": {"handlers": ["default", "rotating_file"], "level": "INFO"},
+                "uvicorn": {"handlers": ["queue"], "level": "INFO"},
                 "trail": {
-                    "handlers": ["default", "rotating_file"],
+                    "handlers": ["queue"],
                     "level": "DEBUG" if isinstance(config, DevConfig) else "INFO",
                     "propagate": False,
                 },
-                "databases": {"handlers": ["default"], "level": "WARNING"},
-                "aiosqlite": {"handlers": ["default"], "level": "WARNING"},
+                "databases": {"handlers": ["queue"], "level": "WARNING"},
+                "aiosqlite": {"handlers": ["queue"], "level": "WARNING"},
             },
         }
     )
+
+    _listener = QueueListener(
+        _queue_handler.queue, *_sink_handlers, respect_handler_level=True
+    )
+    _listener.start()
@@ -1,34 +1,102 @@
 import logging
 from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Optional
 
-from asgi_correlation_id import CorrelationIdMiddleware
-from fastapi import FastAPI, HTTPException
-from fastapi.exception_handlers import http_exception_handler
+if TYPE_CHECKING:
+    from fastapi import FastAPI
 
-from trail.database import database
-from trail.logging_config import Config_logger
-from trail.routers.post import router as post_router
-from trail.routers.user import router as user_router
+    from trail.config import GlobalConfig
 
 logger = logging.getLogger(__name__)
 
+# importing this module is kept cheap, fastapi, the routers and everything
+# they pull in are imported by create_app and the I/O happens in lifespan
+
 
 @asynccontextmanager
-async def lifespan(app: FastAPI):
+async def lifespan(app: "FastAPI"):
+    from trail.config import config
+    from trail.database import database, read_database
+    from trail.email_outbox import email_outbox
+    from trail.http_client import close_http_client, get_http_client
+    from trail.jobs import job_watcher
+    from trail.likes import like_buffer
+    from trail.logging_config import Config_logger, stop_logging
+    from trail.security import password_pool
+
     Config_logger()
     await database.connect()
+    if read_database is not database:
+        await read_database.connect()
+    get_http_client()
+    email_outbox.start()
+    job_watcher.start()
+    if config.LIKE_BUFFER_ENABLED:
+        like_buffer.start()
     yield
+    # pending likes are written while the database is still connected
+    if await like_buffer.stop():
+        logger.error("Buffered likes were lost on shutdown")
+    await job_watcher.stop()
+    await email_outbox.stop()
+    await close_http_client()
+    if read_database is not database:
+        await read_database.disconnect()
     await database.disconnect()
+    password_pool.shutdown()
+    stop_logging()
+
+
+def create_app(config: Optional["GlobalConfig"] = None) -> "FastAPI":
+    """Build the application, with ``config`` instead of the ENV_STATE one."""
+    if config is not None:
+        from trail.config import set_config
+
+        set_config(config)
+
+    from asgi_correlation_id import CorrelationIdMiddleware
+    from fastapi import FastAPI, HTTPException
+    from fastapi.exception_handlers import http_exception_handler
+
+    from trail.metrics import MetricsMiddleware
+    from trail.response_cache import ResponseCacheMiddleware
+    from trail.routers.feed import router as feed_router
+    from trail.routers.metrics import router as metrics_router
+    from trail.routers.post import router as post_router
+    from trail.routers.search import router as search_router
+    from trail.routers.stream import router as stream_router
+    from trail.routers.user import router as user_router
+
+    app = FastAPI(lifespan=lifespan)
+
+    app.include_router(post_router)
+    app.include_router(user_router)
+    app.include_router(feed_router)
+    app.include_router(stream_router)
+    app.include_router(search_router)
+    app.include_router(metrics_router)
+    app.add_middleware(ResponseCacheMiddleware)
+    app.add_middleware(CorrelationIdMiddleware)
+    # outermost, so cached responses are timed as well
+    app.add_middleware(MetricsMiddleware)
+
+    @app.exception_handler(HTTPException)
+    async def http_exception_handler_logging(request, exc):
+        logger.error(f"There is error {exc.status_code}, {exc.detail}")
+        return await http_exception_handler(request, exc)
 
+    return app
 
-app = FastAPI(lifespan=lifespan)
 
-app.include_router(post_router)
-app.include_router(user_router)
-app.add_middleware(CorrelationIdMiddleware)
+_app: Optional["FastAPI"] = None
 
 
-@app.exception_handler(HTTPException)
-async def http_exception_handler_logging(request, exc):
-    logger.error(f"There is error {exc.status_code}, {exc.detail}")
-    return await http_exception_handler(request, exc)
+def __getattr__(name: str):
+    # ``uvicorn trail.main:app`` and ``from trail.main import app`` still work,
+    # the app is built the first time it is asked for
+    global _app
+    if name == "app":
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
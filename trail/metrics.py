@@ -0,0 +1,273 @@
+import asyncio
+import bisect
+import math
+import time
+from typing import Callable, Iterable, Optional
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+)
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    pairs = (f'{name}="{escape_label(value)}"' for name, value in zip(names, values))
+    return "{" + ",".join(pairs) + "}"
+
+
+def format_value(value: float) -> str:
+    return "+Inf" if value == math.inf else repr(float(value))
+
+
+class Counter:
+    """A total that only goes up, ``name`` ends in ``_total``."""
+
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labelvalues: str, amount: float = 1) -> None:
+        self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def samples(self) -> Iterable[str]:
+        for labelvalues, value in self._values.items():
+            labels = format_labels(self.labelnames, labelvalues)
+            yield f"{self.name}{labels} {format_value(value)}"
+
+
+class Gauge:
+    """A value read when the metrics are scraped, from ``func``."""
+
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, func: Callable[[], float]) -> None:
+        self.name = name
+        self.help = help
+        self.func = func
+
+    def samples(self) -> Iterable[str]:
+        yield f"{self.name} {format_value(self.func())}"
+
+
+class CounterFunc(Gauge):
+    """A total kept elsewhere, read when the metrics are scraped."""
+
+    type = "counter"
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Iterable[str] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # per label values: a count for every bucket and +Inf, sum, count
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        # an observation is a bisect and three additions, cheap enough to
+        # leave on for every request and statement
+        state = self._values.get(labelvalues)
+        if state is None:
+            state = self._values[labelvalues] = [[0] * (len(self.buckets) + 1), 0, 0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def samples(self) -> Iterable[str]:
+        names = self.labelnames + ("le",)
+        for labelvalues, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                labels = format_labels(names, labelvalues + (format_value(bound),))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = format_labels(self.labelnames, labelvalues)
+            yield f"{self.name}_sum{labels} {format_value(total)}"
+            yield f"{self.name}_count{labels} {count}"
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, object] = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """The Prometheus text exposition format, version 0.0.4."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+async def serve_metrics(host: str, port: int) -> asyncio.AbstractServer:
+    """Serve the registry over plain HTTP, for processes without the app.
+
+    Any request is answered with the metrics, that is all a scraper asks.
+    """
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            # the request line and headers, nothing in them changes the answer
+            await reader.readuntil(b"\r\n\r\n")
+            body = registry.render().encode()
+            writer.write(
+                b"HTTP/1.1 200 OK\r\n"
+                + f"Content-Type: {CONTENT_TYPE}\r\n".encode()
+                + f"Content-Length: {len(body)}\r\n".encode()
+                + b"Connection: close\r\n\r\n"
+                + body
+            )
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+
+http_request_duration = registry.register(
+    Histogram(
+        "http_request_duration_seconds",
+        "Time to answer a request, by route template and status",
+        ["method", "route", "status"],
+    )
+)
+db_query_duration = registry.register(
+    Histogram(
+        "db_query_duration_seconds",
+        "Time of a database statement, by method",
+        ["operation"],
+    )
+)
+password_hash_duration = registry.register(
+    Histogram(
+        "password_hash_duration_seconds",
+        "Time of a bcrypt hash or verify, waiting for a worker included",
+        ["operation"],
+        buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+    )
+)
+http_client_request_duration = registry.register(
+    Histogram(
+        "http_client_request_duration_seconds",
+        "Time of an outbound request, by host and status",
+        ["host", "status"],
+    )
+)
+job_queue_duration = registry.register(
+    Histogram(
+        "job_queue_duration_seconds",
+        "Time from when a job was due to when a worker leased it",
+        ["kind"],
+        buckets=(0.1, 0.5, 1, 5, 15, 60, 300, 900, 3600),
+    )
+)
+job_duration = registry.register(
+    Histogram(
+        "job_duration_seconds",
+        "Time to run a job, by kind and outcome",
+        ["kind", "status"],
+    )
+)
+email_queue_duration = registry.register(
+    Histogram(
+        "email_queue_duration_seconds",
+        "Time an email waited in the outbox before its batch was sent",
+        buckets=(0.1, 0.5, 1, 2.5, 5, 15, 60, 300),
+    )
+)
+email_messages_sent = registry.register(
+    Counter("email_outbox_messages_sent_total", "Emails accepted by Mailgun")
+)
+email_messages_failed = registry.register(
+    Counter("email_outbox_messages_failed_total", "Emails given up on")
+)
+rate_limited = registry.register(
+    Counter(
+        "rate_limited_requests_total",
+        "Requests answered 429 by the rate limiter, by quota",
+        ["quota"],
+    )
+)
+
+
+class MetricsMiddleware:
+    """Records the duration of every HTTP request.
+
+    The route label is the path template, such as ``/post/{post_id}``, so
+    the number of series stays bounded whatever the URLs requested.
+    """
+
+    def __init__(
+        self, app: ASGIApp, histogram: Histogram = http_request_duration
+    ) -> None:
+        self.app = app
+        self.histogram = histogram
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status: Optional[int] = None
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            self.histogram.observe(
+                time.perf_counter() - start,
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                str(status or 500),
+            )
@@ -0,0 +1,30 @@
+import argparse
+import asyncio
+import logging
+
+from trail.migrations import migrate
+
+logger = logging.getLogger(__name__)
+
+
+async def main() -> None:
+    from trail.config import config
+    from trail.database import create_database
+
+    parser = argparse.ArgumentParser(description="Apply pending schema migrations")
+    parser.add_argument("--to", type=int, help="stop after this version")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    # a connection of its own, the app's may roll everything back
+    database = create_database(config.DATABASE_URL)
+    await database.connect()
+    try:
+        applied = await migrate(database, args.to)
+    finally:
+        await database.disconnect()
+    logger.info(f"Applied migrations {applied}" if applied else "Schema is up to date")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
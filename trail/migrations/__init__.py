@@ -0,0 +1,97 @@
+import logging
+import time
+from typing import Optional
+
+import sqlalchemy
+from databases import Database
+
+from trail.migrations import (
+    v0001_initial,
+    v0002_post_counters,
+    v0003_unique_likes,
+    v0004_jobs,
+    v0005_hot_ranking,
+    v0006_search,
+    v0007_rate_limits,
+    v0008_feed,
+    v0009_job_events,
+    v0010_fanout_skipped,
+    v0011_job_completions,
+)
+from trail.migrations.operations import create_table
+
+logger = logging.getLogger(__name__)
+
+# every revision module has a ``version``, a docstring describing it, a
+# ``transactional`` flag and ``async def upgrade(database)``. Revisions are
+# written against their own snapshot of the tables they touch, so editing
+# trail.database never changes what an old revision does.
+MIGRATIONS = [
+    v0001_initial,
+    v0002_post_counters,
+    v0003_unique_likes,
+    v0004_jobs,
+    v0005_hot_ranking,
+    v0006_search,
+    v0007_rate_limits,
+    v0008_feed,
+    v0009_job_events,
+    v0010_fanout_skipped,
+    v0011_job_completions,
+]
+
+migration_table = sqlalchemy.Table(
+    "schema_migrations",
+    sqlalchemy.MetaData(),
+    sqlalchemy.Column("version", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("description", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("applied_at", sqlalchemy.Float, nullable=False),
+)
+
+# any constant works, it only has to be the same for every runner
+ADVISORY_LOCK_ID = 7_301_016
+
+
+async def applied_versions(database: Database) -> set[int]:
+    await create_table(database, migration_table)
+    query = sqlalchemy.select(migration_table.c.version)
+    return {row.version for row in await database.fetch_all(query)}
+
+
+async def apply(database: Database, migration) -> None:
+    description = migration.__doc__.strip().splitlines()[0]
+    logger.info(f"Applying migration {migration.version}: {description}")
+    await migration.upgrade(database)
+    await database.execute(
+        migration_table.insert().values(
+            version=migration.version,
+            description=description,
+            applied_at=time.time(),
+        )
+    )
+
+
+async def migrate(database: Database, target: Optional[int] = None) -> list[int]:
+    """Apply every pending revision up to ``target`` and return their versions."""
+    applied = []
+    async with database.connection():
+        if database.url.dialect == "postgresql":
+            # a second runner waits here instead of racing the first
+            await database.execute(f"SELECT pg_advisory_lock({ADVISORY_LOCK_ID})")
+        try:
+            done = await applied_versions(database)
+            for migration in MIGRATIONS:
+                if migration.version in done:
+                    continue
+                if target is not None and migration.version > target:
+                    break
+                if migration.transactional:
+                    async with database.transaction():
+                        await apply(database, migration)
+                else:
+                    await apply(database, migration)
+                applied.append(migration.version)
+        finally:
+            if database.url.dialect == "postgresql":
+                await database.execute(f"SELECT pg_advisory_unlock({ADVISORY_LOCK_ID})")
+    return applied
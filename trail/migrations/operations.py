@@ -0,0 +1,101 @@
+from typing import AsyncIterator
+
+import sqlalchemy
+from databases import Database
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.schema import CreateColumn, CreateIndex, CreateTable, DropIndex
+
+# rows a backfill statement touches at most, each batch commits on its own so
+# locks on a large table are only held for one batch
+BACKFILL_BATCH_SIZE = 10_000
+
+
+def get_dialect(database: Database) -> sqlalchemy.engine.Dialect:
+    if database.url.dialect == "postgresql":
+        return postgresql.dialect()
+    return sqlite.dialect()
+
+
+async def create_table(database: Database, table: sqlalchemy.Table) -> None:
+    await database.execute(CreateTable(table, if_not_exists=True))
+
+
+async def create_index(
+    database: Database,
+    table: sqlalchemy.Table,
+    name: str,
+    *columns: str,
+    unique: bool = False,
+) -> None:
+    """Create an index unless it exists.
+
+    On Postgres the index is built CONCURRENTLY so writes to a large table
+    are not blocked, which only works outside a transaction. Migrations that
+    index large tables are therefore not transactional.
+
+    A concurrent build that fails or is interrupted leaves an INVALID index
+    behind, which IF NOT EXISTS would then skip forever, so such an index is
+    dropped and built again.
+    """
+    index = sqlalchemy.Index(
+        name,
+        *(table.c[column] for column in columns),
+        unique=unique,
+        postgresql_concurrently=True,
+    )
+    if database.url.dialect == "postgresql":
+        query = sqlalchemy.text(
+            "SELECT pg_index.indisvalid FROM pg_index "
+            "JOIN pg_class ON pg_class.oid = pg_index.indexrelid "
+            "WHERE pg_class.relname = :name"
+        ).bindparams(name=name)
+        if await database.fetch_val(query) is False:
+            await database.execute(DropIndex(index, if_exists=True))
+    await database.execute(CreateIndex(index, if_not_exists=True))
+
+
+async def drop_index(database: Database, name: str) -> None:
+    """Drop an index if it exists, CONCURRENTLY on Postgres."""
+    index = sqlalchemy.Index(name, postgresql_concurrently=True)
+    await database.execute(DropIndex(index, if_exists=True))
+
+
+async def column_exists(database: Database, table: str, column: str) -> bool:
+    if database.url.dialect == "postgresql":
+        query = sqlalchemy.text(
+            "SELECT 1 FROM information_schema.columns "
+            "WHERE table_name = :table AND column_name = :column"
+        ).bindparams(table=table, column=column)
+        return await database.fetch_val(query) is not None
+
+    rows = await database.fetch_all(f'PRAGMA table_info("{table}")')
+    return any(row.name == column for row in rows)
+
+
+async def add_column(database: Database, table: sqlalchemy.Table, column: str) -> None:
+    """Add ``table.c[column]`` unless it is already there.
+
+    A NOT NULL column needs a server_default. On Postgres 11+ and SQLite
+    adding such a column does not rewrite the table.
+    """
+    if await column_exists(database, table.name, column):
+        return
+    dialect = get_dialect(database)
+    table_name = dialect.identifier_preparer.format_table(table)
+    definition = CreateColumn(table.c[column]).compile(dialect=dialect)
+    await database.execute(f"ALTER TABLE {table_name} ADD COLUMN {definition}")
+
+
+async def id_ranges(
+    database: Database, table: sqlalchemy.Table
+) -> AsyncIterator[tuple[int, int]]:
+    """Inclusive ranges of ``table.c.id`` of BACKFILL_BATCH_SIZE ids each."""
+    query = sqlalchemy.select(
+        sqlalchemy.func.min(table.c.id).label("low"),
+        sqlalchemy.func.max(table.c.id).label("high"),
+    )
+    bounds = await database.fetch_one(query)
+    if bounds.low is None:
+        return
+    for start in range(bounds.low, bounds.high + 1, BACKFILL_BATCH_SIZE):
+        yield start, start + BACKFILL_BATCH_SIZE - 1
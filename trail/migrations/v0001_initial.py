@@ -0,0 +1,52 @@
+"""Create the users, POST, COMMENT and likes tables."""
+
+import sqlalchemy
+from databases import Database
+
+from trail.migrations.operations import create_table
+
+version = 1
+transactional = True
+
+metadata = sqlalchemy.MetaData()
+
+user_table = sqlalchemy.Table(
+    "users",
+    metadata,
+    sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("email", sqlalchemy.String, unique=True),
+    sqlalchemy.Column("password", sqlalchemy.String),
+    sqlalchemy.Column("confirmed", sqlalchemy.Boolean),
+)
+
+post_table = sqlalchemy.Table(
+    "POST",
+    metadata,
+    sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("body", sqlalchemy.String),
+    sqlalchemy.Column("user_id", sqlalchemy.ForeignKey("users.id"), nullable=False),
+    sqlalchemy.Column("url_link", sqlalchemy.String),
+)
+
+comment_table = sqlalchemy.Table(
+    "COMMENT",
+    metadata,
+    sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("body", sqlalchemy.String),
+    sqlalchemy.Column("post_id", sqlalchemy.ForeignKey("POST.id"), nullable=False),
+    sqlalchemy.Column("user_id", sqlalchemy.ForeignKey("users.id"), nullable=False),
+)
+
+like_table = sqlalchemy.Table(
+    "likes",
+    metadata,
+    sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("post_id", sqlalchemy.ForeignKey("POST.id"), nullable=False),
+    sqlalchemy.Column("user_id", sqlalchemy.ForeignKey("users.id"), nullable=False),
+)
+
+
+async def upgrade(database: Database) -> None:
+    # databases created by the old metadata.create_all already have these
+    for table in metadata.sorted_tables:
+        await create_table(database, table)
@@ -0,0 +1,67 @@
+"""Add POST.like_count and POST.comment_count and the lookup indexes."""
+
+import sqlalchemy
+from databases import Database
+
+from trail.migrations.operations import add_column, create_index, id_ranges
+
+version = 2
+transactional = False
+
+metadata = sqlalchemy.MetaData()
+
+post_table = sqlalchemy.Table(
+    "POST",
+    metadata,
+    sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column(
+        "like_count", sqlalchemy.Integer, nullable=False, server_default="0"
+    ),
+    sqlalchemy.Column(
+        "comment_count", sqlalchemy.Integer, nullable=False, server_default="0"
+    ),
+)
+
+comment_table = sqlalchemy.Table(
+    "COMMENT",
+    metadata,
+    sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("post_id", sqlalchemy.Integer),
+)
+
+like_table = sqlalchemy.Table(
+    "likes",
+    metadata,
+    sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("post_id", sqlalchemy.Integer),
+    sqlalchemy.Column("user_id", sqlalchemy.Integer),
+)
+
+
+async def upgrade(database: Database) -> None:
+    await add_column(database, post_table, "like_count")
+    await add_column(database, post_table, "comment_count")
+    # counting comments per post below reads it
+    await create_index(database, comment_table, "ix_COMMENT_post_id", "post_id")
+
+    likes = (
+        sqlalchemy.select(sqlalchemy.func.count(like_table.c.id))
+        .where(like_table.c.post_id == post_table.c.id)
+        .scalar_subquery()
+    )
+    comments = (
+        sqlalchemy.select(sqlalchemy.func.count(comment_table.c.id))
+        .where(comment_table.c.post_id == post_table.c.id)
+        .scalar_subquery()
+    )
+    async for low, high in id_ranges(database, post_table):
+        await database.execute(
+            post_table.update()
+            .where(post_table.c.id.between(low, high))
+            .values(like_count=likes, comment_count=comments)
+        )
+
+    await create_index(
+        database, post_table, "ix_POST_like_count_id", "like_count", "id"
+    )
+    await create_index(database, like_table, "ix_likes_user_id", "user_id")
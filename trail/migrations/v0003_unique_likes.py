@@ -0,0 +1,66 @@
+"""Remove duplicate likes and make (post_id, user_id) unique."""
+
+import sqlalchemy
+from databases import Database
+
+from trail.migrations.operations import create_index, id_ranges
+
+version = 3
+transactional = False
+
+metadata = sqlalchemy.MetaData()
+
+post_table = sqlalchemy.Table(
+    "POST",
+    metadata,
+    sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("like_count", sqlalchemy.Integer),
+)
+
+like_table = sqlalchemy.Table(
+    "likes",
+    metadata,
+    sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("post_id", sqlalchemy.Integer),
+    sqlalchemy.Column("user_id", sqlalchemy.Integer),
+)
+
+
+async def upgrade(database: Database) -> None:
+    # the first like of every (post_id, user_id) pair is kept, an earlier
+    # one is found through ix_likes_user_id
+    earlier = like_table.alias("earlier")
+    duplicate = (
+        sqlalchemy.select(earlier.c.id)
+        .where(
+            earlier.c.user_id == like_table.c.user_id,
+            earlier.c.post_id == like_table.c.post_id,
+            earlier.c.id < like_table.c.id,
+        )
+        .exists()
+    )
+    async for low, high in id_ranges(database, like_table):
+        await database.execute(
+            like_table.delete().where(like_table.c.id.between(low, high), duplicate)
+        )
+
+    likes = (
+        sqlalchemy.select(sqlalchemy.func.count(like_table.c.id))
+        .where(like_table.c.post_id == post_table.c.id)
+        .scalar_subquery()
+    )
+    async for low, high in id_ranges(database, post_table):
+        await database.execute(
+            post_table.update()
+            .where(post_table.c.id.between(low, high))
+            .values(like_count=likes)
+        )
+
+    await create_index(
+        database,
+        like_table,
+        "ix_likes_post_id_user_id",
+        "post_id",
+        "user_id",
+        unique=True,
+    )
@@ -0,0 +1,43 @@
+"""Create the jobs table of the background job queue."""
+
+import sqlalchemy
+from databases import Database
+
+from trail.migrations.operations import create_index, create_table
+
+version = 4
+transactional = False
+
+metadata = sqlalchemy.MetaData()
+
+post_table = sqlalchemy.Table(
+    "POST", metadata, sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True)
+)
+
+job_table = sqlalchemy.Table(
+    "jobs",
+    metadata,
+    sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("kind", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("payload", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("post_id", sqlalchemy.ForeignKey("POST.id")),
+    sqlalchemy.Column(
+        "status", sqlalchemy.String, nullable=False, server_default="queued"
+    ),
+    sqlalchemy.Column(
+        "attempts", sqlalchemy.Integer, nullable=False, server_default="0"
+    ),
+    sqlalchemy.Column("max_attempts", sqlalchemy.Integer, nullable=False),
+    sqlalchemy.Column("run_at", sqlalchemy.Float, nullable=False),
+    sqlalchemy.Column("leased_until", sqlalchemy.Float),
+    sqlalchemy.Column("lease_token", sqlalchemy.String),
+    sqlalchemy.Column("last_error", sqlalchemy.String),
+    sqlalchemy.Column("created_at", sqlalchemy.Float, nullable=False),
+    sqlalchemy.Column("updated_at", sqlalchemy.Float, nullable=False),
+)
+
+
+async def upgrade(database: Database) -> None:
+    await create_table(database, job_table)
+    await create_index(database, job_table, "ix_jobs_post_id", "post_id")
+    await create_index(database, job_table, "ix_jobs_status_run_at", "status", "run_at")
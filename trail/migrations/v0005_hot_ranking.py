@@ -0,0 +1,61 @@
+"""Add POST.created_at and POST.hot_score for the hot ordering."""
+
+import math
+
+import sqlalchemy
+from databases import Database
+
+from trail.config import config
+from trail.migrations.operations import add_column, create_index
+
+version = 5
+transactional = False
+
+metadata = sqlalchemy.MetaData()
+
+post_table = sqlalchemy.Table(
+    "POST",
+    metadata,
+    sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("like_count", sqlalchemy.Integer),
+    sqlalchemy.Column("created_at", sqlalchemy.Float),
+    sqlalchemy.Column(
+        "hot_score", sqlalchemy.Float, nullable=False, server_default="0"
+    ),
+)
+
+
+async def rebuild_hot_scores(database: Database, batch_size: int = 1000) -> None:
+    # the hot_score of trail.ranking as of this revision
+    last_id = 0
+    while True:
+        query = (
+            sqlalchemy.select(
+                post_table.c.id, post_table.c.like_count, post_table.c.created_at
+            )
+            .where(post_table.c.id > last_id)
+            .order_by(post_table.c.id)
+            .limit(batch_size)
+        )
+        rows = await database.fetch_all(query)
+        if not rows:
+            return
+        scores = {
+            row.id: math.log10((row.like_count or 0) + 1)
+            + (row.created_at or 0) / config.HOT_DECAY_SECONDS
+            for row in rows
+        }
+        await database.execute(
+            post_table.update()
+            .where(post_table.c.id.in_(scores))
+            .values(hot_score=sqlalchemy.case(scores, value=post_table.c.id))
+        )
+        last_id = rows[-1].id
+
+
+async def upgrade(database: Database) -> None:
+    await add_column(database, post_table, "created_at")
+    await add_column(database, post_table, "hot_score")
+    # older posts have no created_at and rank by likes alone
+    await rebuild_hot_scores(database)
+    await create_index(database, post_table, "ix_POST_hot_score_id", "hot_score", "id")
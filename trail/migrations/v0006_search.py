@@ -0,0 +1,61 @@
+"""Create the post and comment full text indexes."""
+
+from databases import Database
+
+version = 6
+transactional = True
+
+# full text indexes over POST.body and COMMENT.body, external content tables
+# so the text is not stored twice, kept in sync by triggers so every insert
+# path, batches included, is indexed in the same transaction. SQLite only
+SEARCH_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS post_fts USING fts5(
+        body, content='POST', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS comment_fts USING fts5(
+        body, post_id UNINDEXED, content='COMMENT', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS post_fts_insert AFTER INSERT ON "POST" BEGIN
+        INSERT INTO post_fts (rowid, body) VALUES (new.id, new.body);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS post_fts_delete AFTER DELETE ON "POST" BEGIN
+        INSERT INTO post_fts (post_fts, rowid, body)
+        VALUES ('delete', old.id, old.body);
+    END""",
+    # only body changes reindex, counter updates leave the index alone
+    """CREATE TRIGGER IF NOT EXISTS post_fts_update AFTER UPDATE OF body ON "POST"
+    BEGIN
+        INSERT INTO post_fts (post_fts, rowid, body)
+        VALUES ('delete', old.id, old.body);
+        INSERT INTO post_fts (rowid, body) VALUES (new.id, new.body);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS comment_fts_insert AFTER INSERT ON "COMMENT"
+    BEGIN
+        INSERT INTO comment_fts (rowid, body, post_id)
+        VALUES (new.id, new.body, new.post_id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS comment_fts_delete AFTER DELETE ON "COMMENT"
+    BEGIN
+        INSERT INTO comment_fts (comment_fts, rowid, body, post_id)
+        VALUES ('delete', old.id, old.body, old.post_id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS comment_fts_update
+    AFTER UPDATE OF body, post_id ON "COMMENT" BEGIN
+        INSERT INTO comment_fts (comment_fts, rowid, body, post_id)
+        VALUES ('delete', old.id, old.body, old.post_id);
+        INSERT INTO comment_fts (rowid, body, post_id)
+        VALUES (new.id, new.body, new.post_id);
+    END""",
+]
+
+
+async def upgrade(database: Database) -> None:
+    if database.url.dialect != "sqlite":
+        return
+    for statement in SEARCH_DDL:
+        await database.execute(statement)
+    # index the posts and comments written before the tables existed
+    for table in ("post_fts", "comment_fts"):
+        await database.execute(f"INSERT INTO {table} ({table}) VALUES ('rebuild')")
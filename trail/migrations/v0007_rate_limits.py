@@ -0,0 +1,23 @@
+"""Create the rate_limits table of the shared rate limit store."""
+
+import sqlalchemy
+from databases import Database
+
+from trail.migrations.operations import create_index, create_table
+
+version = 7
+transactional = False
+
+metadata = sqlalchemy.MetaData()
+
+rate_limit_table = sqlalchemy.Table(
+    "rate_limits",
+    metadata,
+    sqlalchemy.Column("key", sqlalchemy.String, primary_key=True),
+    sqlalchemy.Column("tat", sqlalchemy.Float, nullable=False),
+)
+
+
+async def upgrade(database: Database) -> None:
+    await create_table(database, rate_limit_table)
+    await create_index(database, rate_limit_table, "ix_rate_limits_tat", "tat")
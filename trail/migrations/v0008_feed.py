@@ -0,0 +1,60 @@
+"""Add follows, the timeline table and users.follower_count for the home feed."""
+
+import sqlalchemy
+from databases import Database
+
+from trail.migrations.operations import add_column, create_index, create_table
+
+version = 8
+transactional = False
+
+metadata = sqlalchemy.MetaData()
+
+user_table = sqlalchemy.Table(
+    "users",
+    metadata,
+    sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column(
+        "follower_count", sqlalchemy.Integer, nullable=False, server_default="0"
+    ),
+)
+
+post_table = sqlalchemy.Table(
+    "POST",
+    metadata,
+    sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("user_id", sqlalchemy.Integer, nullable=False),
+)
+
+follow_table = sqlalchemy.Table(
+    "follows",
+    metadata,
+    sqlalchemy.Column(
+        "follower_id", sqlalchemy.ForeignKey("users.id"), primary_key=True
+    ),
+    sqlalchemy.Column(
+        "followee_id", sqlalchemy.ForeignKey("users.id"), primary_key=True
+    ),
+    sqlalchemy.Column("created_at", sqlalchemy.Float, nullable=False),
+)
+
+timeline_table = sqlalchemy.Table(
+    "timeline",
+    metadata,
+    sqlalchemy.Column("user_id", sqlalchemy.ForeignKey("users.id"), primary_key=True),
+    sqlalchemy.Column("post_id", sqlalchemy.ForeignKey("POST.id"), primary_key=True),
+)
+
+
+async def upgrade(database: Database) -> None:
+    await add_column(database, user_table, "follower_count")
+    await create_table(database, follow_table)
+    await create_table(database, timeline_table)
+    await create_index(
+        database,
+        follow_table,
+        "ix_follows_followee_id_follower_id",
+        "followee_id",
+        "follower_id",
+    )
+    await create_index(database, post_table, "ix_POST_user_id_id", "user_id", "id")
@@ -0,0 +1,25 @@
+"""Index finished jobs by status and updated_at for the web processes."""
+
+import sqlalchemy
+from databases import Database
+
+from trail.migrations.operations import create_index
+
+version = 9
+transactional = False
+
+metadata = sqlalchemy.MetaData()
+
+job_table = sqlalchemy.Table(
+    "jobs",
+    metadata,
+    sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("status", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("updated_at", sqlalchemy.Float, nullable=False),
+)
+
+
+async def upgrade(database: Database) -> None:
+    await create_index(
+        database, job_table, "ix_jobs_status_updated_at", "status", "updated_at"
+    )
@@ -0,0 +1,35 @@
+"""Add users.fanout_skipped, authors with posts missing from timelines."""
+
+import sqlalchemy
+from databases import Database
+
+from trail.config import config
+from trail.migrations.operations import add_column
+
+version = 10
+transactional = True
+
+metadata = sqlalchemy.MetaData()
+
+user_table = sqlalchemy.Table(
+    "users",
+    metadata,
+    sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("follower_count", sqlalchemy.Integer, nullable=False),
+    sqlalchemy.Column(
+        "fanout_skipped",
+        sqlalchemy.Boolean,
+        nullable=False,
+        server_default=sqlalchemy.false(),
+    ),
+)
+
+
+async def upgrade(database: Database) -> None:
+    await add_column(database, user_table, "fanout_skipped")
+    # the posts of authors above the limit were never fanned out
+    await database.execute(
+        user_table.update()
+        .where(user_table.c.follower_count > config.FEED_FANOUT_MAX_FOLLOWERS)
+        .values(fanout_skipped=True)
+    )
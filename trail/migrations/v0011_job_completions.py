@@ -0,0 +1,28 @@
+"""Record finished jobs in job_completions for the web processes."""
+
+import sqlalchemy
+from databases import Database
+
+from trail.migrations.operations import create_table, drop_index
+
+version = 11
+transactional = False
+
+metadata = sqlalchemy.MetaData()
+
+job_completion_table = sqlalchemy.Table(
+    "job_completions",
+    metadata,
+    sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("job_id", sqlalchemy.Integer, nullable=False),
+    sqlalchemy.Column("kind", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("post_id", sqlalchemy.Integer),
+    sqlalchemy.Column("created_at", sqlalchemy.Float, nullable=False),
+    sqlite_autoincrement=True,
+)
+
+
+async def upgrade(database: Database) -> None:
+    await create_table(database, job_completion_table)
+    # web processes polled jobs by it, they read job_completions now
+    await drop_index(database, "ix_jobs_status_updated_at")
@@ -0,0 +1,6 @@
+from pydantic import BaseModel
+
+
+class Follow(BaseModel):
+    follower_id: int
+    followee_id: int
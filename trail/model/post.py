@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Literal, Optional
 
 from pydantic import BaseModel, ConfigDict
 
@@ -27,11 +27,31 @@ class Comment(CommentIn):
 
 class PostLikeWithPost(UserPost):
     likes: int
+    comment_count: int = 0
+
+
+class PostPage(BaseModel):
+    posts: list[PostLikeWithPost]
+    next_cursor: Optional[str] = None
+
+
+class CommentPage(BaseModel):
+    comments: list[Comment]
+    next_cursor: Optional[str] = None
 
 
 class UserPostWithComments(BaseModel):
     post: PostLikeWithPost
     comments: list[Comment]
+    comments_cursor: Optional[str] = None
+
+
+class PostImageStatus(BaseModel):
+    post_id: int
+    status: Literal["none", "queued", "running", "succeeded", "failed"]
+    url_link: Optional[str] = None
+    attempts: int = 0
+    last_error: Optional[str] = None
 
 
 class PostLikeIn(BaseModel):
@@ -39,5 +59,19 @@ class PostLikeIn(BaseModel):
 
 
 class PostLike(PostLikeIn):
-    id: int
+    # None while the like waits in the like buffer
+    id: Optional[int] = None
     user_id: int
+
+
+class BatchItemResult(BaseModel):
+    index: int
+    status: Literal["created", "exists", "failed"]
+    id: Optional[int] = None
+    detail: Optional[str] = None
+
+
+class BatchResult(BaseModel):
+    created: int
+    failed: int
+    results: list[BatchItemResult]
@@ -0,0 +1,16 @@
+from typing import Literal, Optional
+
+from pydantic import BaseModel
+
+
+class SearchHit(BaseModel):
+    kind: Literal["post", "comment"]
+    id: int
+    post_id: int
+    body: str
+    rank: float
+
+
+class SearchPage(BaseModel):
+    results: list[SearchHit]
+    next_cursor: Optional[str] = None
@@ -0,0 +1,41 @@
+import base64
+import binascii
+import json
+
+from fastapi import HTTPException, status
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def create_cursor_exception() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST, detail="Cursor is not valid"
+    )
+
+
+def encode_cursor(kind: str, *keys) -> str:
+    # the cursor is opaque for clients, it only carries the sort keys of the
+    # last row of a page together with the ordering it was created for
+    raw = json.dumps({"k": kind, "v": list(keys)}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, kind: str, size: int) -> list:
+    padded = cursor + "=" * (-len(cursor) % 4)
+    try:
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, ValueError) as e:
+        raise create_cursor_exception() from e
+
+    if not isinstance(data, dict) or data.get("k") != kind:
+        raise create_cursor_exception()
+
+    keys = data.get("v")
+    if not isinstance(keys, list) or len(keys) != size:
+        raise create_cursor_exception()
+
+    if not all(isinstance(key, (int, float)) for key in keys):
+        raise create_cursor_exception()
+
+    return keys
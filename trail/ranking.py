@@ -0,0 +1,54 @@
+import math
+from typing import Iterable, Optional
+
+import sqlalchemy
+from databases import Database
+
+from trail.config import config
+from trail.database import post_table
+
+
+def hot_score(likes: int, created_at: Optional[float]) -> float:
+    """Time decayed popularity, a post has to gather ten times the likes to
+    rank with one HOT_DECAY_SECONDS newer.
+
+    The age term is measured from the epoch rather than from now, so a post's
+    score only changes when it is liked and ordering by the stored column
+    still decays older posts.
+    """
+    return math.log10(likes + 1) + (created_at or 0) / config.HOT_DECAY_SECONDS
+
+
+async def refresh_hot_scores(database: Database, post_ids: Iterable[int]) -> None:
+    query = sqlalchemy.select(
+        post_table.c.id, post_table.c.like_count, post_table.c.created_at
+    ).where(post_table.c.id.in_(set(post_ids)))
+    scores = {
+        row.id: hot_score(row.like_count, row.created_at)
+        for row in await database.fetch_all(query)
+    }
+    if not scores:
+        return
+
+    query = (
+        post_table.update()
+        .where(post_table.c.id.in_(scores))
+        .values(hot_score=sqlalchemy.case(scores, value=post_table.c.id))
+    )
+    await database.execute(query)
+
+
+async def rebuild_hot_scores(database: Database, batch_size: int = 1000) -> None:
+    last_id = 0
+    while True:
+        query = (
+            sqlalchemy.select(post_table.c.id)
+            .where(post_table.c.id > last_id)
+            .order_by(post_table.c.id)
+            .limit(batch_size)
+        )
+        post_ids = [row.id for row in await database.fetch_all(query)]
+        if not post_ids:
+            return
+        await refresh_hot_scores(database, post_ids)
+        last_id = post_ids[-1]
@@ -0,0 +1,261 @@
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict
+from typing import Annotated, NamedTuple, Protocol
+
+import sqlalchemy
+from databases import Database
+from fastapi import Depends, HTTPException, Request, Response, status
+
+from trail.config import config
+from trail.database import dialect_insert, rate_limit_table
+from trail.metrics import rate_limited
+from trail.model.user import User
+from trail.security import get_current_user
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Allows ``rate`` operations per second with bursts of up to ``capacity``."""
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens: float = 1) -> float:
+        """Take ``tokens`` if available and return 0, else the seconds to wait."""
+        self._refill()
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return 0
+        return (tokens - self.tokens) / self.rate
+
+    async def acquire(self, tokens: float = 1) -> None:
+        while (wait := self.try_acquire(tokens)) > 0:
+            await asyncio.sleep(wait)
+
+
+class RateLimitResult(NamedTuple):
+    allowed: bool
+    remaining: int
+    # seconds until the bucket is full again
+    reset: float
+    # seconds until the next request would be allowed, 0 when allowed
+    retry_after: float
+
+
+class RateLimitStore(Protocol):
+    async def hit(
+        self, key: str, rate: float, capacity: float, tokens: int = 1
+    ) -> RateLimitResult: ...
+
+    async def clear(self) -> None: ...
+
+
+class MemoryRateLimitStore:
+    """Token buckets in this process, for a single node.
+
+    At most ``max_keys`` buckets are kept, the least recently used one is
+    dropped first. A dropped bucket comes back full, so eviction can only
+    make the limit more lenient, never lock a client out.
+    """
+
+    def __init__(self, max_keys: int = config.RATE_LIMIT_MAX_KEYS) -> None:
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, TokenBucket] = OrderedDict()
+
+    async def hit(
+        self, key: str, rate: float, capacity: float, tokens: int = 1
+    ) -> RateLimitResult:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(rate, capacity)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        self._buckets.move_to_end(key)
+
+        wait = bucket.try_acquire(tokens)
+        return RateLimitResult(
+            allowed=wait == 0,
+            remaining=int(bucket.tokens),
+            reset=(capacity - bucket.tokens) / rate,
+            retry_after=wait,
+        )
+
+    async def clear(self) -> None:
+        self._buckets.clear()
+
+
+class DatabaseRateLimitStore:
+    """Limits shared by every node through the rate_limits table.
+
+    Uses GCRA, a token bucket that stores one timestamp per key: ``tat`` is
+    when the bucket will be full again. A hit moves it forward by one
+    emission interval per token, and is refused when that would put it
+    further than ``capacity`` intervals ahead of now. Checking and updating is a single
+    upsert, so concurrent hits from several nodes cannot overspend.
+    """
+
+    def __init__(self, database: Database, prune_every: int = 1000) -> None:
+        self.database = database
+        self.prune_every = prune_every
+        self._hits = 0
+
+    def _greatest(self, *args):
+        if self.database.url.dialect == "postgresql":
+            return sqlalchemy.func.greatest(*args)
+        # SQLite's max() with several arguments is the scalar maximum
+        return sqlalchemy.func.max(*args)
+
+    async def hit(
+        self, key: str, rate: float, capacity: float, tokens: int = 1
+    ) -> RateLimitResult:
+        now = time.time()
+        interval = 1 / rate
+        window = capacity * interval
+        cost = tokens * interval
+        tat = self._greatest(rate_limit_table.c.tat, now) + cost
+        query = (
+            dialect_insert(rate_limit_table)
+            .values(key=key, tat=now + cost)
+            .on_conflict_do_update(
+                index_elements=["key"], set_={"tat": tat}, where=tat <= now + window
+            )
+            .returning(rate_limit_table.c.tat)
+        )
+        new_tat = await self.database.fetch_val(query)
+
+        self._hits += 1
+        if self._hits % self.prune_every == 0:
+            await self.prune(now)
+
+        if new_tat is not None:
+            return RateLimitResult(
+                allowed=True,
+                remaining=int((window - (new_tat - now)) / interval),
+                reset=new_tat - now,
+                retry_after=0,
+            )
+
+        current = await self.database.fetch_val(
+            sqlalchemy.select(rate_limit_table.c.tat).where(
+                rate_limit_table.c.key == key
+            )
+        )
+        current = max(current or now, now)
+        return RateLimitResult(
+            allowed=False,
+            remaining=0,
+            reset=current - now,
+            retry_after=max(current + cost - now - window, 0),
+        )
+
+    async def prune(self, now: float) -> None:
+        # a key whose tat has passed has a full bucket, same as no row
+        await self.database.execute(
+            rate_limit_table.delete().where(rate_limit_table.c.tat < now)
+        )
+
+    async def clear(self) -> None:
+        await self.database.execute(rate_limit_table.delete())
+
+
+def create_rate_limit_store() -> RateLimitStore:
+    if config.RATE_LIMIT_STORE == "database":
+        from trail.database import database
+
+        return DatabaseRateLimitStore(database)
+    return MemoryRateLimitStore()
+
+
+rate_limit_store = create_rate_limit_store()
+
+
+def client_ip(request: Request) -> str:
+    # behind a proxy this is the proxy, run uvicorn with --forwarded-allow-ips
+    # so X-Forwarded-For is applied to the client address
+    return request.client.host if request.client else "unknown"
+
+
+def with_rate_limit_headers(returned: Response, response: Response) -> Response:
+    """Copy the RateLimit headers set on ``response`` onto ``returned``.
+
+    FastAPI only adds the headers of the dependencies' response to the
+    responses it builds, a route returning its own Response has to do it.
+    """
+    returned.headers.update(response.headers)
+    return returned
+
+
+class RateLimit:
+    """Dependency allowing ``per_minute`` requests per client IP.
+
+    Every answer carries the RateLimit-Limit, RateLimit-Remaining and
+    RateLimit-Reset headers, a refused request is answered 429 with
+    Retry-After. Routes sharing a ``quota`` share the same buckets.
+
+    A batch route calls ``check`` itself with one token per item, so a
+    batch costs as much as sending its items one by one.
+    """
+
+    def __init__(self, quota: str, per_minute: int) -> None:
+        self.quota = quota
+        self.per_minute = per_minute
+
+    async def check(self, key: str, response: Response, tokens: int = 1) -> None:
+        if not config.RATE_LIMIT_ENABLED:
+            return
+        if tokens > self.per_minute:
+            # would never fit in the bucket, waiting does not help
+            raise HTTPException(
+                status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+                detail=f"At most {self.per_minute} items are allowed per minute",
+            )
+
+        result = await rate_limit_store.hit(
+            f"{self.quota}:{key}", self.per_minute / 60, self.per_minute, tokens
+        )
+        headers = {
+            "RateLimit-Limit": str(self.per_minute),
+            "RateLimit-Remaining": str(result.remaining),
+            "RateLimit-Reset": str(math.ceil(result.reset)),
+        }
+        if not result.allowed:
+            rate_limited.inc(self.quota)
+            logger.warning(f"Rate limit of {self.quota} exceeded by {key}")
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests",
+                headers={
+                    **headers,
+                    "Retry-After": str(math.ceil(result.retry_after)),
+                },
+            )
+        response.headers.update(headers)
+
+    async def __call__(self, request: Request, response: Response) -> None:
+        await self.check(f"ip:{client_ip(request)}", response)
+
+
+class UserRateLimit(RateLimit):
+    """Dependency allowing ``per_minute`` requests per authenticated user."""
+
+    async def __call__(
+        self,
+        response: Response,
+        user: Annotated[User, Depends(get_current_user)],
+    ) -> None:
+        await self.check_user(user, response)
+
+    async def check_user(self, user: User, response: Response, tokens: int = 1) -> None:
+        await self.check(f"user:{user.id}", response, tokens)
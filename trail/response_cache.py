@@ -0,0 +1,136 @@
+import hashlib
+import re
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from trail.cache import TTLCache
+from trail.config import config
+
+CACHED_PATHS = re.compile(r"^/post(/\d+(/comments)?)?$")
+
+
+class ResponseCache:
+    """Serialized bodies of public GET responses, keyed by path and query.
+
+    Every write bumps ``version`` and drops the stored bodies. A response
+    is only stored if no write happened while it was being built, so a
+    body read before a write can never be served after it. That needs the
+    routes to read the primary, a replica may not have the write yet.
+    """
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.version = 0
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def get(self, key: str) -> Optional[tuple]:
+        return self._entries.get(key)
+
+    def set(self, version: int, key: str, entry: tuple) -> None:
+        if version == self.version:
+            self._entries.set(key, entry)
+
+    def invalidate(self) -> None:
+        self.version += 1
+        self._entries.clear()
+
+
+response_cache = ResponseCache(
+    maxsize=config.RESPONSE_CACHE_MAX_SIZE, ttl=config.RESPONSE_CACHE_TTL_SECONDS
+)
+
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def etag_matches(request_headers: Headers, etag: str) -> bool:
+    if_none_match = request_headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    tags = {tag.strip() for tag in if_none_match.split(",")}
+    return "*" in tags or etag in tags
+
+
+class ResponseCacheMiddleware:
+    def __init__(self, app: ASGIApp, cache: ResponseCache = response_cache) -> None:
+        self.app = app
+        self.cache = cache
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "GET"
+            or not CACHED_PATHS.match(scope["path"])
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = Headers(scope=scope)
+        key = scope["path"] + "?" + scope["query_string"].decode("latin-1")
+
+        entry = self.cache.get(key)
+        if entry is not None:
+            # the route the body was built by, for the request metrics
+            scope["route"] = entry[3]
+            await self.send_cached(entry, request_headers, send)
+            return
+
+        version = self.cache.version
+        start: Optional[Message] = None
+        streaming = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal start, streaming
+            if message["type"] == "http.response.start":
+                start = message
+                return
+
+            if message["type"] != "http.response.body" or streaming:
+                await send(message)
+                return
+
+            if message.get("more_body", False) or start["status"] != 200:
+                # only complete 200 bodies are cached, anything else is
+                # passed through untouched
+                streaming = True
+                await send(start)
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            headers = MutableHeaders(scope=start)
+            headers["ETag"] = make_etag(body)
+            headers["Cache-Control"] = "no-cache"
+            entry = (headers["ETag"], body, start["headers"], scope.get("route"))
+            self.cache.set(version, key, entry)
+            await self.send_cached(entry, request_headers, send)
+
+        await self.app(scope, receive, send_wrapper)
+
+    async def send_cached(
+        self,
+        entry: tuple,
+        request_headers: Headers,
+        send: Send,
+    ) -> None:
+        etag, body, raw_headers, _route = entry
+        if etag_matches(request_headers, etag):
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": 304,
+                    "headers": [
+                        (b"etag", etag.encode("latin-1")),
+                        (b"cache-control", b"no-cache"),
+                    ],
+                }
+            )
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        await send(
+            {"type": "http.response.start", "status": 200, "headers": raw_headers}
+        )
+        await send({"type": "http.response.body", "body": body})
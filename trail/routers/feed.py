@@ -0,0 +1,84 @@
+import logging
+from typing import Annotated, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+
+from trail.database import database, post_table, read_database, user_table
+from trail.feed import feed_post_ids, follow, get_unfanned_followees, unfollow
+from trail.model.feed import Follow
+from trail.model.post import PostLikeWithPost, PostPage
+from trail.model.user import User
+from trail.pagination import (
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    decode_cursor,
+    encode_cursor,
+)
+from trail.routers.post import select_like_query
+from trail.security import get_current_user
+from trail.serialization import model_rows, trusted_response
+
+router = APIRouter()
+
+logger = logging.getLogger(__name__)
+
+
+@router.post("/follow/{user_id}", response_model=Follow, status_code=201)
+async def follow_user(
+    user_id: int,
+    CurrentUser: Annotated[User, Depends(get_current_user)],
+    response: Response,
+):
+    if user_id == CurrentUser.id:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="You can not follow yourself",
+        )
+    query = user_table.select().where(user_table.c.id == user_id)
+    if await database.fetch_one(query) is None:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    if not await follow(database, CurrentUser.id, user_id):
+        response.status_code = status.HTTP_200_OK
+    return {"follower_id": CurrentUser.id, "followee_id": user_id}
+
+
+@router.delete("/follow/{user_id}", status_code=204)
+async def unfollow_user(
+    user_id: int, CurrentUser: Annotated[User, Depends(get_current_user)]
+):
+    if not await unfollow(database, CurrentUser.id, user_id):
+        raise HTTPException(status_code=404, detail="Not following this user")
+
+
+@router.get("/feed", response_model=PostPage)
+async def get_feed(
+    CurrentUser: Annotated[User, Depends(get_current_user)],
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE,
+    after: Optional[str] = None,
+):
+    post_id = None
+    if after:
+        (post_id,) = decode_cursor(after, "feed", 1)
+
+    unfanned = await get_unfanned_followees(read_database, CurrentUser.id)
+    # one extra row tells us whether there is a next page without a COUNT
+    ids = feed_post_ids(CurrentUser.id, unfanned, limit + 1, post_id)
+    query = (
+        select_like_query.where(post_table.c.id.in_(ids))
+        .order_by(post_table.c.id.desc())
+        .limit(limit + 1)
+    )
+    logger.debug(query)
+    posts = await read_database.fetch_all(query)
+
+    next_cursor = None
+    if len(posts) > limit:
+        posts = posts[:limit]
+        next_cursor = encode_cursor("feed", posts[-1].id)
+    return trusted_response(
+        {
+            "posts": model_rows(posts, PostLikeWithPost),
+            "next_cursor": next_cursor,
+        }
+    )
@@ -0,0 +1,28 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from trail.email_outbox import email_outbox
+from trail.logging_config import dropped_log_records
+from trail.metrics import CONTENT_TYPE, CounterFunc, Gauge, registry
+
+router = APIRouter()
+
+registry.register(
+    Gauge(
+        "email_outbox_queue_depth",
+        "Emails waiting in the outbox",
+        lambda: email_outbox.queue_depth,
+    )
+)
+registry.register(
+    CounterFunc(
+        "log_records_dropped_total",
+        "Log records dropped because the logging queue was full",
+        dropped_log_records,
+    )
+)
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type=CONTENT_TYPE)
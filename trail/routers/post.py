@@ -1,62 +1,158 @@
 import logging
+import time
 from enum import Enum
-from typing import Annotated
+from typing import Annotated, Optional
 
 import sqlalchemy
-from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request
+from fastapi import (
+    APIRouter,
+    Body,
+    Depends,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    status,
+)
 
-from trail.database import comment_table, database, like_table, post_table
+from trail.broadcast import publish_post_event
+from trail.config import config
+from trail.counters import increment_post_counter
+from trail.database import (
+    comment_table,
+    database,
+    insert_ignoring_conflicts,
+    like_table,
+    post_table,
+    read_database,
+)
+from trail.feed import fan_out_posts
+from trail.jobs import enqueue_job, get_latest_post_job
+from trail.likes import LikeBufferFullError, apply_like_changes, like_buffer
 from trail.model.post import (
+    BatchResult,
     Comment,
     CommentIn,
+    CommentPage,
+    PostImageStatus,
     PostLike,
     PostLikeIn,
     PostLikeWithPost,
+    PostPage,
     UserPost,
     UserPostIn,
     UserPostWithComments,
 )
 from trail.model.user import User
+from trail.pagination import (
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    decode_cursor,
+    encode_cursor,
+)
+from trail.ranking import hot_score, refresh_hot_scores
+from trail.ratelimit import RateLimit, UserRateLimit, with_rate_limit_headers
+from trail.response_cache import response_cache
 from trail.security import get_current_user
-from trail.tasks import generate_and_add_to_post
+from trail.serialization import model_rows, trusted_response
+from trail.streaming import StreamFormat, stream_rows
 
-select_like_query = (
-    sqlalchemy.select(post_table, sqlalchemy.func.count(like_table.c.id).label("likes"))
-    .select_from(post_table.outerjoin(like_table))
-    .group_by(post_table.c.id)
+# like_count and comment_count are maintained on write, so reading a post
+# never has to aggregate the likes or COMMENT tables
+select_like_query = sqlalchemy.select(
+    post_table.c.id,
+    post_table.c.body,
+    post_table.c.user_id,
+    post_table.c.url_link,
+    post_table.c.like_count.label("likes"),
+    post_table.c.comment_count,
+    post_table.c.hot_score,
 )
 router = APIRouter()
 
 logger = logging.getLogger(__name__)
 
+# paged GETs fill the response cache, which is only invalidated when a
+# write happens. They read the primary, a lagging replica could hand the
+# cache a body from before the write. Streams are never cached, they and
+# the other read only routers use ``read_database``.
+
+MAX_BATCH_SIZE = 1000
+
+# a batch is charged one request per item against its single item route
+post_rate_limit = UserRateLimit("post", config.RATE_LIMIT_POST_PER_MINUTE)
+comment_rate_limit = UserRateLimit("comment", config.RATE_LIMIT_COMMENT_PER_MINUTE)
+like_rate_limit = UserRateLimit("like", config.RATE_LIMIT_LIKE_PER_MINUTE)
+stream_rate_limit = RateLimit("stream", config.RATE_LIMIT_STREAM_PER_MINUTE)
+
+
+async def limit_streams(
+    request: Request, response: Response, stream: Optional[StreamFormat] = None
+) -> None:
+    # paged reads are cheap and cached, only streams hold a connection
+    if stream:
+        await stream_rate_limit(request, response)
+
 
 async def find_post(post_id: int):
     query = post_table.select().where(post_table.c.id == post_id)
     return await database.fetch_one(query)
 
 
-@router.post("/post", response_model=UserPost, status_code=201)
+async def find_existing_post_ids(post_ids: set[int]) -> set[int]:
+    query = sqlalchemy.select(post_table.c.id).where(post_table.c.id.in_(post_ids))
+    return {row.id for row in await database.fetch_all(query)}
+
+
+def batch_result(results: list[dict]) -> dict:
+    return {
+        "created": sum(result["status"] == "created" for result in results),
+        "failed": sum(result["status"] == "failed" for result in results),
+        "results": sorted(results, key=lambda result: result["index"]),
+    }
+
+
+@router.post(
+    "/post",
+    response_model=UserPost,
+    status_code=201,
+    dependencies=[Depends(post_rate_limit)],
+)
 async def create_post(
     post: UserPostIn,
     CurrentUser: Annotated[User, Depends(get_current_user)],
-    background_tasks: BackgroundTasks,
     request: Request,
     prompt: str = None,
 ):
     data = {**post.model_dump(), "user_id": CurrentUser.id}
+    created_at = time.time()
 
-    query = post_table.insert().values(data)
-
-    last_record_id = await database.execute(query)
+    query = post_table.insert().values(
+        {**data, "created_at": created_at, "hot_score": hot_score(0, created_at)}
+    )
 
-    if prompt:
-        background_tasks.add_task(
-            generate_and_add_to_post,
-            last_record_id,
-            request.url_for("get_post_with_comments", post_id=last_record_id),
-            database,
-            prompt,
-        )
+    async with database.transaction():
+        last_record_id = await database.execute(query)
+        await fan_out_posts(database, CurrentUser.id, [last_record_id])
+        if prompt:
+            # the image is generated by the job worker, the job is stored
+            # together with the post so it survives restarts
+            await enqueue_job(
+                database,
+                "generate_image",
+                {
+                    "post_id": last_record_id,
+                    "post_url": str(
+                        request.url_for(
+                            "get_post_with_comments", post_id=last_record_id
+                        )
+                    ),
+                    "prompt": prompt,
+                },
+                post_id=last_record_id,
+            )
+    response_cache.invalidate()
+    publish_post_event("post_created", last_record_id, {**data, "id": last_record_id})
 
     return {**data, "id": last_record_id}
 
@@ -65,22 +161,98 @@ class PostSorting(str, Enum):
     new = "new"
     old = "old"
     most_likes = "most_likes"
+    hot = "hot"
 
 
-@router.get("/post", response_model=list[PostLikeWithPost])
-async def get_all_posts(sorting: PostSorting = PostSorting.new):
-    logger.info("This is log inside get all post")
+# ranked orderings read a maintained column through its (column, id) index,
+# the value is written whenever a like is added
+RANKED_COLUMNS = {
+    PostSorting.most_likes: post_table.c.like_count,
+    PostSorting.hot: post_table.c.hot_score,
+}
+
+
+def build_posts_query(sorting: PostSorting, limit: Optional[int], after: Optional[str]):
+    query = select_like_query
     if sorting == PostSorting.new:
-        query = select_like_query.order_by(post_table.c.id.desc())
+        if after:
+            (post_id,) = decode_cursor(after, sorting.value, 1)
+            query = query.where(post_table.c.id < post_id)
+        query = query.order_by(post_table.c.id.desc())
     elif sorting == PostSorting.old:
-        query = select_like_query.order_by(post_table.c.id.asc())
+        if after:
+            (post_id,) = decode_cursor(after, sorting.value, 1)
+            query = query.where(post_table.c.id > post_id)
+        query = query.order_by(post_table.c.id.asc())
     else:
-        query = select_like_query.order_by(sqlalchemy.desc("likes"))
-    logger.info(query)
-    return await database.fetch_all(query)
+        column = RANKED_COLUMNS[sorting]
+        if after:
+            rank, post_id = decode_cursor(after, sorting.value, 2)
+            query = query.where(
+                sqlalchemy.or_(
+                    column < rank,
+                    sqlalchemy.and_(column == rank, post_table.c.id < post_id),
+                )
+            )
+        query = query.order_by(column.desc(), post_table.c.id.desc())
 
+    if limit is None:
+        return query
+    # one extra row tells us whether there is a next page without a COUNT
+    return query.limit(limit + 1)
 
-@router.post("/comment", response_model=Comment, status_code=201)
+
+@router.get("/post", response_model=PostPage, dependencies=[Depends(limit_streams)])
+async def get_all_posts(
+    response: Response,
+    sorting: PostSorting = PostSorting.new,
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE,
+    after: Optional[str] = None,
+    stream: Optional[StreamFormat] = None,
+):
+    logger.info("This is log inside get all post")
+    if stream:
+        # posts from ``after`` on, up to RESPONSE_STREAM_MAX_ROWS of them
+        query = build_posts_query(sorting, None, after).limit(
+            config.RESPONSE_STREAM_MAX_ROWS
+        )
+        return with_rate_limit_headers(
+            stream_rows(
+                read_database.iterate(query), PostLikeWithPost.model_fields, stream
+            ),
+            response,
+        )
+
+    query = build_posts_query(sorting, limit, after)
+    # debug, and formatted by the logging thread, compiling the SQL is not free
+    logger.debug(query)
+    posts = await database.fetch_all(query)
+
+    next_cursor = None
+    if len(posts) > limit:
+        posts = posts[:limit]
+        last = posts[-1]
+        if sorting == PostSorting.most_likes:
+            next_cursor = encode_cursor(sorting.value, last.likes, last.id)
+        elif sorting == PostSorting.hot:
+            next_cursor = encode_cursor(sorting.value, last.hot_score, last.id)
+        else:
+            next_cursor = encode_cursor(sorting.value, last.id)
+
+    return trusted_response(
+        {
+            "posts": model_rows(posts, PostLikeWithPost),
+            "next_cursor": next_cursor,
+        }
+    )
+
+
+@router.post(
+    "/comment",
+    response_model=Comment,
+    status_code=201,
+    dependencies=[Depends(comment_rate_limit)],
+)
 async def create_comment(
     comment: CommentIn, CurrentUser: Annotated[User, Depends(get_current_user)]
 ):
@@ -90,40 +262,365 @@ async def create_comment(
     data = {**comment.model_dump(), "user_id": CurrentUser.id}
 
     query = comment_table.insert().values(data)
-    last_record_id = await database.execute(query)
+    async with database.transaction():
+        last_record_id = await database.execute(query)
+        await database.execute(
+            post_table.update()
+            .where(post_table.c.id == comment.post_id)
+            .values(comment_count=post_table.c.comment_count + 1)
+        )
+    response_cache.invalidate()
+    publish_post_event(
+        "comment_created", comment.post_id, {**data, "id": last_record_id}
+    )
     return {**data, "id": last_record_id}
 
 
-@router.get("/post/{post_id}/comments", response_model=list[Comment])
-async def get_comments_on_posts(post_id: int):
+@router.get(
+    "/post/{post_id}/comments",
+    response_model=CommentPage,
+    dependencies=[Depends(limit_streams)],
+)
+async def get_comments_on_posts(
+    post_id: int,
+    response: Response,
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE,
+    after: Optional[str] = None,
+    stream: Optional[StreamFormat] = None,
+):
     query = comment_table.select().where(comment_table.c.post_id == post_id)
-    return await database.fetch_all(query)
+    if after:
+        (comment_id,) = decode_cursor(after, "comments", 1)
+        query = query.where(comment_table.c.id > comment_id)
+    query = query.order_by(comment_table.c.id)
+    if stream:
+        # comments from ``after`` on, up to RESPONSE_STREAM_MAX_ROWS of them
+        query = query.limit(config.RESPONSE_STREAM_MAX_ROWS)
+        return with_rate_limit_headers(
+            stream_rows(read_database.iterate(query), Comment.model_fields, stream),
+            response,
+        )
+    query = query.limit(limit + 1)
+
+    comments = await database.fetch_all(query)
+
+    next_cursor = None
+    if len(comments) > limit:
+        comments = comments[:limit]
+        next_cursor = encode_cursor("comments", comments[-1].id)
+
+    return trusted_response(
+        {
+            "comments": model_rows(comments, Comment),
+            "next_cursor": next_cursor,
+        }
+    )
 
 
 @router.get("/post/{post_id}", response_model=UserPostWithComments)
-async def get_post_with_comments(post_id: int):
-    query = select_like_query.where(post_table.c.id == post_id)
+async def get_post_with_comments(
+    post_id: int,
+    comments_limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE,
+):
+    # the post and the first page of its comments come back in one round
+    # trip, every row repeats the post and carries one comment
+    query = (
+        select_like_query.add_columns(
+            comment_table.c.id.label("comment_id"),
+            comment_table.c.body.label("comment_body"),
+            comment_table.c.user_id.label("comment_user_id"),
+        )
+        .select_from(post_table.outerjoin(comment_table))
+        .where(post_table.c.id == post_id)
+        .order_by(comment_table.c.id)
+        .limit(comments_limit + 1)
+    )
+
+    rows = await database.fetch_all(query)
+
+    if not rows:
+        raise HTTPException(status_code=404, detail="Post not present")
 
-    post = await database.fetch_one(query)
+    comments = [
+        {
+            "id": row.comment_id,
+            "body": row.comment_body,
+            "post_id": post_id,
+            "user_id": row.comment_user_id,
+        }
+        for row in rows
+        if row.comment_id is not None
+    ]
 
+    comments_cursor = None
+    if len(comments) > comments_limit:
+        comments = comments[:comments_limit]
+        comments_cursor = encode_cursor("comments", comments[-1]["id"])
+
+    return trusted_response(
+        {
+            "post": model_rows(rows[:1], PostLikeWithPost)[0],
+            "comments": comments,
+            "comments_cursor": comments_cursor,
+        }
+    )
+
+
+@router.get("/post/{post_id}/image", response_model=PostImageStatus)
+async def get_post_image_status(post_id: int):
+    post = await find_post(post_id)
     if not post:
         raise HTTPException(status_code=404, detail="Post not present")
 
+    job = await get_latest_post_job(database, post_id, "generate_image")
+    if job is None:
+        return {"post_id": post_id, "status": "none", "url_link": post.url_link}
+
     return {
-        "post": post,
-        "comments": await get_comments_on_posts(post_id),
+        "post_id": post_id,
+        "status": job.status,
+        "url_link": post.url_link,
+        "attempts": job.attempts,
+        "last_error": job.last_error,
     }
 
 
-@router.post("/like", response_model=PostLike, status_code=201)
+@router.post(
+    "/like",
+    response_model=PostLike,
+    status_code=201,
+    dependencies=[Depends(like_rate_limit)],
+)
 async def post_like(
-    like: PostLikeIn, CurrentUser: Annotated[User, Depends(get_current_user)]
+    like: PostLikeIn,
+    CurrentUser: Annotated[User, Depends(get_current_user)],
+    response: Response,
 ):
     post = await find_post(like.post_id)
     if not post:
         raise HTTPException(status_code=404, detail="Post not present")
 
     data = {**like.model_dump(), "user_id": CurrentUser.id}
-    query = like_table.insert().values(data)
-    like_id = await database.execute(query)
+    if config.LIKE_BUFFER_ENABLED:
+        try:
+            like_buffer.add(like.post_id, CurrentUser.id, True)
+        except LikeBufferFullError:
+            logger.warning("Like buffer is full, writing the like directly")
+        else:
+            response.status_code = status.HTTP_202_ACCEPTED
+            return data
+
+    # the unique (post_id, user_id) index makes liking twice a no-op
+    query = (
+        insert_ignoring_conflicts(like_table, ["post_id", "user_id"])
+        .values(data)
+        .returning(like_table.c.id)
+    )
+    async with database.transaction():
+        like_id = await database.fetch_val(query)
+        if like_id is not None:
+            await database.execute(
+                post_table.update()
+                .where(post_table.c.id == like.post_id)
+                .values(like_count=post_table.c.like_count + 1)
+            )
+            await refresh_hot_scores(database, [like.post_id])
+
+    if like_id is None:
+        query = like_table.select().where(
+            like_table.c.post_id == like.post_id,
+            like_table.c.user_id == CurrentUser.id,
+        )
+        existing = await database.fetch_one(query)
+        response.status_code = status.HTTP_200_OK
+        return existing
+
+    response_cache.invalidate()
+    publish_post_event("post_liked", like.post_id, {**data, "id": like_id})
     return {**data, "id": like_id}
+
+
+@router.delete(
+    "/like/{post_id}",
+    status_code=204,
+    dependencies=[Depends(like_rate_limit)],
+)
+async def delete_like(
+    post_id: int,
+    CurrentUser: Annotated[User, Depends(get_current_user)],
+    response: Response,
+):
+    post = await find_post(post_id)
+    if not post:
+        raise HTTPException(status_code=404, detail="Post not present")
+
+    if config.LIKE_BUFFER_ENABLED:
+        try:
+            like_buffer.add(post_id, CurrentUser.id, False)
+        except LikeBufferFullError:
+            logger.warning("Like buffer is full, deleting the like directly")
+        else:
+            return with_rate_limit_headers(
+                Response(status_code=status.HTTP_202_ACCEPTED), response
+            )
+
+    # unliking a post that is not liked is a no-op, not an error
+    await apply_like_changes(database, {(post_id, CurrentUser.id): False})
+
+
+@router.post("/post/batch", response_model=BatchResult)
+async def create_posts_batch(
+    posts: Annotated[list[UserPostIn], Body(min_length=1, max_length=MAX_BATCH_SIZE)],
+    CurrentUser: Annotated[User, Depends(get_current_user)],
+    response: Response,
+):
+    await post_rate_limit.check_user(CurrentUser, response, len(posts))
+    created_at = time.time()
+    data = [{**post.model_dump(), "user_id": CurrentUser.id} for post in posts]
+    query = (
+        post_table.insert()
+        .values(
+            [
+                {
+                    **post,
+                    "created_at": created_at,
+                    "hot_score": hot_score(0, created_at),
+                }
+                for post in data
+            ]
+        )
+        .returning(post_table.c.id)
+    )
+    async with database.transaction():
+        rows = await database.fetch_all(query)
+        await fan_out_posts(database, CurrentUser.id, [row.id for row in rows])
+    response_cache.invalidate()
+
+    # ids of a single multi-row insert are handed out in row order
+    ids = sorted(row.id for row in rows)
+    for post, post_id in zip(data, ids):
+        publish_post_event("post_created", post_id, {**post, "id": post_id})
+    return batch_result(
+        [
+            {"index": index, "status": "created", "id": post_id}
+            for index, post_id in enumerate(ids)
+        ]
+    )
+
+
+@router.post("/comment/batch", response_model=BatchResult)
+async def create_comments_batch(
+    comments: Annotated[list[CommentIn], Body(min_length=1, max_length=MAX_BATCH_SIZE)],
+    CurrentUser: Annotated[User, Depends(get_current_user)],
+    response: Response,
+):
+    await comment_rate_limit.check_user(CurrentUser, response, len(comments))
+    existing = await find_existing_post_ids({comment.post_id for comment in comments})
+
+    results = []
+    accepted = []
+    for index, comment in enumerate(comments):
+        if comment.post_id in existing:
+            accepted.append(index)
+        else:
+            results.append(
+                {"index": index, "status": "failed", "detail": "No post present"}
+            )
+
+    if accepted:
+        data = [
+            {**comments[index].model_dump(), "user_id": CurrentUser.id}
+            for index in accepted
+        ]
+        added = {}
+        for row in data:
+            added[row["post_id"]] = added.get(row["post_id"], 0) + 1
+
+        query = comment_table.insert().values(data).returning(comment_table.c.id)
+        async with database.transaction():
+            rows = await database.fetch_all(query)
+            await increment_post_counter(database, post_table.c.comment_count, added)
+        response_cache.invalidate()
+
+        ids = sorted(row.id for row in rows)
+        for comment, comment_id in zip(data, ids):
+            publish_post_event(
+                "comment_created", comment["post_id"], {**comment, "id": comment_id}
+            )
+        results += [
+            {"index": index, "status": "created", "id": comment_id}
+            for index, comment_id in zip(accepted, ids)
+        ]
+
+    return batch_result(results)
+
+
+@router.post("/like/batch", response_model=BatchResult)
+async def post_likes_batch(
+    likes: Annotated[list[PostLikeIn], Body(min_length=1, max_length=MAX_BATCH_SIZE)],
+    CurrentUser: Annotated[User, Depends(get_current_user)],
+    response: Response,
+):
+    await like_rate_limit.check_user(CurrentUser, response, len(likes))
+    post_ids = {like.post_id for like in likes}
+    existing = await find_existing_post_ids(post_ids)
+    query = sqlalchemy.select(like_table.c.id, like_table.c.post_id).where(
+        like_table.c.user_id == CurrentUser.id, like_table.c.post_id.in_(post_ids)
+    )
+    liked = {row.post_id: row.id for row in await database.fetch_all(query)}
+
+    results = []
+    accepted = {}
+    repeated = []
+    for index, like in enumerate(likes):
+        if like.post_id not in existing:
+            results.append(
+                {"index": index, "status": "failed", "detail": "Post not present"}
+            )
+        elif like.post_id in liked:
+            results.append(
+                {"index": index, "status": "exists", "id": liked[like.post_id]}
+            )
+        elif like.post_id in accepted:
+            repeated.append((index, like.post_id))
+        else:
+            accepted[like.post_id] = index
+
+    if accepted:
+        data = [{"post_id": post_id, "user_id": CurrentUser.id} for post_id in accepted]
+        query = (
+            insert_ignoring_conflicts(like_table, ["post_id", "user_id"])
+            .values(data)
+            .returning(like_table.c.id, like_table.c.post_id)
+        )
+        async with database.transaction():
+            rows = await database.fetch_all(query)
+            if rows:
+                await increment_post_counter(
+                    database, post_table.c.like_count, {row.post_id: 1 for row in rows}
+                )
+                await refresh_hot_scores(database, [row.post_id for row in rows])
+        if rows:
+            response_cache.invalidate()
+
+        created = {row.post_id: row.id for row in rows}
+        for post_id, like_id in created.items():
+            publish_post_event(
+                "post_liked",
+                post_id,
+                {"post_id": post_id, "user_id": CurrentUser.id, "id": like_id},
+            )
+        for post_id, index in accepted.items():
+            if post_id in created:
+                results.append(
+                    {"index": index, "status": "created", "id": created[post_id]}
+                )
+            else:
+                # liked concurrently between the lookup and the insert
+                results.append({"index": index, "status": "exists"})
+        results += [
+            {"index": index, "status": "exists", "id": created.get(post_id)}
+            for index, post_id in repeated
+        ]
+
+    return batch_result(results)
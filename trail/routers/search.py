@@ -0,0 +1,57 @@
+import logging
+from typing import Annotated, Optional
+
+import sqlalchemy
+from fastapi import APIRouter, HTTPException, Query, status
+
+from trail.database import read_database
+from trail.model.search import SearchPage
+from trail.pagination import (
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    decode_cursor,
+    encode_cursor,
+)
+from trail.search import build_match_query, search_query
+
+router = APIRouter()
+
+logger = logging.getLogger(__name__)
+
+
+@router.get("/search", response_model=SearchPage)
+async def search(
+    q: Annotated[str, Query(min_length=1, max_length=200)],
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE,
+    after: Optional[str] = None,
+):
+    # the indexes are FTS5 virtual tables, other backends have none
+    if read_database.url.dialect != "sqlite":
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail="Search is not available on this database",
+        )
+
+    match = build_match_query(q)
+    if match is None:
+        return {"results": [], "next_cursor": None}
+
+    hits = search_query(match)
+    query = sqlalchemy.select(hits)
+    if after:
+        rank, kind_order, hit_id = decode_cursor(after, "search", 3)
+        query = query.where(
+            sqlalchemy.tuple_(hits.c.rank, hits.c.kind_order, hits.c.id)
+            > sqlalchemy.tuple_(rank, kind_order, hit_id)
+        )
+    query = query.order_by(hits.c.rank, hits.c.kind_order, hits.c.id).limit(limit + 1)
+
+    results = await read_database.fetch_all(query)
+
+    next_cursor = None
+    if len(results) > limit:
+        results = results[:limit]
+        last = results[-1]
+        next_cursor = encode_cursor("search", last.rank, last.kind_order, last.id)
+
+    return {"results": results, "next_cursor": next_cursor}
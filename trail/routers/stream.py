@@ -0,0 +1,72 @@
+import asyncio
+import json
+import logging
+from typing import AsyncGenerator
+
+from fastapi import APIRouter, HTTPException, status
+from fastapi.responses import StreamingResponse
+
+from trail.broadcast import Broadcaster, broadcaster
+from trail.config import config
+
+router = APIRouter()
+
+logger = logging.getLogger(__name__)
+
+
+def format_event(event_id: int, event: str, data: dict) -> str:
+    return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def event_stream(
+    channel: str,
+    broadcaster: Broadcaster = broadcaster,
+    heartbeat: float = config.STREAM_HEARTBEAT_SECONDS,
+) -> AsyncGenerator[str, None]:
+    # subscribing here rather than in the handler means a client that goes
+    # away before the body is sent never leaves a subscriber behind
+    subscriber = broadcaster.subscribe(channel)
+    if subscriber is None:
+        yield "event: evicted\ndata: {}\n\n"
+        return
+
+    try:
+        # sent right away so proxies and clients see the stream is open
+        yield ": connected\n\n"
+        while True:
+            try:
+                message = await asyncio.wait_for(subscriber.queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+
+            if message is None:
+                yield "event: evicted\ndata: {}\n\n"
+                return
+            yield format_event(*message)
+    finally:
+        broadcaster.unsubscribe(subscriber)
+
+
+def stream_channel(channel: str) -> StreamingResponse:
+    if broadcaster.subscriber_count >= broadcaster.max_subscribers:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many open streams",
+        )
+
+    return StreamingResponse(
+        event_stream(channel),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/stream/posts")
+async def stream_posts():
+    return stream_channel("posts")
+
+
+@router.get("/stream/post/{post_id}")
+async def stream_post(post_id: int):
+    return stream_channel(f"post:{post_id}")
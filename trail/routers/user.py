@@ -1,34 +1,41 @@
 import logging
 
-from fastapi import APIRouter, HTTPException, Request, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 
+from trail.config import config
 from trail.database import database, user_table
 from trail.model.user import UserIn
+from trail.ratelimit import RateLimit
 from trail.security import (
     authenticate_user,
     create_access_token,
     create_confirm_token,
-    get_password_hash,
+    get_password_hash_async,
     get_subject_for_token_type,
     get_user,
+    invalidate_cached_user,
 )
 
 router = APIRouter()
 
 logger = logging.getLogger(__name__)
 
+# keyed by client IP, these run before the bcrypt work they protect
+register_rate_limit = RateLimit("register", config.RATE_LIMIT_REGISTER_PER_MINUTE)
+token_rate_limit = RateLimit("token", config.RATE_LIMIT_TOKEN_PER_MINUTE)
 
-@router.post("/register", status_code=201)
+
+@router.post("/register", status_code=201, dependencies=[Depends(register_rate_limit)])
 async def register(user: UserIn, request: Request):
     if await get_user(user.email):
         raise HTTPException(
             detail="The user already exist",
             status_code=status.HTTP_400_BAD_REQUEST,
         )
-    password = get_password_hash(user.password)
+    password = await get_password_hash_async(user.password)
     query = user_table.insert().values(email=user.email, password=password)
 
-    logger.info(query)
+    logger.debug(query)
 
     await database.execute(query)
     # return {"detail": "User Created"}
@@ -40,7 +47,7 @@ async def register(user: UserIn, request: Request):
     }
 
 
-@router.post("/token")
+@router.post("/token", dependencies=[Depends(token_rate_limit)])
 async def login(user: UserIn):
     user = await authenticate_user(user.email, user.password)
     token = create_access_token(user.email)
@@ -55,4 +62,5 @@ async def confirm_email(token: str):
     )
     logger.info("Updating the status of the email confirmation")
     await database.execute(query)
+    invalidate_cached_user(email)
     return {"detail": "Email Confirmed"}
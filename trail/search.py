@@ -0,0 +1,86 @@
+import asyncio
+import logging
+import re
+from typing import Optional
+
+import sqlalchemy
+from databases import Database
+
+from trail.config import config
+from trail.database import comment_search_table, post_search_table
+
+logger = logging.getLogger(__name__)
+
+TERM = re.compile(r"(\w+)(\*?)")
+
+
+def build_match_query(q: str) -> Optional[str]:
+    """Turn free text into an FTS5 query that cannot be a syntax error.
+
+    Every word is quoted so operators in user input are matched as text. A
+    word ending in ``*`` and the last word are prefix matches, so results
+    show up while the query is still being typed.
+    """
+    terms = TERM.findall(q)
+    if not terms:
+        return None
+    last = len(terms) - 1
+    return " ".join(
+        f'"{word}"' + ("*" if star or index == last else "")
+        for index, (word, star) in enumerate(terms)
+    )
+
+
+def search_query(match: str, max_candidates: int = config.SEARCH_MAX_CANDIDATES):
+    """Union of the post and comment matches, best first by ascending bm25.
+
+    Scoring every match of a very common term costs time in proportion to the
+    number of matches, so only the newest ``max_candidates`` matches of each
+    table are ranked. FTS5 walks matches in rowid order and stops there.
+    """
+
+    def matches(table, kind: str, kind_order: int, post_id):
+        fts = sqlalchemy.literal_column(table.name)
+        return (
+            sqlalchemy.select(
+                sqlalchemy.literal(kind).label("kind"),
+                sqlalchemy.literal(kind_order).label("kind_order"),
+                table.c.rowid.label("id"),
+                post_id.label("post_id"),
+                table.c.body,
+                sqlalchemy.func.bm25(fts).label("rank"),
+            )
+            .where(fts.op("MATCH")(match))
+            .order_by(table.c.rowid.desc())
+            .limit(max_candidates)
+            .subquery()
+        )
+
+    posts = matches(post_search_table, "post", 0, post_search_table.c.rowid)
+    comments = matches(
+        comment_search_table, "comment", 1, comment_search_table.c.post_id
+    )
+    return sqlalchemy.union_all(
+        sqlalchemy.select(posts), sqlalchemy.select(comments)
+    ).subquery("hits")
+
+
+async def rebuild_search_index(database: Database) -> None:
+    """Reindex every post and comment, for rows written before the index."""
+    logger.info("Rebuilding the post and comment search indexes")
+    for table in ("post_fts", "comment_fts"):
+        await database.execute(f"INSERT INTO {table} ({table}) VALUES ('rebuild')")
+
+
+async def main() -> None:
+    from trail.database import database
+
+    await database.connect()
+    try:
+        await rebuild_search_index(database)
+    finally:
+        await database.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,23 +1,42 @@
+import asyncio
 import datetime
 import logging
-from typing import Annotated, Literal
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+from typing import Annotated, Callable, Literal, Optional
 
+from databases import Database
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from jose import ExpiredSignatureError, JWTError, jwt
-from passlib.context import CryptContext
 
+from trail.cache import TTLCache
+from trail.config import config
 from trail.database import database, user_table
+from trail.metrics import password_hash_duration
 
 logger = logging.getLogger(__name__)
 
 
-pass_context = CryptContext(schemes=["bcrypt"])
+@lru_cache()
+def get_pass_context():
+    # passlib and jose are imported on first use, not when the app starts
+    from passlib.context import CryptContext
+
+    return CryptContext(schemes=["bcrypt"], bcrypt__rounds=config.BCRYPT_ROUNDS)
+
 
 SECRET_KEY = "134324"
 ALGORITHM = "HS256"
 oauth2_schema = OAuth2PasswordBearer(tokenUrl="token")
 
+# users are cached by email for the authenticated request path, and decoded
+# access tokens are remembered until they expire
+user_cache = TTLCache(
+    maxsize=config.USER_CACHE_MAX_SIZE, ttl=config.USER_CACHE_TTL_SECONDS
+)
+token_cache = TTLCache(maxsize=config.TOKEN_CACHE_MAX_SIZE, ttl=float("inf"))
+
 
 def access_token_expire_minutes() -> int:
     return 30
@@ -41,6 +60,8 @@ def create_access_token(email: str):
         minutes=access_token_expire_minutes()
     )
     jwt_data = {"sub": email, "exp": expire, "type": "access"}
+    from jose import jwt
+
     encoded_jwt = jwt.encode(jwt_data, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -51,11 +72,15 @@ def create_confirm_token(email: str):
         minutes=confirm_token_expire_minutes()
     )
     jwt_data = {"sub": email, "exp": expire, "type": "confirm"}
+    from jose import jwt
+
     encoded_jwt = jwt.encode(jwt_data, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 
-def get_subject_for_token_type(token: str, type: Literal["access", "confirm"]) -> str:
+def decode_token(token: str, type: Literal["access", "confirm"]) -> dict:
+    from jose import ExpiredSignatureError, JWTError, jwt
+
     try:
         payload = jwt.decode(token, key=SECRET_KEY, algorithms=[ALGORITHM])
 
@@ -75,21 +100,100 @@ def get_subject_for_token_type(token: str, type: Literal["access", "confirm"]) -
     if token_type is None or token_type != type:
         raise create_credential_exception("access type is not same")
 
-    return email
+    return payload
+
+
+def get_subject_for_token_type(token: str, type: Literal["access", "confirm"]) -> str:
+    return decode_token(token, type)["sub"]
 
 
 def get_password_hash(password: str) -> str:
-    return pass_context.hash(password)
+    return get_pass_context().hash(password)
 
 
 def verify_password(plain_password: str, hash_password: str) -> bool:
-    return pass_context.verify(plain_password, hash_password)
+    return get_pass_context().verify(plain_password, hash_password)
+
+
+class PasswordHashPool:
+    """Runs bcrypt off the event loop on a bounded thread or process pool.
+
+    At most ``queue_size`` calls may be running or waiting for a worker, any
+    call beyond that is rejected with 429 instead of piling up.
+    """
+
+    def __init__(self, kind: str, workers: int, queue_size: int) -> None:
+        self.kind = kind
+        self.workers = workers
+        self.queue_size = queue_size
+        self.pending = 0
+        self._executor: Optional[Executor] = None
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="bcrypt"
+                )
+        return self._executor
+
+    def _release(self, _future: asyncio.Future) -> None:
+        self.pending -= 1
+
+    async def run(self, func: Callable, *args):
+        if self.pending >= self.queue_size:
+            logger.warning("Password hash pool is saturated")
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests, try again later",
+                headers={"Retry-After": "1"},
+            )
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._get_executor(), func, *args)
+        # the slot is freed when the worker finishes, even if the caller
+        # is cancelled while waiting
+        self.pending += 1
+        future.add_done_callback(self._release)
+        return await future
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+password_pool = PasswordHashPool(
+    kind=config.PASSWORD_HASH_POOL,
+    workers=config.PASSWORD_HASH_WORKERS,
+    queue_size=config.PASSWORD_HASH_QUEUE_SIZE,
+)
+
+
+async def get_password_hash_async(password: str) -> str:
+    start = time.perf_counter()
+    try:
+        return await password_pool.run(get_password_hash, password)
+    finally:
+        password_hash_duration.observe(time.perf_counter() - start, "hash")
+
+
+async def verify_password_async(plain_password: str, hash_password: str) -> bool:
+    start = time.perf_counter()
+    try:
+        return await password_pool.run(verify_password, plain_password, hash_password)
+    finally:
+        password_hash_duration.observe(time.perf_counter() - start, "verify")
 
 
-async def get_user(email: str):
+async def get_user(email: str, db: Database = database):
+    # read from the primary: a lagging replica would refuse a user who has
+    # just confirmed and the stale row would then sit in user_cache
     logger.info("fetching user from database", extra={"email": email})
     query = user_table.select().where(user_table.c.email == email)
-    result = await database.fetch_one(query=query)
+    result = await db.fetch_one(query=query)
 
     if result:
         return result
@@ -101,7 +205,7 @@ async def authenticate_user(email: str, password: str):
     if not user:
         raise create_credential_exception("User is not present")
 
-    if not verify_password(password, user.password):
+    if not await verify_password_async(password, user.password):
         raise create_credential_exception("password is not correct")
 
     if not user.confirmed:
@@ -109,11 +213,22 @@ async def authenticate_user(email: str, password: str):
     return user
 
 
+def invalidate_cached_user(email: str) -> None:
+    user_cache.pop(email)
+
+
 async def get_current_user(token: Annotated[str, Depends(oauth2_schema)]) -> dict:
-    email = get_subject_for_token_type(token, "access")
-    user = await get_user(email)
+    email = token_cache.get(token)
+    if email is None:
+        payload = decode_token(token, "access")
+        email = payload["sub"]
+        token_cache.set(token, email, ttl=payload.get("exp", 0) - time.time())
 
+    user = user_cache.get(email)
     if user is None:
-        raise create_credential_exception("user is not found")
+        user = await get_user(email)
+        if user is None:
+            raise create_credential_exception("user is not found")
+        user_cache.set(email, user)
 
     return user
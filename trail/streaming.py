@@ -0,0 +1,60 @@
+from enum import Enum
+from typing import AsyncGenerator, AsyncIterable, Iterable, Mapping
+
+import orjson
+from fastapi.responses import StreamingResponse
+
+from trail.config import config
+
+
+class StreamFormat(str, Enum):
+    json = "json"
+    ndjson = "ndjson"
+
+
+MEDIA_TYPES = {
+    StreamFormat.json: "application/json",
+    StreamFormat.ndjson: "application/x-ndjson",
+}
+
+
+async def encode_rows(
+    rows: AsyncIterable[Mapping],
+    fields: Iterable[str],
+    format: StreamFormat,
+    chunk_size: int = config.RESPONSE_STREAM_CHUNK_BYTES,
+) -> AsyncGenerator[bytes, None]:
+    """Serialize ``rows`` as a JSON array or as NDJSON, in chunks.
+
+    Only ``fields`` of every row are written, so the objects have the same
+    shape as the response model of the paged endpoint. A chunk is sent once
+    it holds ``chunk_size`` bytes, at most one chunk and one row are in
+    memory whatever the number of rows.
+    """
+    fields = tuple(fields)
+    ndjson = format == StreamFormat.ndjson
+    buffer = bytearray() if ndjson else bytearray(b"[")
+    first = True
+    async for row in rows:
+        if not ndjson and not first:
+            buffer += b","
+        first = False
+        buffer += orjson.dumps({field: row[field] for field in fields})
+        if ndjson:
+            buffer += b"\n"
+        if len(buffer) >= chunk_size:
+            yield bytes(buffer)
+            buffer.clear()
+
+    if not ndjson:
+        buffer += b"]"
+    if buffer:
+        yield bytes(buffer)
+
+
+def stream_rows(
+    rows: AsyncIterable[Mapping], fields: Iterable[str], format: StreamFormat
+) -> StreamingResponse:
+    return StreamingResponse(
+        encode_rows(rows, fields, format), media_type=MEDIA_TYPES[format]
+    )
@@ -1,11 +1,14 @@
 import logging
 from json.decoder import JSONDecodeError
+from typing import Optional
 
 import httpx
 from databases import Database
 
 from trail.config import config
 from trail.database import post_table
+from trail.email_outbox import email_outbox
+from trail.http_client import get_http_client
 
 logger = logging.getLogger(__name__)
 
@@ -14,48 +17,35 @@ class APIResponseError(Exception):
     pass
 
 
-async def send_email_to_user(to: str, subject: str, body: str):
-    logger.info(f"Sending emailto user {to}")
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(
-                f"https://api.mailgun.net/v3/{config.MAIL_GUN_DOMAIN}/messages",
-                auth=("api", config.MAIL_GUN_API_KEY),
-                data={
-                    "from": f"Venjan <mailgun@{config.MAIL_GUN_DOMAIN}>",
-                    "to": [to],
-                    "subject": subject,
-                    "text": body,
-                },
-            )
-            logger.info(response)
-            response.raise_for_status()
+def send_email_to_user(
+    to: str, subject: str, body: str, variables: Optional[dict] = None
+) -> None:
+    # sent in a Mailgun batch with every queued email sharing subject and body,
+    # per recipient values go in ``variables`` as %recipient.<name>%. Raises
+    # OutboxFullError when the outbox is full
+    logger.info(f"Queueing email to user {to}")
+    email_outbox.enqueue(to, subject, body, variables)
 
-            return response
 
-        except httpx.HTTPStatusError as err:
-            raise APIResponseError("there is error sending email") from err
-
-
-async def _generate_cute_image(prompt: str):
+async def _generate_cute_image(prompt: str, client: Optional[httpx.AsyncClient] = None):
     logger.info("Generating image")
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(
-                "url",
-                data={"text": prompt},
-                headers={"api-key": config.DEEP_AI_API_KEY},
-            )
-            logger.info(response)
-            response.raise_for_status()
-            return response.json()
-
-        except httpx.HTTPStatusError as er:
-            raise APIResponseError(
-                f"api request failed with status code {er.response.status_code}"
-            ) from er
-        except (JSONDecodeError, TypeError) as er:
-            raise APIResponseError(f"api request parsing failed {er}") from er
+    client = client or get_http_client()
+    try:
+        response = await client.post(
+            "https://api.deepai.org/api/cute-creature-generator",
+            data={"text": prompt},
+            headers={"api-key": config.DEEP_AI_API_KEY},
+        )
+        logger.info(response)
+        response.raise_for_status()
+        return response.json()
+
+    except httpx.HTTPStatusError as er:
+        raise APIResponseError(
+            f"api request failed with status code {er.response.status_code}"
+        ) from er
+    except (JSONDecodeError, TypeError) as er:
+        raise APIResponseError(f"api request parsing failed {er}") from er
 
 
 async def generate_and_add_to_post(
@@ -63,9 +53,10 @@ async def generate_and_add_to_post(
     post_url: str,
     database: Database,
     prompt: str = "A cat sitting near chair",
+    client: Optional[httpx.AsyncClient] = None,
 ):
     try:
-        response = await _generate_cute_image(prompt)
+        response = await _generate_cute_image(prompt, client)
     except httpx.HTTPStatusError:
         raise APIResponseError("API didn't send any response")
 
@@ -75,7 +66,7 @@ async def generate_and_add_to_post(
         .where(post_table.c.id == post_id)
         .values(url_link=response["output_url"])
     )
-    logger.info(query)
+    logger.debug(query)
 
     await database.execute(query)
     logger.info("Completed database execution")
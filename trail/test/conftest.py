@@ -1,7 +1,7 @@
 import os
 from typing import AsyncGenerator, Generator
-from unittest.mock import AsyncMock, Mock
 
+import httpx
 import pytest
 from fastapi.testclient import TestClient
 from httpx import ASGITransport, AsyncClient, Request, Response
@@ -9,8 +9,13 @@ from httpx import ASGITransport, AsyncClient, Request, Response
 os.environ["ENV_STATE"] = "test"
 
 
-from trail.database import database, user_table
+from trail import security
+from trail.config import config
+from trail.database import create_database, database, user_table
 from trail.main import app
+from trail.migrations import migrate
+from trail.ratelimit import rate_limit_store
+from trail.response_cache import response_cache
 from trail.test.routers.test_post import create_post
 
 
@@ -24,13 +29,31 @@ def client() -> Generator:
     yield TestClient(app)
 
 
+@pytest.fixture(scope="session", autouse=True)
+async def migrated_database() -> None:
+    # migrations commit, so they run on a connection without force_rollback
+    migrations_database = create_database(config.DATABASE_URL)
+    await migrations_database.connect()
+    await migrate(migrations_database)
+    await migrations_database.disconnect()
+
+
 @pytest.fixture(autouse=True)
-async def db() -> AsyncGenerator:
+async def db(migrated_database) -> AsyncGenerator:
     await database.connect()
     yield database
     await database.disconnect()
 
 
+@pytest.fixture(autouse=True)
+async def clear_caches(db) -> AsyncGenerator:
+    yield
+    security.user_cache.clear()
+    security.token_cache.clear()
+    response_cache.invalidate()
+    await rate_limit_store.clear()
+
+
 @pytest.fixture()
 async def async_client(client) -> AsyncGenerator:
     async with AsyncClient(
@@ -68,14 +91,32 @@ async def logged_in_token(async_client: AsyncClient, confirmed_user: dict):
     return response.json()["access_token"]
 
 
+class StubTransport(httpx.AsyncBaseTransport):
+    """Answers every request with a copy of ``response`` and keeps the requests."""
+
+    def __init__(self) -> None:
+        self.response = Response(status_code=200, content="")
+        self.requests: list[Request] = []
+
+    async def handle_async_request(self, request: Request) -> Response:
+        self.requests.append(request)
+        return Response(
+            status_code=self.response.status_code,
+            headers=self.response.headers,
+            content=self.response.content,
+        )
+
+
+@pytest.fixture()
+def stub_transport() -> StubTransport:
+    return StubTransport()
+
+
 @pytest.fixture(autouse=True)
-async def mock_httpx_client(mocker):
-    mocked_client = mocker.patch("trail.tasks.httpx.AsyncClient")
-    mocked_async_client = Mock()
-    response = Response(status_code=200, content="", request=Request("Post", "//"))
-    mocked_async_client.post = AsyncMock(return_value=response)
-    mocked_client.return_value.__aenter__.return_value = mocked_async_client
-    return mocked_async_client
+async def http_client(stub_transport: StubTransport, mocker) -> AsyncGenerator:
+    async with httpx.AsyncClient(transport=stub_transport) as client:
+        mocker.patch("trail.tasks.get_http_client", return_value=client)
+        yield client
 
 
 @pytest.fixture()
@@ -0,0 +1,191 @@
+import pytest
+from databases import Database
+from httpx import AsyncClient
+from sqlalchemy.dialects import sqlite
+
+from trail.database import timeline_table, user_table
+from trail.feed import feed_post_ids
+from trail.test.helpers import create_post
+
+
+@pytest.fixture()
+async def other_user(async_client: AsyncClient, db: Database) -> dict:
+    user_details = {"email": "other@email.com", "password": "1234"}
+    await async_client.post("/register", json=user_details)
+    await db.execute(
+        user_table.update()
+        .where(user_table.c.email == user_details["email"])
+        .values(confirmed=True)
+    )
+    user = await db.fetch_one(
+        user_table.select().where(user_table.c.email == user_details["email"])
+    )
+    response = await async_client.post("/token", json=user_details)
+    return {
+        **user_details,
+        "id": user.id,
+        "token": response.json()["access_token"],
+    }
+
+
+async def follow(async_client: AsyncClient, user_id: int, token: str):
+    return await async_client.post(
+        f"/follow/{user_id}", headers={"Authorization": f"Bearer {token}"}
+    )
+
+
+async def get_feed(async_client: AsyncClient, token: str, **params) -> dict:
+    response = await async_client.get(
+        "/feed", params=params, headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 200
+    return response.json()
+
+
+def feed_bodies(page: dict) -> list[str]:
+    return [post["body"] for post in page["posts"]]
+
+
+@pytest.mark.anyio
+async def test_feed_has_followed_and_own_posts(
+    async_client: AsyncClient, logged_in_token: str, other_user: dict
+):
+    await create_post("before follow", async_client, other_user["token"])
+    response = await follow(async_client, other_user["id"], logged_in_token)
+    assert response.status_code == 201
+
+    await create_post("after follow", async_client, other_user["token"])
+    await create_post("own post", async_client, logged_in_token)
+
+    page = await get_feed(async_client, logged_in_token)
+
+    assert feed_bodies(page) == ["own post", "after follow", "before follow"]
+    page = await get_feed(async_client, other_user["token"])
+    assert feed_bodies(page) == ["after follow", "before follow"]
+
+
+@pytest.mark.anyio
+async def test_feed_pagination(
+    async_client: AsyncClient, logged_in_token: str, other_user: dict
+):
+    await follow(async_client, other_user["id"], logged_in_token)
+    for body in ("first", "second", "third"):
+        await create_post(body, async_client, other_user["token"])
+
+    page = await get_feed(async_client, logged_in_token, limit=2)
+    assert feed_bodies(page) == ["third", "second"]
+
+    page = await get_feed(
+        async_client, logged_in_token, limit=2, after=page["next_cursor"]
+    )
+    assert feed_bodies(page) == ["first"]
+    assert page["next_cursor"] is None
+
+
+@pytest.mark.anyio
+async def test_unfollow_removes_posts(
+    async_client: AsyncClient, logged_in_token: str, other_user: dict
+):
+    await follow(async_client, other_user["id"], logged_in_token)
+    await create_post("followed", async_client, other_user["token"])
+
+    response = await async_client.delete(
+        f"/follow/{other_user['id']}",
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+
+    assert response.status_code == 204
+    assert feed_bodies(await get_feed(async_client, logged_in_token)) == []
+
+
+@pytest.mark.anyio
+async def test_follow_errors(
+    async_client: AsyncClient,
+    logged_in_token: str,
+    confirmed_user: dict,
+    other_user: dict,
+):
+    assert (
+        await follow(async_client, confirmed_user["id"], logged_in_token)
+    ).status_code == 400
+    assert (await follow(async_client, 999, logged_in_token)).status_code == 404
+
+    await follow(async_client, other_user["id"], logged_in_token)
+    assert (
+        await follow(async_client, other_user["id"], logged_in_token)
+    ).status_code == 200
+
+    response = await async_client.delete(
+        f"/follow/{confirmed_user['id']}",
+        headers={"Authorization": f"Bearer {other_user['token']}"},
+    )
+    assert response.status_code == 404
+
+
+@pytest.mark.anyio
+async def test_large_authors_merged_on_read(
+    async_client: AsyncClient, logged_in_token: str, other_user: dict, db, mocker
+):
+    await follow(async_client, other_user["id"], logged_in_token)
+    await create_post("fanned out", async_client, other_user["token"])
+    mocker.patch("trail.feed.config.FEED_FANOUT_MAX_FOLLOWERS", 0)
+    await create_post("merged", async_client, other_user["token"])
+
+    rows = await db.fetch_all(
+        timeline_table.select().where(timeline_table.c.user_id != other_user["id"])
+    )
+    page = await get_feed(async_client, logged_in_token)
+
+    assert len(rows) == 1
+    assert feed_bodies(page) == ["merged", "fanned out"]
+
+
+@pytest.mark.anyio
+async def test_large_batches_merged_on_read(
+    async_client: AsyncClient, logged_in_token: str, other_user: dict, db, mocker
+):
+    await follow(async_client, other_user["id"], logged_in_token)
+    # one follower, a single post is fanned out but two are over the limit
+    mocker.patch("trail.feed.config.FEED_FANOUT_MAX_FOLLOWERS", 1)
+    await async_client.post(
+        "/post/batch",
+        json=[{"body": "first"}, {"body": "second"}],
+        headers={"Authorization": f"Bearer {other_user['token']}"},
+    )
+
+    rows = await db.fetch_all(
+        timeline_table.select().where(timeline_table.c.user_id != other_user["id"])
+    )
+    page = await get_feed(async_client, logged_in_token)
+
+    assert rows == []
+    assert feed_bodies(page) == ["second", "first"]
+
+
+@pytest.mark.anyio
+async def test_author_back_under_limit_keeps_merged_posts(
+    async_client: AsyncClient, logged_in_token: str, other_user: dict, mocker
+):
+    await follow(async_client, other_user["id"], logged_in_token)
+    limit = mocker.patch("trail.feed.config.FEED_FANOUT_MAX_FOLLOWERS", 0)
+    await create_post("merged", async_client, other_user["token"])
+    # the author drops back under the limit, later posts are fanned out
+    mocker.stop(limit)
+    await create_post("fanned out", async_client, other_user["token"])
+
+    page = await get_feed(async_client, logged_in_token)
+
+    assert feed_bodies(page) == ["fanned out", "merged"]
+
+
+@pytest.mark.anyio
+async def test_feed_reads_timeline_index(db: Database):
+    query = feed_post_ids(1, [], 21, 1000).compile(
+        dialect=sqlite.dialect(), compile_kwargs={"literal_binds": True}
+    )
+
+    plan = await db.fetch_all(f"EXPLAIN QUERY PLAN {query}")
+    details = " ".join(row.detail for row in plan)
+
+    assert "SEARCH timeline USING" in details
+    assert "TEMP B-TREE" not in details
@@ -1,7 +1,14 @@
+import json
+
 import pytest
+from databases import Database
 from httpx import AsyncClient
+from sqlalchemy.dialects import sqlite
 
 from trail import security
+from trail.pagination import encode_cursor
+from trail.routers import post as post_router
+from trail.routers.post import PostSorting, build_posts_query
 from trail.test.helpers import create_comment, create_like, create_post
 
 
@@ -71,7 +78,74 @@ async def test_get_all_posts(async_client: AsyncClient, created_post: dict):
     response = await async_client.get("/post")
 
     assert response.status_code == 200
-    assert response.json() <= [{**created_post, "likes": 0}]
+    assert response.json()["posts"] == [
+        {**created_post, "likes": 0, "comment_count": 0}
+    ]
+    assert response.json()["next_cursor"] is None
+
+
+@pytest.mark.anyio
+async def test_get_all_posts_streamed_as_json(
+    async_client: AsyncClient, logged_in_token: str
+):
+    posts = [
+        await create_post(f"post {i}", async_client, logged_in_token) for i in range(3)
+    ]
+
+    response = await async_client.get("/post", params={"stream": "json", "limit": 1})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/json"
+    assert response.json() == [
+        {**post, "likes": 0, "comment_count": 0} for post in reversed(posts)
+    ]
+
+
+@pytest.mark.anyio
+async def test_get_all_posts_streamed_as_ndjson(
+    async_client: AsyncClient, logged_in_token: str
+):
+    for i in range(3):
+        await create_post(f"post {i}", async_client, logged_in_token)
+
+    response = await async_client.get(
+        "/post", params={"stream": "ndjson", "sorting": "old"}
+    )
+
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = response.text.splitlines()
+    assert [json.loads(line)["body"] for line in lines] == [
+        "post 0",
+        "post 1",
+        "post 2",
+    ]
+
+
+@pytest.mark.anyio
+async def test_streamed_rows_capped(
+    async_client: AsyncClient, logged_in_token: str, mocker
+):
+    mocker.patch("trail.routers.post.config.RESPONSE_STREAM_MAX_ROWS", 2)
+    for i in range(3):
+        await create_post(f"post {i}", async_client, logged_in_token)
+
+    response = await async_client.get("/post", params={"stream": "json"})
+
+    assert [post["body"] for post in response.json()] == ["post 2", "post 1"]
+
+
+@pytest.mark.anyio
+async def test_streams_rate_limited(async_client: AsyncClient, mocker):
+    mocker.patch.object(post_router.stream_rate_limit, "per_minute", 1)
+
+    first = await async_client.get("/post", params={"stream": "json"})
+    second = await async_client.get("/post/1/comments", params={"stream": "json"})
+    paged = await async_client.get("/post")
+
+    assert (first.status_code, second.status_code) == (200, 429)
+    assert first.headers["RateLimit-Limit"] == "1"
+    assert first.headers["RateLimit-Remaining"] == "0"
+    assert paged.status_code == 200
 
 
 @pytest.mark.anyio
@@ -111,7 +185,7 @@ async def test_sorting(
     assert response.status_code == 200
 
     expected_order = expected_order
-    data = response.json()
+    data = response.json()["posts"]
     order = [post["id"] for post in data]
 
     assert expected_order == order
@@ -128,12 +202,68 @@ async def test_sorting_likes(async_client: AsyncClient, logged_in_token: str):
     assert response.status_code == 200
 
     expected_order = [2, 1]
-    data = response.json()
+    data = response.json()["posts"]
     order = [post["id"] for post in data]
 
     assert expected_order == order
 
 
+@pytest.mark.anyio
+@pytest.mark.parametrize(
+    "sorting, expected_order",
+    [
+        ("new", [3, 2, 1]),
+        ("old", [1, 2, 3]),
+        ("most_likes", [2, 3, 1]),
+        ("hot", [2, 3, 1]),
+    ],
+)
+async def test_get_all_posts_paginated(
+    async_client: AsyncClient,
+    sorting: str,
+    expected_order: list[int],
+    logged_in_token: str,
+):
+    for body in ("Test Post 1", "Test Post 2", "Test Post 3"):
+        await create_post(body, async_client, logged_in_token)
+    await create_like(2, async_client, logged_in_token)
+
+    order = []
+    params = {"sorting": sorting, "limit": 2}
+    while True:
+        response = await async_client.get("/post", params=params)
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data["posts"]) <= 2
+        order += [post["id"] for post in data["posts"]]
+        if data["next_cursor"] is None:
+            break
+        params["after"] = data["next_cursor"]
+
+    assert order == expected_order
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("sorting", ["most_likes", "hot"])
+async def test_ranked_page_reads_index(sorting: str, db: Database):
+    query = build_posts_query(
+        PostSorting(sorting), 20, encode_cursor(sorting, 1, 1000)
+    ).compile(dialect=sqlite.dialect(), compile_kwargs={"literal_binds": True})
+
+    plan = await db.fetch_all(f"EXPLAIN QUERY PLAN {query}")
+    details = " ".join(row.detail for row in plan)
+
+    assert "USING INDEX ix_POST_" in details
+    assert "TEMP B-TREE" not in details
+
+
+@pytest.mark.anyio
+async def test_get_all_posts_invalid_cursor(async_client: AsyncClient):
+    response = await async_client.get("/post", params={"after": "not-a-cursor"})
+
+    assert response.status_code == 400
+
+
 @pytest.mark.anyio
 async def test_create_comment(
     async_client: AsyncClient, created_post: dict, logged_in_token: str
@@ -160,6 +290,21 @@ async def test_get_comment(
     assert response.status_code == 200
 
 
+@pytest.mark.anyio
+async def test_get_comments_streamed(
+    async_client: AsyncClient,
+    created_post: dict,
+    created_comment: dict,
+):
+    response = await async_client.get(
+        f"/post/{created_post['id']}/comments", params={"stream": "ndjson"}
+    )
+
+    assert [json.loads(line) for line in response.text.splitlines()] == [
+        created_comment
+    ]
+
+
 @pytest.mark.anyio
 async def test_get_post_with_comments(
     async_client: AsyncClient,
@@ -171,6 +316,51 @@ async def test_get_post_with_comments(
     assert response.status_code == 200
 
 
+@pytest.mark.anyio
+async def test_get_post_with_comments_paginated(
+    async_client: AsyncClient, created_post: dict, logged_in_token: str
+):
+    for body in ("comment 1", "comment 2", "comment 3"):
+        await create_comment(body, created_post["id"], async_client, logged_in_token)
+
+    response = await async_client.get(
+        f"/post/{created_post['id']}", params={"comments_limit": 2}
+    )
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["post"] == {**created_post, "likes": 0, "comment_count": 3}
+    assert [comment["body"] for comment in data["comments"]] == [
+        "comment 1",
+        "comment 2",
+    ]
+
+    response = await async_client.get(
+        f"/post/{created_post['id']}/comments",
+        params={"after": data["comments_cursor"]},
+    )
+
+    assert response.status_code == 200
+    assert [comment["body"] for comment in response.json()["comments"]] == ["comment 3"]
+    assert response.json()["next_cursor"] is None
+
+
+@pytest.mark.anyio
+async def test_get_post_without_comments(async_client: AsyncClient, created_post: dict):
+    response = await async_client.get(f"/post/{created_post['id']}")
+
+    assert response.status_code == 200
+    assert response.json()["comments"] == []
+    assert response.json()["comments_cursor"] is None
+
+
+@pytest.mark.anyio
+async def test_get_missing_post(async_client: AsyncClient):
+    response = await async_client.get("/post/404")
+
+    assert response.status_code == 404
+
+
 @pytest.mark.anyio
 async def test_like(async_client: AsyncClient, created_post: dict, logged_in_token):
     response = await async_client.post(
@@ -180,3 +370,136 @@ async def test_like(async_client: AsyncClient, created_post: dict, logged_in_tok
     )
 
     assert response.status_code == 201
+
+
+@pytest.mark.anyio
+async def test_like_twice(
+    async_client: AsyncClient, created_post: dict, logged_in_token: str
+):
+    first = await create_like(created_post["id"], async_client, logged_in_token)
+    response = await async_client.post(
+        "/like",
+        json={"post_id": created_post["id"]},
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+
+    assert response.status_code == 200
+    assert response.json() == first
+
+    response = await async_client.get(f"/post/{created_post['id']}")
+    assert response.json()["post"]["likes"] == 1
+
+
+@pytest.mark.anyio
+async def test_create_posts_batch(async_client: AsyncClient, logged_in_token: str):
+    response = await async_client.post(
+        "/post/batch",
+        json=[{"body": "post 1"}, {"body": "post 2"}],
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+
+    assert response.status_code == 200
+    assert response.json()["created"] == 2
+    ids = [result["id"] for result in response.json()["results"]]
+    response = await async_client.get("/post", params={"sorting": "old"})
+    assert [(post["id"], post["body"]) for post in response.json()["posts"]] == list(
+        zip(ids, ["post 1", "post 2"])
+    )
+
+
+@pytest.mark.anyio
+async def test_create_posts_batch_invalid(
+    async_client: AsyncClient, logged_in_token: str
+):
+    response = await async_client.post(
+        "/post/batch",
+        json=[{"body": "post 1"}, {}],
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+
+    assert response.status_code == 422
+
+
+@pytest.mark.anyio
+async def test_create_comments_batch(
+    async_client: AsyncClient, created_post: dict, logged_in_token: str
+):
+    response = await async_client.post(
+        "/comment/batch",
+        json=[
+            {"body": "comment 1", "post_id": created_post["id"]},
+            {"body": "comment 2", "post_id": 404},
+            {"body": "comment 3", "post_id": created_post["id"]},
+        ],
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+
+    assert response.status_code == 200
+    data = response.json()
+    assert (data["created"], data["failed"]) == (2, 1)
+    assert [result["status"] for result in data["results"]] == [
+        "created",
+        "failed",
+        "created",
+    ]
+
+    response = await async_client.get(f"/post/{created_post['id']}")
+    assert response.json()["post"]["comment_count"] == 2
+    assert [comment["id"] for comment in response.json()["comments"]] == [
+        data["results"][0]["id"],
+        data["results"][2]["id"],
+    ]
+
+
+@pytest.mark.anyio
+async def test_post_likes_batch(
+    async_client: AsyncClient, created_post: dict, logged_in_token: str
+):
+    response = await async_client.post(
+        "/like/batch",
+        json=[
+            {"post_id": created_post["id"]},
+            {"post_id": 404},
+            {"post_id": created_post["id"]},
+        ],
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [result["status"] for result in results] == ["created", "failed", "exists"]
+    assert results[2]["id"] == results[0]["id"]
+
+    response = await async_client.get(f"/post/{created_post['id']}")
+    assert response.json()["post"]["likes"] == 1
+
+
+@pytest.mark.anyio
+async def test_unlike(async_client: AsyncClient, created_post: dict, logged_in_token):
+    await create_like(created_post["id"], async_client, logged_in_token)
+    headers = {"Authorization": f"Bearer {logged_in_token}"}
+
+    for _ in range(2):
+        response = await async_client.delete(
+            f"/like/{created_post['id']}", headers=headers
+        )
+        assert response.status_code == 204
+
+    response = await async_client.get(f"/post/{created_post['id']}")
+    assert response.json()["post"]["likes"] == 0
+
+    liked = await async_client.post(
+        "/like", json={"post_id": created_post["id"]}, headers=headers
+    )
+    assert liked.status_code == 201
+    response = await async_client.get(f"/post/{created_post['id']}")
+    assert response.json()["post"]["likes"] == 1
+
+
+@pytest.mark.anyio
+async def test_unlike_missing_post(async_client: AsyncClient, logged_in_token: str):
+    response = await async_client.delete(
+        "/like/2", headers={"Authorization": f"Bearer {logged_in_token}"}
+    )
+
+    assert response.status_code == 404
@@ -0,0 +1,75 @@
+import pytest
+from httpx import AsyncClient
+
+from trail.search import build_match_query
+from trail.test.helpers import create_comment, create_post
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize(
+    "q, expected",
+    [
+        ("hello world", '"hello" "world"*'),
+        ("cat* AND dog", '"cat"* "AND" "dog"*'),
+        ('"unbalanced', '"unbalanced"*'),
+        ("-- ()", None),
+    ],
+)
+async def test_build_match_query(q: str, expected: str):
+    assert build_match_query(q) == expected
+
+
+@pytest.mark.anyio
+async def test_search_posts_and_comments(
+    async_client: AsyncClient, logged_in_token: str
+):
+    post = await create_post("Gardening in spring", async_client, logged_in_token)
+    await create_post("Cooking dinner", async_client, logged_in_token)
+    comment = await create_comment(
+        "I love gardens", post["id"], async_client, logged_in_token
+    )
+
+    response = await async_client.get("/search", params={"q": "garden"})
+
+    assert response.status_code == 200
+    hits = {(hit["kind"], hit["id"]) for hit in response.json()["results"]}
+    assert hits == {("post", post["id"]), ("comment", comment["id"])}
+
+
+@pytest.mark.anyio
+async def test_search_ranked(async_client: AsyncClient, logged_in_token: str):
+    await create_post(
+        "tea and a long list of other words", async_client, logged_in_token
+    )
+    best = await create_post("tea tea tea", async_client, logged_in_token)
+
+    response = await async_client.get("/search", params={"q": "tea"})
+
+    assert response.json()["results"][0]["id"] == best["id"]
+
+
+@pytest.mark.anyio
+async def test_search_paginated(async_client: AsyncClient, logged_in_token: str):
+    for i in range(5):
+        await create_post(f"paged post {i}", async_client, logged_in_token)
+
+    ids = []
+    params = {"q": "paged", "limit": 2}
+    while True:
+        response = await async_client.get("/search", params=params)
+        data = response.json()
+        assert len(data["results"]) <= 2
+        ids += [hit["id"] for hit in data["results"]]
+        if data["next_cursor"] is None:
+            break
+        params["after"] = data["next_cursor"]
+
+    assert sorted(ids) == [1, 2, 3, 4, 5]
+
+
+@pytest.mark.anyio
+async def test_search_without_terms(async_client: AsyncClient):
+    response = await async_client.get("/search", params={"q": "!!"})
+
+    assert response.status_code == 200
+    assert response.json() == {"results": [], "next_cursor": None}
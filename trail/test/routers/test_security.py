@@ -1,4 +1,8 @@
+import asyncio
+import threading
+
 import pytest
+from fastapi import HTTPException
 
 from trail import security
 
@@ -20,3 +24,65 @@ async def test_current_user(confirmed_user: dict):
     # }.items() >= (await security.get_current_user(token).items())
     # # async items can't be done like this so use await before async func
     assert user.email == confirmed_user["email"]
+
+
+@pytest.mark.anyio
+async def test_current_user_is_cached(confirmed_user: dict, mocker):
+    token = security.create_access_token(confirmed_user["email"])
+    await security.get_current_user(token)
+    get_user = mocker.spy(security, "get_user")
+    decode_token = mocker.spy(security, "decode_token")
+
+    user = await security.get_current_user(token)
+
+    assert user.email == confirmed_user["email"]
+    get_user.assert_not_called()
+    decode_token.assert_not_called()
+
+
+@pytest.mark.anyio
+async def test_current_user_cache_invalidated(confirmed_user: dict, mocker):
+    token = security.create_access_token(confirmed_user["email"])
+    await security.get_current_user(token)
+    get_user = mocker.spy(security, "get_user")
+
+    security.invalidate_cached_user(confirmed_user["email"])
+    await security.get_current_user(token)
+
+    get_user.assert_called_once_with(confirmed_user["email"])
+
+
+@pytest.mark.anyio
+async def test_expired_token_not_cached(confirmed_user: dict, mocker):
+    mocker.patch("trail.security.access_token_expire_minutes", return_value=-1)
+    token = security.create_access_token(confirmed_user["email"])
+
+    with pytest.raises(HTTPException):
+        await security.get_current_user(token)
+
+    assert security.token_cache.get(token) is None
+
+
+@pytest.mark.anyio
+async def test_password_hash_in_pool():
+    password_hash = await security.get_password_hash_async("1234")
+
+    assert await security.verify_password_async("1234", password_hash)
+    assert not await security.verify_password_async("4321", password_hash)
+
+
+@pytest.mark.anyio
+async def test_password_hash_pool_saturated():
+    pool = security.PasswordHashPool(kind="thread", workers=1, queue_size=1)
+    release = threading.Event()
+    running = asyncio.ensure_future(pool.run(release.wait, 5))
+    await asyncio.sleep(0)
+
+    with pytest.raises(HTTPException) as exc_info:
+        await pool.run(security.get_password_hash, "1234")
+
+    release.set()
+    await running
+    pool.shutdown()
+    assert exc_info.value.status_code == 429
+    assert pool.pending == 0
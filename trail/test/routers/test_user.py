@@ -34,6 +34,21 @@ async def test_token(async_client: AsyncClient, confirmed_user: dict):
     assert response.status_code == 200
 
 
+@pytest.mark.anyio
+async def test_token_password_pool_saturated(
+    async_client: AsyncClient, confirmed_user: dict, mocker
+):
+    mocker.patch("trail.security.password_pool.queue_size", 0)
+    response = await async_client.post(
+        "/token",
+        json={
+            "email": confirmed_user["email"],
+            "password": confirmed_user["password"],
+        },
+    )
+    assert response.status_code == 429
+
+
 @pytest.mark.anyio
 async def test_user_confirmation(async_client: AsyncClient, mocker):
     spy = mocker.spy(Request, "url_for")
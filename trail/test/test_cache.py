@@ -0,0 +1,40 @@
+import pytest
+
+from trail.cache import TTLCache
+
+
+@pytest.mark.anyio
+async def test_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+
+@pytest.mark.anyio
+async def test_cache_expires_entries(mocker):
+    clock = mocker.patch("trail.cache.time.monotonic", return_value=100)
+    cache = TTLCache(maxsize=2, ttl=10)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=1)
+
+    clock.return_value = 105
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+
+    clock.return_value = 111
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+@pytest.mark.anyio
+async def test_cache_skips_expired_ttl():
+    cache = TTLCache(maxsize=2, ttl=10)
+    cache.set("a", 1, ttl=-5)
+
+    assert cache.get("a") is None
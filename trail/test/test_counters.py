@@ -0,0 +1,49 @@
+import pytest
+from databases import Database
+from httpx import AsyncClient
+
+from trail.counters import reconcile_post_counters
+from trail.database import comment_table, like_table, post_table
+from trail.ranking import hot_score, rebuild_hot_scores
+from trail.test.helpers import create_comment, create_like
+
+
+@pytest.mark.anyio
+async def test_counters_updated_on_write(
+    async_client: AsyncClient, created_post: dict, logged_in_token: str
+):
+    await create_like(created_post["id"], async_client, logged_in_token)
+    await create_comment("a comment", created_post["id"], async_client, logged_in_token)
+
+    response = await async_client.get(f"/post/{created_post['id']}")
+
+    assert response.json()["post"]["likes"] == 1
+    assert response.json()["post"]["comment_count"] == 1
+
+
+@pytest.mark.anyio
+async def test_reconcile_post_counters(
+    created_post: dict, confirmed_user: dict, db: Database
+):
+    data = {"post_id": created_post["id"], "user_id": confirmed_user["id"]}
+    await db.execute(like_table.insert().values(data))
+    await db.execute(comment_table.insert().values({**data, "body": "comment"}))
+    await db.execute(post_table.update().values(like_count=7, comment_count=7))
+
+    await reconcile_post_counters(db)
+
+    query = post_table.select().where(post_table.c.id == created_post["id"])
+    post = await db.fetch_one(query)
+    assert post.like_count == 1
+    assert post.comment_count == 1
+
+
+@pytest.mark.anyio
+async def test_rebuild_hot_scores(created_post: dict, db: Database):
+    await db.execute(post_table.update().values(like_count=9, hot_score=0))
+
+    await rebuild_hot_scores(db)
+
+    query = post_table.select().where(post_table.c.id == created_post["id"])
+    post = await db.fetch_one(query)
+    assert post.hot_score == pytest.approx(hot_score(9, post.created_at))
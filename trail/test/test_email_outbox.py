@@ -0,0 +1,184 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from trail.email_outbox import EmailOutbox, OutboxFullError
+from trail.ratelimit import TokenBucket
+
+
+class FakeMailgun:
+    """A local stand-in for the Mailgun messages API."""
+
+    def __init__(self) -> None:
+        self.statuses: list[int] = []
+        self.received: list[dict] = []
+        self.app = FastAPI()
+        self.app.post("/v3/{domain}/messages")(self.messages)
+
+    async def messages(self, domain: str, request: Request):
+        form = await request.form()
+        self.received.append(
+            {
+                "to": form.getlist("to"),
+                "subject": form["subject"],
+                "text": form["text"],
+                "recipient-variables": json.loads(form["recipient-variables"]),
+            }
+        )
+        status_code = self.statuses.pop(0) if self.statuses else 200
+        headers = {"Retry-After": "0"} if status_code == 429 else None
+        return JSONResponse({}, status_code=status_code, headers=headers)
+
+
+@pytest.fixture()
+async def fake_mailgun():
+    fake = FakeMailgun()
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=fake.app)) as ac:
+        fake.client = ac
+        yield fake
+
+
+def create_outbox(fake_mailgun: FakeMailgun, **kwargs) -> EmailOutbox:
+    options = {"rate": 1000, "burst": 1000, "retry_base": 0, **kwargs}
+    return EmailOutbox(client=fake_mailgun.client, **options)
+
+
+@pytest.mark.anyio
+async def test_outbox_coalesces_batches(fake_mailgun: FakeMailgun):
+    outbox = create_outbox(fake_mailgun, batch_size=2)
+    for n in range(3):
+        outbox.enqueue(
+            f"user{n}@email.com", "Confirm", "Go to %recipient.url%", {"url": n}
+        )
+    outbox.enqueue("other@email.com", "Welcome", "Hello")
+    assert outbox.queue_depth == 4
+
+    await outbox.flush()
+
+    assert sorted(len(batch["to"]) for batch in fake_mailgun.received) == [1, 1, 2]
+    confirm = [
+        batch for batch in fake_mailgun.received if batch["subject"] == "Confirm"
+    ]
+    assert confirm[0]["recipient-variables"] == {
+        "user0@email.com": {"url": 0},
+        "user1@email.com": {"url": 1},
+    }
+    assert outbox.queue_depth == 0
+    assert outbox.metrics.messages_sent == 4
+    assert outbox.metrics.batches_sent == 3
+
+
+@pytest.mark.anyio
+async def test_outbox_retries_rate_limited(fake_mailgun: FakeMailgun):
+    fake_mailgun.statuses = [429, 503]
+    outbox = create_outbox(fake_mailgun)
+    outbox.enqueue("user@email.com", "Confirm", "Body")
+
+    await outbox.flush()
+
+    assert len(fake_mailgun.received) == 3
+    assert outbox.metrics.retries == 2
+    assert outbox.metrics.messages_sent == 1
+
+
+@pytest.mark.anyio
+async def test_outbox_gives_up(fake_mailgun: FakeMailgun):
+    fake_mailgun.statuses = [400]
+    outbox = create_outbox(fake_mailgun)
+    outbox.enqueue("user@email.com", "Confirm", "Body")
+
+    await outbox.flush()
+
+    assert len(fake_mailgun.received) == 1
+    assert outbox.metrics.messages_failed == 1
+    assert outbox.queue_depth == 0
+
+
+@pytest.mark.anyio
+async def test_outbox_batch_error_logged(fake_mailgun: FakeMailgun, mocker):
+    outbox = create_outbox(fake_mailgun)
+    post = fake_mailgun.client.post
+    errors = [KeyError("id")]
+
+    async def post_once_failing(*args, **kwargs):
+        if errors:
+            raise errors.pop()
+        return await post(*args, **kwargs)
+
+    mocker.patch.object(fake_mailgun.client, "post", post_once_failing)
+    outbox.enqueue("user@email.com", "Confirm", "Body")
+
+    # raising here would end run() and nothing would be sent again
+    await outbox.flush()
+    assert outbox.metrics.messages_failed == 1
+    assert outbox.queue_depth == 0
+
+    outbox.enqueue("other@email.com", "Confirm", "Body")
+    await outbox.flush()
+    assert outbox.metrics.messages_sent == 1
+
+
+@pytest.mark.anyio
+async def test_outbox_full(fake_mailgun: FakeMailgun):
+    outbox = create_outbox(fake_mailgun, max_queue=1)
+    outbox.enqueue("user@email.com", "Confirm", "Body")
+
+    with pytest.raises(OutboxFullError):
+        outbox.enqueue("other@email.com", "Confirm", "Body")
+
+
+@pytest.mark.anyio
+async def test_outbox_stop_flushes(fake_mailgun: FakeMailgun):
+    outbox = create_outbox(fake_mailgun, flush_interval=60)
+    outbox.start()
+    outbox.enqueue("user@email.com", "Confirm", "Body")
+
+    await outbox.stop()
+
+    assert len(fake_mailgun.received) == 1
+
+
+@pytest.mark.anyio
+async def test_outbox_retry_after_capped(fake_mailgun: FakeMailgun, mocker):
+    fake_mailgun.statuses = [429]
+    mocker.patch("trail.email_outbox.retry_after_seconds", return_value=86400)
+    outbox = create_outbox(fake_mailgun, max_retry_after=0)
+    outbox.enqueue("user@email.com", "Confirm", "Body")
+
+    await asyncio.wait_for(outbox.flush(), timeout=5)
+
+    assert outbox.metrics.messages_sent == 1
+
+
+@pytest.mark.anyio
+async def test_outbox_stop_deadline(fake_mailgun: FakeMailgun, mocker):
+    async def post_hanging(*args, **kwargs):
+        await asyncio.sleep(60)
+
+    mocker.patch.object(fake_mailgun.client, "post", post_hanging)
+    outbox = create_outbox(fake_mailgun, flush_interval=60, stop_timeout=0.05)
+    outbox.start()
+    outbox.enqueue("user@email.com", "Confirm", "Body")
+    outbox.enqueue("other@email.com", "Welcome", "Body")
+
+    await asyncio.wait_for(outbox.stop(), timeout=5)
+
+    assert outbox.metrics.messages_failed == 2
+    assert outbox.queue_depth == 0
+
+
+@pytest.mark.anyio
+async def test_token_bucket(mocker):
+    clock = mocker.patch("trail.ratelimit.time.monotonic", return_value=0)
+    bucket = TokenBucket(rate=2, capacity=2)
+
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() == 0.5
+
+    clock.return_value = 0.5
+    assert bucket.try_acquire() == 0
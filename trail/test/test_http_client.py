@@ -0,0 +1,15 @@
+import pytest
+
+from trail import http_client
+
+
+@pytest.mark.anyio
+async def test_http_client_is_shared():
+    client = http_client.get_http_client()
+
+    assert http_client.get_http_client() is client
+
+    await http_client.close_http_client()
+    assert client.is_closed
+    assert http_client.get_http_client() is not client
+    await http_client.close_http_client()
@@ -0,0 +1,240 @@
+import asyncio
+
+import httpx
+import pytest
+from databases import Database
+from httpx import AsyncClient
+
+from trail import jobs
+from trail.broadcast import broadcaster
+from trail.database import job_completion_table, job_table
+from trail.metrics import serve_metrics
+from trail.worker import start_metrics_server, work
+
+
+@pytest.fixture()
+async def image_job(created_post: dict, db: Database) -> int:
+    return await jobs.enqueue_job(
+        db,
+        "generate_image",
+        {"post_id": created_post["id"], "post_url": "/post/1", "prompt": "A Cat"},
+        post_id=created_post["id"],
+        max_attempts=2,
+    )
+
+
+async def get_job(db: Database, job_id: int):
+    return await db.fetch_one(job_table.select().where(job_table.c.id == job_id))
+
+
+@pytest.mark.anyio
+async def test_create_post_with_prompt(async_client: AsyncClient, logged_in_token: str):
+    response = await async_client.post(
+        "/post?prompt=A Cat",
+        json={"body": "A new post"},
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+    assert response.status_code == 201
+
+    response = await async_client.get(f"/post/{response.json()['id']}/image")
+
+    assert response.json()["status"] == "queued"
+    assert response.json()["url_link"] is None
+
+
+@pytest.mark.anyio
+async def test_image_status_without_job(async_client: AsyncClient, created_post: dict):
+    response = await async_client.get(f"/post/{created_post['id']}/image")
+
+    assert response.status_code == 200
+    assert response.json()["status"] == "none"
+
+
+@pytest.mark.anyio
+async def test_run_job(
+    async_client: AsyncClient, stub_transport, image_job: int, db: Database
+):
+    json_data = {"output_url": "https://www.example.com/image.jpg"}
+    stub_transport.response = httpx.Response(status_code=200, json=json_data)
+
+    job = await jobs.lease_job(db, lease_seconds=60)
+    assert job.id == image_job
+    await jobs.run_job(db, job)
+
+    response = await async_client.get(f"/post/{job.post_id}/image")
+    assert response.json()["status"] == "succeeded"
+    assert response.json()["url_link"] == json_data["output_url"]
+    assert await jobs.lease_job(db, lease_seconds=60) is None
+
+
+@pytest.mark.anyio
+async def test_finished_job_seen_by_web_process(
+    async_client: AsyncClient, stub_transport, image_job: int, db: Database
+):
+    json_data = {"output_url": "https://www.example.com/image.jpg"}
+    stub_transport.response = httpx.Response(status_code=200, json=json_data)
+    watcher = jobs.JobCompletionWatcher(db)
+    assert await watcher.check() == 0
+    job = await jobs.lease_job(db, lease_seconds=60)
+    # cached before the worker adds the image
+    response = await async_client.get(f"/post/{job.post_id}")
+    assert response.json()["post"]["url_link"] is None
+
+    await jobs.run_job(db, job)
+    subscriber = broadcaster.subscribe(f"post:{job.post_id}")
+    try:
+        assert await watcher.check() == 1
+        _, event, data = subscriber.queue.get_nowait()
+    finally:
+        broadcaster.unsubscribe(subscriber)
+
+    assert event == "post_image"
+    assert data == {"post_id": job.post_id, "url_link": json_data["output_url"]}
+    response = await async_client.get(f"/post/{job.post_id}")
+    assert response.json()["post"]["url_link"] == json_data["output_url"]
+    assert await watcher.check() == 0
+
+
+@pytest.mark.anyio
+async def test_completion_committed_late_still_seen(db: Database, mocker):
+    invalidate = mocker.patch("trail.jobs.response_cache.invalidate")
+    watcher = jobs.JobCompletionWatcher(db)
+    assert await watcher.check() == 0
+    start = watcher._cursor
+
+    async def complete(completion_id: int):
+        await db.execute(
+            job_completion_table.insert().values(
+                id=completion_id, job_id=1, kind="test", created_at=0
+            )
+        )
+
+    # a higher id committed first, the lower one only after it was read
+    await complete(start + 2)
+    assert await watcher.check() == 1
+    await complete(start + 1)
+    assert await watcher.check() == 1
+    assert await watcher.check() == 0
+    assert invalidate.call_count == 2
+
+
+@pytest.mark.anyio
+async def test_run_job_retries_with_backoff(
+    stub_transport, image_job: int, db: Database, mocker
+):
+    stub_transport.response = httpx.Response(status_code=500, content="")
+
+    job = await jobs.lease_job(db, lease_seconds=60)
+    await jobs.run_job(db, job)
+
+    job = await get_job(db, image_job)
+    assert job.status == "queued"
+    assert job.attempts == 1
+    assert "500" in job.last_error
+    # not due again until the backoff has passed
+    assert await jobs.lease_job(db, lease_seconds=60) is None
+
+    mocker.patch("trail.jobs.time.time", return_value=job.run_at + 1)
+    job = await jobs.lease_job(db, lease_seconds=60)
+    await jobs.run_job(db, job)
+
+    job = await get_job(db, image_job)
+    assert job.status == "failed"
+    assert job.attempts == 2
+
+
+@pytest.mark.anyio
+async def test_expired_lease_taken_again(image_job: int, db: Database):
+    first = await jobs.lease_job(db, lease_seconds=-1)
+    second = await jobs.lease_job(db, lease_seconds=60)
+
+    assert second.id == first.id == image_job
+    assert second.attempts == 2
+    assert second.lease_token != first.lease_token
+
+
+@pytest.mark.anyio
+async def test_expired_lease_fails_after_max_attempts(image_job: int, db: Database):
+    for _ in range(2):
+        await jobs.lease_job(db, lease_seconds=-1)
+
+    assert await jobs.lease_job(db, lease_seconds=60) is None
+    job = await get_job(db, image_job)
+    assert job.status == "failed"
+    assert job.attempts == 2
+    assert job.lease_token is None
+
+
+@pytest.mark.anyio
+async def test_retry_delay(mocker):
+    mocker.patch("trail.jobs.config.JOB_RETRY_BASE_SECONDS", 2)
+    mocker.patch("trail.jobs.config.JOB_RETRY_MAX_SECONDS", 10)
+
+    assert [jobs.retry_delay(attempt) for attempt in range(1, 6)] == [2, 4, 8, 10, 10]
+
+
+@pytest.mark.anyio
+async def test_work_bounded_concurrency(db: Database, mocker):
+    active = 0
+    peak = 0
+    done = []
+
+    async def handler(database, payload):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        done.append(payload["n"])
+
+    mocker.patch.dict(jobs.JOB_HANDLERS, {"test": handler})
+    for n in range(5):
+        await jobs.enqueue_job(db, "test", {"n": n})
+
+    stop = asyncio.Event()
+    worker = asyncio.create_task(work(db, stop, concurrency=2, poll_interval=0.01))
+
+    async def all_done():
+        while len(done) < 5:
+            await asyncio.sleep(0.01)
+
+    await asyncio.wait_for(all_done(), timeout=5)
+    stop.set()
+    await worker
+
+    assert sorted(done) == [0, 1, 2, 3, 4]
+    assert peak <= 2
+
+
+@pytest.mark.anyio
+async def test_work_survives_lease_errors(db: Database, mocker):
+    mocker.patch("trail.worker.retry_delay", return_value=0.01)
+    stop = asyncio.Event()
+    calls = 0
+
+    async def lease_job(database, lease_seconds):
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            raise OSError("database is locked")
+        stop.set()
+
+    mocker.patch("trail.worker.lease_job", lease_job)
+
+    await asyncio.wait_for(work(db, stop, poll_interval=0.01), timeout=5)
+
+    assert calls == 2
+
+
+@pytest.mark.anyio
+async def test_worker_runs_without_metrics_port(mocker):
+    # another worker already serves on the port
+    taken = await serve_metrics("127.0.0.1", 0)
+    port = taken.sockets[0].getsockname()[1]
+    mocker.patch("trail.worker.config.JOB_WORKER_METRICS_HOST", "127.0.0.1")
+    mocker.patch("trail.worker.config.JOB_WORKER_METRICS_PORT", port)
+    try:
+        assert await start_metrics_server() is None
+    finally:
+        taken.close()
+        await taken.wait_closed()
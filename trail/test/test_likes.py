@@ -0,0 +1,130 @@
+import pytest
+from httpx import AsyncClient
+
+from trail import likes
+from trail.database import database, like_table
+from trail.likes import LikeBuffer, LikeBufferFullError, like_buffer
+
+
+async def like_count(async_client: AsyncClient, post_id: int) -> int:
+    response = await async_client.get(f"/post/{post_id}")
+    return response.json()["post"]["likes"]
+
+
+@pytest.mark.anyio
+async def test_buffer_coalesces_likes(
+    async_client: AsyncClient, created_post: dict, confirmed_user: dict
+):
+    buffer = LikeBuffer(database, flush_interval=60)
+    post_id, user_id = created_post["id"], confirmed_user["id"]
+    buffer.add(post_id, user_id, True)
+    buffer.add(post_id, user_id, False)
+    buffer.add(post_id, user_id, True)
+
+    assert await like_count(async_client, post_id) == 0
+    await buffer.flush()
+    assert await like_count(async_client, post_id) == 1
+    assert len(await database.fetch_all(like_table.select())) == 1
+
+    buffer.add(post_id, user_id, True)
+    await buffer.flush()
+    assert await like_count(async_client, post_id) == 1
+
+
+@pytest.mark.anyio
+async def test_buffer_full(created_post: dict):
+    buffer = LikeBuffer(database, max_pending=1)
+    buffer.add(created_post["id"], 1, True)
+    # the latest change of a pending pair still replaces it
+    buffer.add(created_post["id"], 1, False)
+
+    with pytest.raises(LikeBufferFullError):
+        buffer.add(created_post["id"], 2, True)
+
+
+@pytest.mark.anyio
+async def test_buffer_stop_flushes(
+    async_client: AsyncClient, created_post: dict, confirmed_user: dict
+):
+    buffer = LikeBuffer(database, flush_interval=60)
+    buffer.start()
+    buffer.add(created_post["id"], confirmed_user["id"], True)
+
+    await buffer.stop()
+
+    assert await like_count(async_client, created_post["id"]) == 1
+
+
+@pytest.mark.anyio
+async def test_buffer_isolates_failing_change(
+    async_client: AsyncClient, created_post: dict, confirmed_user: dict, mocker
+):
+    apply = likes.apply_like_changes
+
+    async def fail_on_missing_post(database, changes):
+        if any(post_id == 999 for post_id, _ in changes):
+            raise RuntimeError("FOREIGN KEY constraint failed")
+        await apply(database, changes)
+
+    mocker.patch("trail.likes.apply_like_changes", fail_on_missing_post)
+    buffer = LikeBuffer(database, flush_interval=60, max_attempts=2)
+    buffer.add(created_post["id"], confirmed_user["id"], True)
+    buffer.add(999, confirmed_user["id"], True)
+
+    assert await buffer.flush() == {}
+    assert await like_count(async_client, created_post["id"]) == 1
+    assert buffer._pending == {(999, confirmed_user["id"]): True}
+
+    assert await buffer.flush() == {(999, confirmed_user["id"]): True}
+    assert buffer._pending == {}
+
+
+@pytest.mark.anyio
+async def test_buffer_stop_reports_lost_changes(created_post: dict, mocker):
+    mocker.patch("trail.likes.apply_like_changes", side_effect=RuntimeError)
+    buffer = LikeBuffer(database, flush_interval=60, max_attempts=3)
+    buffer.start()
+    buffer.add(created_post["id"], 1, True)
+
+    assert await buffer.stop() == {(created_post["id"], 1): True}
+
+
+@pytest.mark.anyio
+async def test_buffered_like_endpoints(
+    async_client: AsyncClient, created_post: dict, logged_in_token: str, mocker
+):
+    mocker.patch("trail.routers.post.config.LIKE_BUFFER_ENABLED", True)
+    headers = {"Authorization": f"Bearer {logged_in_token}"}
+
+    response = await async_client.post(
+        "/like", json={"post_id": created_post["id"]}, headers=headers
+    )
+    assert response.status_code == 202
+    assert response.json()["id"] is None
+
+    await like_buffer.flush()
+    assert await like_count(async_client, created_post["id"]) == 1
+
+    response = await async_client.delete(f"/like/{created_post['id']}", headers=headers)
+    assert response.status_code == 202
+    assert "RateLimit-Remaining" in response.headers
+
+    await like_buffer.flush()
+    assert await like_count(async_client, created_post["id"]) == 0
+
+
+@pytest.mark.anyio
+async def test_buffered_like_falls_back_when_full(
+    async_client: AsyncClient, created_post: dict, logged_in_token: str, mocker
+):
+    mocker.patch("trail.routers.post.config.LIKE_BUFFER_ENABLED", True)
+    mocker.patch.object(like_buffer, "max_pending", 0)
+
+    response = await async_client.post(
+        "/like",
+        json={"post_id": created_post["id"]},
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+
+    assert response.status_code == 201
+    assert await like_count(async_client, created_post["id"]) == 1
@@ -0,0 +1,99 @@
+import logging
+
+import pytest
+
+from trail.logging_config import (
+    Config_logger,
+    NonBlockingQueueHandler,
+    ofescated_email_filter,
+    stop_logging,
+)
+
+
+class CountingMessage:
+    def __init__(self) -> None:
+        self.formatted = 0
+
+    def __str__(self) -> str:
+        self.formatted += 1
+        return "expensive"
+
+
+def make_record(msg, **extra) -> logging.LogRecord:
+    record = logging.LogRecord("trail.test", logging.INFO, __file__, 1, msg, (), None)
+    record.__dict__.update(extra)
+    return record
+
+
+@pytest.mark.anyio
+async def test_queue_handler_drops_when_full():
+    handler = NonBlockingQueueHandler(queue_size=1)
+
+    for _ in range(3):
+        handler.handle(make_record("message"))
+
+    assert handler.queue.qsize() == 1
+    assert handler.dropped == 2
+
+
+@pytest.mark.anyio
+async def test_queue_handler_does_not_format():
+    handler = NonBlockingQueueHandler(queue_size=10)
+    message = CountingMessage()
+
+    handler.handle(make_record(message))
+
+    assert message.formatted == 0
+    assert handler.queue.get_nowait().getMessage() == "expensive"
+
+
+@pytest.mark.anyio
+async def test_email_filter():
+    record = make_record("message", email="test@email.com")
+
+    ofescated_email_filter(ofescated_length=2).filter(record)
+
+    assert record.email == "te**@email.com"
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("email", ["noatsign", "a@b@c", None])
+async def test_email_filter_leaves_malformed_email(email):
+    record = make_record("message", email=email)
+
+    assert ofescated_email_filter(ofescated_length=2).filter(record)
+    assert record.email == email
+
+
+@pytest.mark.anyio
+async def test_records_written_by_listener(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    Config_logger()
+    try:
+        logging.getLogger("trail.test").info("through the queue")
+    finally:
+        stop_logging()
+
+    assert "through the queue" in (tmp_path / "trail.log").read_text()
+
+
+@pytest.mark.anyio
+async def test_malformed_email_logged(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    Config_logger()
+    try:
+        logging.getLogger("trail.test").info("login", extra={"email": "noatsign"})
+    finally:
+        stop_logging()
+
+    assert "noatsign" in (tmp_path / "trail.log").read_text()
+
+
+@pytest.mark.anyio
+async def test_stop_logging_detaches_queue(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    Config_logger()
+    stop_logging()
+
+    handlers = logging.getLogger("trail").handlers
+    assert not any(isinstance(h, NonBlockingQueueHandler) for h in handlers)
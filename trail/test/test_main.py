@@ -0,0 +1,74 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from trail import config as config_module
+from trail.main import create_app
+
+# generous for slow machines, importing fastapi alone takes several times this
+IMPORT_BUDGET_SECONDS = 0.1
+
+HEAVY_MODULES = ["fastapi", "sqlalchemy", "databases", "httpx", "jose", "passlib"]
+
+
+def run_python(code: str, *args: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, *args, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+        env={**os.environ, "ENV_STATE": "test"},
+    )
+
+
+@pytest.mark.anyio
+async def test_import_time_budget():
+    result = run_python("import trail.main", "-X", "importtime")
+
+    # the last line is the cumulative time of trail.main in microseconds
+    line = result.stderr.strip().splitlines()[-1]
+    assert line.endswith("trail.main")
+    cumulative = int(line.split("|")[1])
+    assert cumulative / 1_000_000 < IMPORT_BUDGET_SECONDS
+
+
+@pytest.mark.anyio
+async def test_import_defers_heavy_modules():
+    result = run_python(
+        "import sys, trail.main\n"
+        f"print([name for name in {HEAVY_MODULES!r} if name in sys.modules])"
+    )
+
+    assert result.stdout.strip() == "[]"
+
+
+@pytest.mark.anyio
+async def test_create_app_uses_config():
+    result = run_python(
+        "from trail.config import TestConfig\n"
+        "from trail.main import create_app\n"
+        "create_app(TestConfig(DATABASE_URL='sqlite:///factory.db'))\n"
+        "from trail.database import database\n"
+        "print(database.url)"
+    )
+
+    assert result.stdout.strip() == "sqlite:///factory.db"
+
+
+@pytest.mark.anyio
+async def test_create_app_builds_new_app():
+    app = create_app()
+
+    assert app is not create_app()
+    assert "/post" in app.openapi()["paths"]
+
+
+@pytest.mark.anyio
+async def test_create_app_refuses_config_after_import():
+    # trail modules are imported by now and hold the current config
+    assert create_app(config_module.config)
+
+    with pytest.raises(RuntimeError):
+        create_app(config_module.TestConfig(DATABASE_URL="sqlite:///other.db"))
@@ -0,0 +1,107 @@
+import httpx
+import pytest
+from httpx import AsyncClient
+
+from trail.http_client import observe_response, start_timer
+from trail.metrics import (
+    CONTENT_TYPE,
+    Counter,
+    Histogram,
+    email_messages_sent,
+    job_queue_duration,
+    registry,
+    serve_metrics,
+)
+
+
+@pytest.mark.anyio
+async def test_histogram_samples():
+    histogram = Histogram("test_seconds", "help", ["route"], buckets=(0.1, 1))
+    histogram.observe(0.05, "/a")
+    histogram.observe(0.5, "/a")
+    histogram.observe(5, "/a")
+
+    assert list(histogram.samples()) == [
+        'test_seconds_bucket{route="/a",le="0.1"} 1',
+        'test_seconds_bucket{route="/a",le="1.0"} 2',
+        'test_seconds_bucket{route="/a",le="+Inf"} 3',
+        'test_seconds_sum{route="/a"} 5.55',
+        'test_seconds_count{route="/a"} 3',
+    ]
+
+
+@pytest.mark.anyio
+async def test_counter_escapes_labels():
+    counter = Counter("test_total", "help", ["path"])
+    counter.inc('a"b')
+
+    assert list(counter.samples()) == ['test_total{path="a\\"b"} 1.0']
+
+
+@pytest.mark.anyio
+async def test_metrics_endpoint(async_client: AsyncClient, created_post: dict):
+    for _ in range(2):
+        # the second read is served from the response cache
+        await async_client.get(f"/post/{created_post['id']}")
+
+    response = await async_client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert (
+        'http_request_duration_seconds_count{method="GET",'
+        'route="/post/{post_id}",status="200"}'
+    ) in response.text
+    assert 'db_query_duration_seconds_count{operation="fetch_all"}' in response.text
+    assert 'password_hash_duration_seconds_count{operation="hash"}' in response.text
+
+
+@pytest.mark.anyio
+async def test_http_client_timing():
+    request = httpx.Request("POST", "https://api.deepai.org/api/test")
+    await start_timer(request)
+    await observe_response(httpx.Response(200, request=request))
+
+    assert (
+        'http_client_request_duration_seconds_count{host="api.deepai.org",status="200"}'
+        in registry.render()
+    )
+
+
+@pytest.mark.anyio
+async def test_serve_metrics():
+    job_queue_duration.observe(1.5, "generate_image")
+    server = await serve_metrics("127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    try:
+        async with httpx.AsyncClient() as client:
+            response = await client.get(f"http://127.0.0.1:{port}/metrics")
+    finally:
+        server.close()
+        await server.wait_closed()
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == CONTENT_TYPE
+    assert 'job_queue_duration_seconds_count{kind="generate_image"}' in response.text
+
+
+@pytest.mark.anyio
+async def test_email_counters(async_client: AsyncClient):
+    email_messages_sent.inc(amount=2)
+
+    response = await async_client.get("/metrics")
+
+    assert "# TYPE email_outbox_messages_sent_total counter" in response.text
+    assert "email_outbox_messages_sent_total " in response.text
+
+
+@pytest.mark.anyio
+async def test_counter_names_match_samples(async_client: AsyncClient):
+    response = await async_client.get("/metrics")
+
+    lines = response.text.splitlines()
+    counters = [line.split()[2] for line in lines if line.endswith(" counter")]
+    assert "log_records_dropped_total" in counters
+    assert any(line.startswith("log_records_dropped_total ") for line in lines)
+    for name in counters:
+        assert name.endswith("_total")
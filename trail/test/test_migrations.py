@@ -0,0 +1,101 @@
+from typing import AsyncGenerator
+
+import pytest
+from databases import Database
+
+from trail.database import create_database, metadata
+from trail.migrations import MIGRATIONS, migrate
+from trail.migrations.v0001_initial import (
+    comment_table,
+    like_table,
+    post_table,
+    user_table,
+)
+
+
+@pytest.fixture()
+async def scratch_db(tmp_path) -> AsyncGenerator:
+    scratch = create_database(f"sqlite:///{tmp_path}/migrations.db")
+    await scratch.connect()
+    yield scratch
+    await scratch.disconnect()
+
+
+@pytest.mark.anyio
+async def test_migrate_fresh_database(scratch_db: Database):
+    applied = await migrate(scratch_db)
+
+    assert applied == [migration.version for migration in MIGRATIONS]
+    assert await migrate(scratch_db) == []
+
+
+@pytest.mark.anyio
+async def test_migrated_schema_matches_metadata(scratch_db: Database):
+    await migrate(scratch_db)
+
+    for table in metadata.sorted_tables:
+        rows = await scratch_db.fetch_all(f'PRAGMA table_info("{table.name}")')
+        assert {row.name for row in rows} == set(table.columns.keys())
+
+        rows = await scratch_db.fetch_all(f'PRAGMA index_list("{table.name}")')
+        names = {row.name for row in rows}
+        assert {index.name for index in table.indexes} <= names
+
+
+@pytest.mark.anyio
+async def test_migrate_existing_database(scratch_db: Database):
+    await migrate(scratch_db, target=1)
+    await scratch_db.execute(user_table.insert().values(id=1, email="a@b.c"))
+    await scratch_db.execute(
+        post_table.insert().values(id=1, body="old post", user_id=1)
+    )
+    for _ in range(2):
+        await scratch_db.execute(like_table.insert().values(post_id=1, user_id=1))
+    await scratch_db.execute(
+        comment_table.insert().values(body="old comment", post_id=1, user_id=1)
+    )
+
+    await migrate(scratch_db)
+
+    assert await scratch_db.fetch_val("SELECT count(*) FROM likes") == 1
+    post = await scratch_db.fetch_one('SELECT * FROM "POST"')
+    assert (post.like_count, post.comment_count) == (1, 1)
+    assert post.hot_score > 0
+    hits = await scratch_db.fetch_all(
+        "SELECT rowid FROM post_fts WHERE post_fts MATCH 'old'"
+    )
+    assert [hit.rowid for hit in hits] == [1]
+
+
+@pytest.mark.anyio
+async def test_backfills_in_batches(scratch_db: Database, mocker):
+    mocker.patch("trail.migrations.operations.BACKFILL_BATCH_SIZE", 2)
+    await migrate(scratch_db, target=1)
+    await scratch_db.execute(user_table.insert().values(id=1, email="a@b.c"))
+    await scratch_db.execute(user_table.insert().values(id=2, email="b@b.c"))
+    for post_id in range(1, 6):
+        await scratch_db.execute(
+            post_table.insert().values(id=post_id, body="old post", user_id=1)
+        )
+    # likes of post 3 twice by both users, and one of post 5
+    for user_id in (1, 2, 1, 2):
+        await scratch_db.execute(like_table.insert().values(post_id=3, user_id=user_id))
+    await scratch_db.execute(like_table.insert().values(post_id=5, user_id=2))
+    await scratch_db.execute(
+        comment_table.insert().values(body="old comment", post_id=4, user_id=1)
+    )
+
+    await migrate(scratch_db)
+
+    likes = await scratch_db.fetch_all("SELECT id FROM likes ORDER BY id")
+    assert [like.id for like in likes] == [1, 2, 5]
+    posts = await scratch_db.fetch_all(
+        'SELECT id, like_count, comment_count FROM "POST" ORDER BY id'
+    )
+    assert [(post.id, post.like_count, post.comment_count) for post in posts] == [
+        (1, 0, 0),
+        (2, 0, 0),
+        (3, 2, 0),
+        (4, 0, 1),
+        (5, 1, 0),
+    ]
@@ -0,0 +1,138 @@
+import pytest
+from httpx import AsyncClient
+
+from trail.database import database
+from trail.ratelimit import DatabaseRateLimitStore, MemoryRateLimitStore
+from trail.routers import post as post_router
+from trail.routers import user as user_router
+from trail.test.routers.test_post import create_post
+
+
+@pytest.mark.anyio
+async def test_memory_store_refuses_over_capacity():
+    store = MemoryRateLimitStore()
+
+    first = await store.hit("key", rate=1, capacity=2)
+    second = await store.hit("key", rate=1, capacity=2)
+    third = await store.hit("key", rate=1, capacity=2)
+
+    assert (first.allowed, first.remaining) == (True, 1)
+    assert (second.allowed, second.remaining) == (True, 0)
+    assert not third.allowed
+    assert 0 < third.retry_after <= 1
+    assert (await store.hit("other", rate=1, capacity=2)).allowed
+
+
+@pytest.mark.anyio
+async def test_memory_store_bounded():
+    store = MemoryRateLimitStore(max_keys=2)
+
+    for key in ("a", "b", "c"):
+        await store.hit(key, rate=1, capacity=1)
+
+    # "a" was evicted, so it starts again with a full bucket
+    assert (await store.hit("a", rate=1, capacity=1)).allowed
+    assert not (await store.hit("c", rate=1, capacity=1)).allowed
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize(
+    "store", [MemoryRateLimitStore(), DatabaseRateLimitStore(database)]
+)
+async def test_store_clear(store):
+    await store.hit("key", rate=1, capacity=1)
+
+    await store.clear()
+
+    assert (await store.hit("key", rate=1, capacity=1)).allowed
+
+
+@pytest.mark.anyio
+async def test_database_store_refuses_over_capacity():
+    store = DatabaseRateLimitStore(database)
+
+    results = [await store.hit("key", rate=1, capacity=2) for _ in range(3)]
+
+    assert [result.allowed for result in results] == [True, True, False]
+    assert [result.remaining for result in results] == [1, 0, 0]
+    assert 0 < results[2].retry_after <= 1
+    assert (await store.hit("other", rate=1, capacity=2)).allowed
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize(
+    "store", [MemoryRateLimitStore(), DatabaseRateLimitStore(database)]
+)
+async def test_store_charges_tokens(store):
+    first = await store.hit("key", rate=1, capacity=3, tokens=2)
+    second = await store.hit("key", rate=1, capacity=3, tokens=2)
+
+    assert (first.allowed, first.remaining) == (True, 1)
+    assert not second.allowed
+    assert 0 < second.retry_after <= 1
+    assert (await store.hit("key", rate=1, capacity=3)).allowed
+
+
+@pytest.mark.anyio
+async def test_token_rate_limited(async_client: AsyncClient, confirmed_user, mocker):
+    mocker.patch.object(user_router.token_rate_limit, "per_minute", 2)
+
+    responses = [
+        await async_client.post("/token", json=confirmed_user) for _ in range(3)
+    ]
+
+    assert [response.status_code for response in responses] == [200, 200, 429]
+    assert responses[0].headers["RateLimit-Limit"] == "2"
+    assert responses[0].headers["RateLimit-Remaining"] == "1"
+    assert responses[2].headers["RateLimit-Remaining"] == "0"
+    assert int(responses[2].headers["Retry-After"]) > 0
+
+
+@pytest.mark.anyio
+async def test_post_rate_limited_per_user(
+    async_client: AsyncClient, logged_in_token: str, mocker
+):
+    mocker.patch.object(post_router.post_rate_limit, "per_minute", 1)
+    await create_post("first", async_client, logged_in_token)
+
+    response = await async_client.post(
+        "/post",
+        json={"body": "second"},
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+
+    assert response.status_code == 429
+
+
+@pytest.mark.anyio
+async def test_rate_limit_disabled(async_client: AsyncClient, confirmed_user, mocker):
+    mocker.patch.object(user_router.token_rate_limit, "per_minute", 1)
+    mocker.patch("trail.ratelimit.config.RATE_LIMIT_ENABLED", False)
+
+    for _ in range(2):
+        response = await async_client.post("/token", json=confirmed_user)
+        assert response.status_code == 200
+
+
+@pytest.mark.anyio
+async def test_batch_charged_per_item(
+    async_client: AsyncClient, logged_in_token: str, mocker
+):
+    mocker.patch.object(post_router.post_rate_limit, "per_minute", 3)
+    headers = {"Authorization": f"Bearer {logged_in_token}"}
+
+    response = await async_client.post(
+        "/post/batch", json=[{"body": "1"}, {"body": "2"}], headers=headers
+    )
+    assert response.status_code == 200
+    assert response.headers["RateLimit-Remaining"] == "1"
+
+    response = await async_client.post(
+        "/post/batch", json=[{"body": "3"}, {"body": "4"}], headers=headers
+    )
+    assert response.status_code == 429
+
+    response = await async_client.post(
+        "/post/batch", json=[{"body": str(i)} for i in range(4)], headers=headers
+    )
+    assert response.status_code == 413
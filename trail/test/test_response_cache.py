@@ -0,0 +1,60 @@
+import pytest
+from httpx import AsyncClient
+
+from trail.test.helpers import create_comment, create_like
+
+
+@pytest.mark.anyio
+async def test_etag_not_modified(async_client: AsyncClient, created_post: dict, mocker):
+    response = await async_client.get("/post")
+    etag = response.headers["etag"]
+    fetch_all = mocker.patch("trail.routers.post.database.fetch_all")
+
+    response = await async_client.get("/post", headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+    fetch_all.assert_not_called()
+
+
+@pytest.mark.anyio
+async def test_cached_body_served(async_client: AsyncClient, created_post: dict):
+    first = await async_client.get(f"/post/{created_post['id']}")
+    second = await async_client.get(f"/post/{created_post['id']}")
+
+    assert second.status_code == 200
+    assert second.content == first.content
+    assert second.headers["etag"] == first.headers["etag"]
+    assert second.headers["content-type"] == "application/json"
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("path", ["/post", "/post/1", "/post/1/comments"])
+async def test_cache_invalidated_by_writes(
+    async_client: AsyncClient, created_post: dict, logged_in_token: str, path: str
+):
+    response = await async_client.get(path)
+    etag = response.headers["etag"]
+
+    await create_comment(
+        "new comment", created_post["id"], async_client, logged_in_token
+    )
+    response = await async_client.get(path, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    etag = response.headers["etag"]
+
+    await create_like(created_post["id"], async_client, logged_in_token)
+    response = await async_client.get(path, headers={"If-None-Match": etag})
+    # a like leaves the comment page unchanged, so its etag still matches
+    expected = 304 if path.endswith("/comments") else 200
+    assert response.status_code == expected
+
+
+@pytest.mark.anyio
+async def test_errors_not_cached(async_client: AsyncClient):
+    response = await async_client.get("/post/404")
+
+    assert response.status_code == 404
+    assert "etag" not in response.headers
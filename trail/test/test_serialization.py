@@ -0,0 +1,47 @@
+import pytest
+from httpx import AsyncClient
+
+from trail.main import app
+from trail.response_cache import response_cache
+from trail.test.helpers import create_comment, create_like
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize(
+    "path",
+    [
+        "/post",
+        "/post?sorting=most_likes&limit=1",
+        "/post/{post_id}",
+        "/post/{post_id}/comments",
+        "/feed",
+    ],
+)
+async def test_trusted_rows_match_validated(
+    async_client: AsyncClient,
+    created_post: dict,
+    logged_in_token: str,
+    path: str,
+    mocker,
+):
+    await create_comment("comment", created_post["id"], async_client, logged_in_token)
+    await create_like(created_post["id"], async_client, logged_in_token)
+    url = path.format(post_id=created_post["id"])
+    headers = {"Authorization": f"Bearer {logged_in_token}"}
+
+    trusted = await async_client.get(url, headers=headers)
+    response_cache.invalidate()
+    mocker.patch("trail.serialization.config.TRUSTED_ROW_SERIALIZATION", False)
+    validated = await async_client.get(url, headers=headers)
+
+    assert trusted.status_code == validated.status_code == 200
+    assert trusted.headers["content-type"] == "application/json"
+    assert trusted.json() == validated.json()
+
+
+@pytest.mark.anyio
+async def test_openapi_keeps_response_models():
+    paths = app.openapi()["paths"]
+
+    schema = paths["/post"]["get"]["responses"]["200"]["content"]["application/json"]
+    assert schema["schema"]["$ref"].endswith("/PostPage")
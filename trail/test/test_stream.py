@@ -0,0 +1,92 @@
+import asyncio
+import json
+
+import pytest
+from httpx import AsyncClient
+
+from trail.broadcast import Broadcaster, broadcaster
+from trail.routers.stream import event_stream
+from trail.test.helpers import create_comment
+
+
+@pytest.mark.anyio
+async def test_publish_to_channel():
+    hub = Broadcaster(buffer_size=4, max_subscribers=10)
+    posts = hub.subscribe("posts")
+    other = hub.subscribe("post:2")
+
+    hub.publish("posts", "post_created", {"id": 1})
+
+    assert posts.queue.get_nowait() == (1, "post_created", {"id": 1})
+    assert other.queue.empty()
+
+
+@pytest.mark.anyio
+async def test_slow_subscriber_evicted():
+    hub = Broadcaster(buffer_size=2, max_subscribers=10)
+    slow = hub.subscribe("posts")
+    fast = hub.subscribe("posts")
+
+    for n in range(3):
+        hub.publish("posts", "post_created", {"id": n})
+        fast.queue.get_nowait()
+
+    assert slow.evicted
+    assert slow.queue.get_nowait() is None
+    assert not fast.evicted
+    assert hub.subscriber_count == 1
+
+
+@pytest.mark.anyio
+async def test_max_subscribers():
+    hub = Broadcaster(buffer_size=2, max_subscribers=1)
+    subscriber = hub.subscribe("posts")
+
+    assert hub.subscribe("posts") is None
+
+    hub.unsubscribe(subscriber)
+    assert hub.subscribe("posts") is not None
+
+
+@pytest.mark.anyio
+async def test_event_stream():
+    hub = Broadcaster(buffer_size=4, max_subscribers=10)
+    stream = event_stream("post:1", hub, heartbeat=0.01)
+
+    assert await stream.__anext__() == ": connected\n\n"
+    assert await stream.__anext__() == ": keep-alive\n\n"
+
+    hub.publish("post:1", "post_liked", {"post_id": 1})
+    assert await stream.__anext__() == (
+        'id: 1\nevent: post_liked\ndata: {"post_id": 1}\n\n'
+    )
+
+    await stream.aclose()
+    assert hub.subscriber_count == 0
+
+
+@pytest.mark.anyio
+async def test_comment_published(
+    async_client: AsyncClient, created_post: dict, logged_in_token: str
+):
+    subscriber = broadcaster.subscribe(f"post:{created_post['id']}")
+    try:
+        comment = await create_comment(
+            "live comment", created_post["id"], async_client, logged_in_token
+        )
+        _, event, data = await asyncio.wait_for(subscriber.queue.get(), 1)
+    finally:
+        broadcaster.unsubscribe(subscriber)
+
+    assert event == "comment_created"
+    assert data == comment
+    assert json.dumps(data)
+
+
+@pytest.mark.anyio
+async def test_stream_full(async_client: AsyncClient, mocker):
+    mocker.patch.object(broadcaster, "max_subscribers", 0)
+
+    response = await async_client.get("/stream/posts")
+
+    assert response.status_code == 503
@@ -0,0 +1,50 @@
+import json
+
+import pytest
+
+from trail.streaming import StreamFormat, encode_rows
+
+
+async def rows(count: int):
+    for i in range(count):
+        yield {"id": i, "body": f"row {i}", "hidden": "not sent"}
+
+
+@pytest.mark.anyio
+async def test_json_array_in_chunks():
+    chunks = [
+        chunk
+        async for chunk in encode_rows(
+            rows(100), ["id", "body"], StreamFormat.json, chunk_size=256
+        )
+    ]
+
+    assert len(chunks) > 1
+    assert all(len(chunk) < 256 + 64 for chunk in chunks)
+    assert json.loads(b"".join(chunks)) == [
+        {"id": i, "body": f"row {i}"} for i in range(100)
+    ]
+
+
+@pytest.mark.anyio
+async def test_ndjson():
+    body = b"".join(
+        [chunk async for chunk in encode_rows(rows(2), ["id"], StreamFormat.ndjson)]
+    )
+
+    assert body == b'{"id":0}\n{"id":1}\n'
+
+
+@pytest.mark.anyio
+async def test_empty():
+    async def no_rows():
+        return
+        yield
+
+    json_chunks = [c async for c in encode_rows(no_rows(), ["id"], StreamFormat.json)]
+    ndjson_chunks = [
+        c async for c in encode_rows(no_rows(), ["id"], StreamFormat.ndjson)
+    ]
+
+    assert json_chunks == [b"[]"]
+    assert ndjson_chunks == []
@@ -3,28 +3,33 @@ import pytest
 from databases import Database
 
 from trail.database import post_table
-from trail.tasks import APIResponseError, _generate_cute_image, generate_and_add_to_post
+from trail.tasks import (
+    APIResponseError,
+    _generate_cute_image,
+    generate_and_add_to_post,
+    send_email_to_user,
+)
 
 
 @pytest.mark.anyio
-async def test_update_url(mock_httpx_client):
+async def test_update_url(stub_transport, http_client: httpx.AsyncClient):
     json_data = "https://www.example.com/image.jpg"
-    mock_httpx_client.post.return_value = httpx.Response(
-        status_code=200, json=json_data, request=httpx.Request("POST", "//")
-    )
+    stub_transport.response = httpx.Response(status_code=200, json=json_data)
 
-    result = await _generate_cute_image("a cat")
+    result = await _generate_cute_image("a cat", http_client)
     assert result == json_data
 
 
 @pytest.mark.anyio
-async def test_insert_link(mock_httpx_client, created_post: dict, db: Database):
+async def test_insert_link(
+    stub_transport, http_client: httpx.AsyncClient, created_post: dict, db: Database
+):
     json_data = {"output_url": "https://www.example.com/image.jpg"}
-    mock_httpx_client.post.return_value = httpx.Response(
-        status_code=200, json=json_data, request=httpx.Request("POST", "//")
-    )
+    stub_transport.response = httpx.Response(status_code=200, json=json_data)
 
-    await generate_and_add_to_post(created_post["id"], "/post/1", db, "A Cat")
+    await generate_and_add_to_post(
+        created_post["id"], "/post/1", db, "A Cat", http_client
+    )
 
     query = post_table.select().where(post_table.c.id == created_post["id"])
 
@@ -33,22 +38,40 @@ async def test_insert_link(mock_httpx_client, created_post: dict, db: Database):
 
 
 @pytest.mark.anyio
-async def test_update_url_error(mock_httpx_client):
-    mock_httpx_client.post.return_value = httpx.Response(
-        status_code=500, content="", request=httpx.Request("POST", "//")
-    )
+async def test_update_url_error(stub_transport, http_client: httpx.AsyncClient):
+    stub_transport.response = httpx.Response(status_code=500, content="")
 
     with pytest.raises(
         APIResponseError, match="api request failed with status code 500"
     ):
-        await _generate_cute_image("A Cat")
+        await _generate_cute_image("A Cat", http_client)
 
 
 @pytest.mark.anyio
-async def test_update_url_data_error(mock_httpx_client):
-    mock_httpx_client.post.return_value = httpx.Response(
-        status_code=200, content="Not Json", request=httpx.Request("POST", "//")
-    )
+async def test_update_url_data_error(stub_transport, http_client: httpx.AsyncClient):
+    stub_transport.response = httpx.Response(status_code=200, content="Not Json")
 
     with pytest.raises(APIResponseError, match="api request parsing failed "):
-        await _generate_cute_image("A Cat")
+        await _generate_cute_image("A Cat", http_client)
+
+
+@pytest.mark.anyio
+async def test_shared_client_used_by_default(stub_transport):
+    stub_transport.response = httpx.Response(status_code=200, json={})
+
+    await _generate_cute_image("A Cat")
+    await _generate_cute_image("A Cat")
+
+    assert len(stub_transport.requests) == 2
+    assert stub_transport.requests[0].url.path.endswith("/cute-creature-generator")
+
+
+@pytest.mark.anyio
+async def test_send_email_to_user_queued(mocker):
+    enqueue = mocker.patch("trail.tasks.email_outbox.enqueue")
+
+    send_email_to_user("test@email.com", "Subject", "Body", {"url": "/confirm"})
+
+    enqueue.assert_called_once_with(
+        "test@email.com", "Subject", "Body", {"url": "/confirm"}
+    )
@@ -0,0 +1,108 @@
+import asyncio
+import logging
+import signal
+from typing import Optional
+
+from databases import Database
+
+from trail.config import config
+from trail.jobs import lease_job, retry_delay, run_job
+from trail.metrics import serve_metrics
+
+logger = logging.getLogger(__name__)
+
+
+async def work(
+    database: Database,
+    stop: asyncio.Event,
+    concurrency: int = config.JOB_WORKER_CONCURRENCY,
+    poll_interval: float = config.JOB_POLL_INTERVAL_SECONDS,
+    lease_seconds: float = config.JOB_LEASE_SECONDS,
+) -> None:
+    """Lease and run jobs until ``stop`` is set, at most ``concurrency`` at once."""
+    slots = asyncio.Semaphore(concurrency)
+    running: set[asyncio.Task] = set()
+
+    def release(task: asyncio.Task) -> None:
+        running.discard(task)
+        slots.release()
+
+    async def wait(seconds: float) -> None:
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    failures = 0
+    while not stop.is_set():
+        await slots.acquire()
+        try:
+            job = await lease_job(database, lease_seconds)
+        except Exception:
+            # such as the database being down or locked, backing off like a
+            # failed job until it answers again
+            slots.release()
+            failures += 1
+            delay = retry_delay(failures)
+            logger.exception(f"Leasing a job failed, retrying in {delay}s")
+            await wait(delay)
+            continue
+        failures = 0
+        if job is None:
+            slots.release()
+            await wait(poll_interval)
+            continue
+
+        logger.info(f"Running {job.kind} job {job.id}, attempt {job.attempts}")
+        task = asyncio.create_task(run_job(database, job))
+        running.add(task)
+        task.add_done_callback(release)
+
+    # a graceful stop lets leased jobs finish instead of waiting for the lease
+    # to expire
+    if running:
+        await asyncio.gather(*running)
+
+
+async def start_metrics_server() -> Optional[asyncio.AbstractServer]:
+    """Serve the job metrics, None when turned off or the port is taken."""
+    # job timings are recorded here, not in the web processes
+    if not config.JOB_WORKER_METRICS_PORT:
+        return None
+    try:
+        return await serve_metrics(
+            config.JOB_WORKER_METRICS_HOST, config.JOB_WORKER_METRICS_PORT
+        )
+    except OSError as e:
+        # such as a second worker on the same host, jobs still run
+        logger.error(f"Not serving job metrics: {e}")
+        return None
+
+
+async def main() -> None:
+    from trail.database import database
+    from trail.http_client import close_http_client
+    from trail.logging_config import Config_logger, stop_logging
+
+    Config_logger()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    await database.connect()
+    metrics_server = await start_metrics_server()
+    logger.info("Job worker started")
+    try:
+        await work(database, stop)
+    finally:
+        if metrics_server is not None:
+            metrics_server.close()
+        await close_http_client()
+        await database.disconnect()
+        logger.info("Job worker stopped")
+        stop_logging()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())